@@ -16,31 +16,120 @@
 
 """
 A simple internal pub/sub event bus with topics and filter-based registration.
+
+Publishing does not match every regexp topic subscription against the topic:
+regexp subscriptions are indexed by the literal prefix of their pattern in a
+trie, so only those with a prefix of the topic are tried, and the resulting
+subscribers of each topic are remembered until the subscriptions change.
+
+Messages are delivered to a subscriber synchronously by publish, unless it
+subscribed with a bounded queue: then they are queued, and delivered from
+the reactor.
 """
 import re
+import sre_parse
+from collections import deque
+from itertools import count
 
 import structlog
+from enum import Enum
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList
 
 
 log = structlog.get_logger()
 
 
+class OverflowPolicy(Enum):
+    """
+    What to do with a message published to a subscriber whose queue is full
+    """
+
+    # drop the oldest message of the queue to make room for it
+    DROP_OLDEST = 1
+
+    # drop the message
+    DROP_NEWEST = 2
+
+    # queue it once there is room, publish returns a Deferred firing then
+    BLOCK = 3
+
+
+class _Delivery(object):
+    """State of the asynchronous delivery of messages to a subscriber"""
+
+    __slots__ = ('queue', 'max_queue', 'overflow', 'blocked', 'scheduled',
+                 'delivered', 'dropped')
+    def __init__(self, max_queue, overflow):
+        self.queue = deque()  # (topic, msg) tuples
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.blocked = deque()  # (topic, msg, deferred) waiting for room
+        self.scheduled = None  # reactor call to drain the queue, if any
+        self.delivered = 0
+        self.dropped = 0
+
+
 class _Subscription(object):
 
-    __slots__ = ('bus', 'predicate', 'callback', 'topic')
-    def __init__(self, bus, predicate, callback, topic=None):
+    __slots__ = ('bus', 'predicate', 'callback', 'topic', 'seq', 'delivery')
+    def __init__(self, bus, predicate, callback, topic=None, seq=0,
+                 delivery=None):
         self.bus = bus
         self.predicate = predicate
         self.callback = callback
         self.topic = topic
+        self.seq = seq  # subscription order, kept when dispatching
+        self.delivery = delivery  # None if delivered synchronously
+
+
+class _PrefixTrieNode(object):
+
+    __slots__ = ('children', 'subscriptions')
+    def __init__(self):
+        self.children = {}  # next character -> _PrefixTrieNode
+        self.subscriptions = []  # regexp subscriptions with this prefix
+
+
+def _literal_prefix(regex):
+    """
+    Return the literal string every topic matched by the compiled regexp
+    has to start with (may be empty)
+    """
+    pattern = getattr(regex, 'pattern', None)
+    if not isinstance(pattern, str) or regex.flags & re.IGNORECASE:
+        return ''
+    try:
+        items = sre_parse.parse(pattern, regex.flags)
+    except Exception:
+        return ''
+    prefix = []
+    for op, value in items:
+        if op == sre_parse.LITERAL:
+            prefix.append(chr(value))
+        elif op == sre_parse.AT and value == sre_parse.AT_BEGINNING \
+                and not prefix:
+            continue
+        else:
+            break
+    return ''.join(prefix)
 
 
 class EventBus(object):
 
+    # bound on the number of topics whose subscribers are remembered
+    MAX_RESOLVED_TOPICS = 65536
+
+    # messages delivered to a subscriber per reactor turn
+    DRAIN_BATCH = 64
+
     def __init__(self):
         self.subscriptions = {}  # topic -> list of _Subscription objects
                                  # topic None holds regexp based topic subs.
         self.subs_topic_map = {} # to aid fast lookup when unsubscribing
+        self.regex_trie = _PrefixTrieNode()  # regexp subs by literal prefix
+        self.resolved = {}  # topic -> tuple of subscribers, see _resolve
+        self._seq = count()
 
     def list_subscribers(self, topic=None):
         if topic is None:
@@ -60,18 +149,33 @@ class EventBus(object):
         else:
             raise AttributeError('topic not a string nor a compiled regex')
 
-    def subscribe(self, topic, callback, predicate=None):
+    def subscribe(self, topic, callback, predicate=None, max_queue=None,
+                  overflow=OverflowPolicy.DROP_OLDEST):
         """
         Subscribe to given topic with predicate and register the callback
         :param topic: String topic (explicit) or regexp based topic filter.
         :param callback: Callback method with signature def func(topic, msg)
         :param predicate: Optional method/function signature def predicate(msg)
+        :param max_queue: If provided, messages are queued (up to this many)
+        and the callback is called from the reactor, not by publish
+        :param overflow: OverflowPolicy when the queue is full
         :return: Subscription object which can be used to unsubscribe
         """
-        subscription = _Subscription(self, predicate, callback, topic)
+        delivery = None
+        if max_queue is not None:
+            assert max_queue > 0
+            delivery = _Delivery(max_queue, overflow)
+        subscription = _Subscription(self, predicate, callback, topic,
+                                     next(self._seq), delivery)
         topic_key = self._get_topic_key(topic)
         self.subscriptions.setdefault(topic_key, []).append(subscription)
         self.subs_topic_map[subscription] = topic_key
+        if topic_key is None:
+            node = self.regex_trie
+            for c in _literal_prefix(topic):
+                node = node.children.setdefault(c, _PrefixTrieNode())
+            node.subscriptions.append(subscription)
+        self.resolved.clear()
         return subscription
 
     def unsubscribe(self, subscription):
@@ -80,8 +184,54 @@ class EventBus(object):
         :param subscription: subscription object as was returned by subscribe
         :return: None
         """
-        topic_key = self.subs_topic_map[subscription]
+        topic_key = self.subs_topic_map.pop(subscription)
         self.subscriptions[topic_key].remove(subscription)
+        delivery = subscription.delivery
+        if delivery is not None:
+            # queued messages are dropped, and blocked publishers released
+            subscription.delivery = None
+            if delivery.scheduled is not None:
+                delivery.scheduled.cancel()
+            for _, _, d in delivery.blocked:
+                d.callback(None)
+        if topic_key is None:
+            path = [(None, self.regex_trie)]
+            for c in _literal_prefix(subscription.topic):
+                path.append((c, path[-1][1].children[c]))
+            path[-1][1].subscriptions.remove(subscription)
+            # prune the branch left empty
+            for i in xrange(len(path) - 1, 0, -1):
+                c, node = path[i]
+                if node.subscriptions or node.children:
+                    break
+                del path[i - 1][1].children[c]
+        self.resolved.clear()
+
+    def _resolve(self, topic):
+        """
+        Return the subscribers of given topic: the ones with the explicit
+        topic, followed by the matching regexp topic subscribers, each in
+        subscription order
+        """
+        subscribers = list(self.subscriptions.get(topic, ()))
+
+        # only regexps whose literal prefix is a prefix of the topic can match
+        candidates = []
+        node = self.regex_trie
+        candidates.extend(node.subscriptions)
+        for c in topic:
+            node = node.children.get(c)
+            if node is None:
+                break
+            candidates.extend(node.subscriptions)
+        candidates.sort(key=lambda s: s.seq)
+        subscribers.extend(s for s in candidates if s.topic.match(topic))
+
+        subscribers = tuple(subscribers)
+        if len(self.resolved) >= self.MAX_RESOLVED_TOPICS:
+            self.resolved.clear()
+        self.resolved[topic] = subscribers
+        return subscribers
 
     def publish(self, topic, msg):
         """
@@ -89,7 +239,8 @@ class EventBus(object):
         the predicate functions into account.
         :param topic: String topic
         :param msg: Arbitrary python data as message
-        :return: None
+        :return: None, or a Deferred if the message could not be queued yet
+        for some subscriber (see OverflowPolicy.BLOCK), firing once it is
         """
 
         def passes(msg, predicate):
@@ -98,21 +249,104 @@ class EventBus(object):
             except Exception, e:
                 return False  # failed predicate function treated as no match
 
-        # lookup subscribers with explicit topic subscriptions
-        subscribers = self.subscriptions.get(topic, [])
-
-        # add matching regexp topic subscribers
-        subscribers.extend(s for s in self.subscriptions.get(None, [])
-                           if s.topic.match(topic))
+        # lookup subscribers with explicit topic subscriptions and matching
+        # regexp topic subscribers
+        subscribers = self.resolved.get(topic)
+        if subscribers is None:
+            subscribers = self._resolve(topic)
 
+        blocked = None
         for candidate in subscribers:
+            if candidate not in self.subs_topic_map:
+                continue  # unsubscribed by the callback of another one
             predicate = candidate.predicate
             if predicate is None or passes(msg, predicate):
+                if candidate.delivery is not None:
+                    d = self._enqueue(candidate, topic, msg)
+                    if d is not None:
+                        blocked = blocked or []
+                        blocked.append(d)
+                    continue
                 try:
                     candidate.callback(topic, msg)
                 except Exception, e:
                     log.warning('callback-failed', e=e, topic=topic)
 
+        if blocked:
+            return DeferredList(blocked)
+
+    def _enqueue(self, subscription, topic, msg):
+        """
+        Queue message for asynchronous delivery to the subscriber; return a
+        Deferred if it has to wait for room in the queue
+        """
+        delivery = subscription.delivery
+        queue = delivery.queue
+        d = None
+        if len(queue) < delivery.max_queue and not delivery.blocked:
+            queue.append((topic, msg))
+        elif delivery.overflow == OverflowPolicy.DROP_OLDEST:
+            queue.popleft()
+            queue.append((topic, msg))
+            delivery.dropped += 1
+        elif delivery.overflow == OverflowPolicy.DROP_NEWEST:
+            delivery.dropped += 1
+        else:
+            d = Deferred()
+            delivery.blocked.append((topic, msg, d))
+
+        if delivery.scheduled is None:
+            delivery.scheduled = reactor.callLater(
+                0, self._drain, subscription)
+        return d
+
+    def _drain(self, subscription):
+        """Deliver (a batch of) the queued messages of a subscriber"""
+        delivery = subscription.delivery
+        delivery.scheduled = None
+        queue = delivery.queue
+        for _ in xrange(min(len(queue), self.DRAIN_BATCH)):
+            topic, msg = queue.popleft()
+            delivery.delivered += 1
+            try:
+                subscription.callback(topic, msg)
+            except Exception, e:
+                log.warning('callback-failed', e=e, topic=topic)
+            if subscription.delivery is not delivery:
+                return  # unsubscribed by the callback
+
+        # let blocked publishers in
+        blocked = delivery.blocked
+        while blocked and len(queue) < delivery.max_queue:
+            topic, msg, d = blocked.popleft()
+            queue.append((topic, msg))
+            d.callback(None)
+
+        if queue and delivery.scheduled is None:
+            delivery.scheduled = reactor.callLater(
+                0, self._drain, subscription)
+
+    def queue_metrics(self):
+        """
+        Return the state of the queues of the subscribers with asynchronous
+        delivery, by subscribed topic (string, or regexp pattern)
+        :return: dict of topic -> dict with the number of queued (depth) and
+        blocked messages, and the number of messages delivered and dropped
+        """
+        metrics = {}
+        for subscription in self.subs_topic_map:
+            delivery = subscription.delivery
+            if delivery is None:
+                continue
+            topic = getattr(subscription.topic, 'pattern', subscription.topic)
+            m = metrics.setdefault(
+                topic, dict(depth=0, blocked=0, delivered=0, dropped=0))
+            m['depth'] += len(delivery.queue)
+            m['blocked'] += len(delivery.blocked)
+            m['delivered'] += delivery.delivered
+            m['dropped'] += delivery.dropped
+        return metrics
+
 
 default_bus = EventBus()
 
@@ -158,20 +392,26 @@ class EventBusClient(object):
         Publish given msg to given topic.
         :param topic: String topic
         :param msg: Arbitrary python data as message
-        :return: None
+        :return: None, or a Deferred if the publisher should wait (see
+        EventBus.publish)
         """
-        self.bus.publish(topic, msg)
+        return self.bus.publish(topic, msg)
 
-    def subscribe(self, topic, callback, predicate=None):
+    def subscribe(self, topic, callback, predicate=None, max_queue=None,
+                  overflow=OverflowPolicy.DROP_OLDEST):
         """
         Subscribe to given topic with predicate and register the callback
         :param topic: String topic (explicit) or regexp based topic filter.
         :param callback: Callback method with signature def func(topic, msg)
         :param predicate: Optional method/function with signature
         def predicate(msg)
+        :param max_queue: If provided, messages are delivered asynchronously,
+        through a queue of up to this many messages
+        :param overflow: OverflowPolicy when the queue is full
         :return: Subscription object which can be used to unsubscribe
         """
-        return self.bus.subscribe(topic, callback, predicate)
+        return self.bus.subscribe(topic, callback, predicate, max_queue,
+                                  overflow)
 
     def unsubscribe(self, subscription):
         """
@@ -189,3 +429,10 @@ class EventBusClient(object):
         :return: List of subscriptions
         """
         return self.bus.list_subscribers(topic)
+
+    def queue_metrics(self):
+        """
+        Return queue depth and drop counts of the subscribers with
+        asynchronous delivery, by topic (see EventBus.queue_metrics)
+        """
+        return self.bus.queue_metrics()
@@ -20,9 +20,12 @@ and it can manage a set of vlan interfaces on top of existing
 interfaces. Due to reliance on raw sockets, this module requires
 root access. Also, raw sockets are hard to deal with in Twisted (not
 directly supported) we need to run the receiver select loop on a dedicated
-thread.
+thread. On Linux, the loop waits with epoll, and ports may be spread over
+several such threads.
 """
 
+import errno
+import logging
 import os
 import socket
 import struct
@@ -43,12 +46,21 @@ from voltha.registry import IComponent
 
 if sys.platform.startswith('linux'):
     from common.frameio.third_party.oftest import afpacket, netutils
+    from common.frameio.afpacket_batch import BatchReceiver
 elif sys.platform == 'darwin':
     from scapy.arch import pcapdnet, BIOCIMMEDIATE, dnet
 
 log = structlog.get_logger()
 
 
+def _debug_enabled():
+    """
+    Return True if debug logs of this module are emitted, to spare the cost
+    of formatting them per frame otherwise
+    """
+    return logging.getLogger(__name__).isEnabledFor(logging.DEBUG)
+
+
 def hexify(buffer):
     """
     Return a hexadecimal string encoding of input buffer
@@ -128,6 +140,10 @@ class FrameIOPort(object):
     def rcv_frame(self):
         raise NotImplementedError('to be implemented by derived class')
 
+    def rcv_frames(self):
+        """Return the frames waiting to be received, at least one"""
+        return [self.rcv_frame()]
+
     def __del__(self):
         if self.socket:
             self.socket.close()
@@ -137,19 +153,27 @@ class FrameIOPort(object):
     def fileno(self):
         return self.socket.fileno()
 
-    def _dispatch(self, frame):
-        log.debug('calling-publisher', frame=hexify(frame))
-        try:
-            self.callback(self, frame)
-        except Exception, e:
-            log.exception('callback-error',
-                          explanation='Callback failed while processing frame',
-                          e=e)
+    def _dispatch(self, frames):
+        debug = _debug_enabled()
+        for frame in frames:
+            if debug:
+                log.debug('calling-publisher', frame=hexify(frame))
+            try:
+                self.callback(self, frame)
+            except Exception, e:
+                log.exception(
+                    'callback-error',
+                    explanation='Callback failed while processing frame',
+                    e=e)
 
     def recv(self):
-        """Called on the select thread when a packet arrives"""
+        """
+        Called on the select thread when packets arrive; passes the ones
+        received (as many as available, see rcv_frames) to the reactor
+        in one go
+        """
         try:
-            frame = self.rcv_frame()
+            frames = self.rcv_frames()
         except RuntimeError, e:
             # we observed this happens sometimes right after the socket was
             # attached to a newly created veth interface. So we log it, but
@@ -157,15 +181,24 @@ class FrameIOPort(object):
             log.warn('afpacket-recv-error', code=-1)
             return
 
-        log.debug('frame-received', iface=self.iface_name, len=len(frame),
-                  hex=hexify(frame))
-        self.received +=1
-        if self.filter is None or self.filter(frame):
-            log.debug('frame-dispatched')
-            reactor.callFromThread(self._dispatch, frame)
-        else:
-            self.discarded += 1
-            log.debug('frame-discarded')
+        debug = _debug_enabled()
+        passed = []
+        for frame in frames:
+            if debug:
+                log.debug('frame-received', iface=self.iface_name,
+                          len=len(frame), hex=hexify(frame))
+            self.received += 1
+            if self.filter is None or self.filter(frame):
+                passed.append(frame)
+            else:
+                self.discarded += 1
+                if debug:
+                    log.debug('frame-discarded')
+
+        if passed:
+            if debug:
+                log.debug('frames-dispatched', count=len(passed))
+            reactor.callFromThread(self._dispatch, passed)
 
     def send(self, frame):
         log.debug('sending', len=len(frame), iface=self.iface_name)
@@ -198,17 +231,25 @@ class FrameIOPort(object):
 
 class LinuxFrameIOPort(FrameIOPort):
 
+    # max frames received per select wakeup (with a single recvmmsg call)
+    RCV_BATCH_SIZE = 64
+
     def open_socket(self, iface_name):
         s = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
         afpacket.enable_auxdata(s)
         s.bind((self.iface_name, self.ETH_P_ALL))
         netutils.set_promisc(s, iface_name)
         s.settimeout(self.RCV_TIMEOUT)
+        self.batch_receiver = BatchReceiver(
+            s, self.RCV_SIZE_DEFAULT, self.RCV_BATCH_SIZE)
         return s
 
     def rcv_frame(self):
         return afpacket.recv(self.socket, self.RCV_SIZE_DEFAULT)
 
+    def rcv_frames(self):
+        return self.batch_receiver.recv()
+
 
 class DarwinFrameIOPort(FrameIOPort):
 
@@ -243,42 +284,152 @@ else:
     sys.exit(1)
 
 
+class _FrameIOReceiver(object):
+    """
+    The receive loop over a subset of the ports, to be run on its own
+    thread. Ports are added to and removed from the epoll set of the loop
+    as it runs; where there is no epoll (darwin), the loop selects over the
+    list of ports, which is rebuilt whenever it changes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.ports = {}  # fileno -> FrameIOPort
+        self.cvar = Condition()
+        self.waker = _SelectWakerDescriptor()
+        self.stopped = False
+        self.ports_changed = False
+        self.epoll = None
+        if hasattr(select, 'epoll'):
+            self.epoll = select.epoll()
+            self.epoll.register(self.waker.fileno(), select.EPOLLIN)
+
+    def add_port(self, port):
+        self.ports[port.fileno()] = port
+        if self.epoll is not None:
+            self.epoll.register(port.fileno(), select.EPOLLIN)
+        else:
+            # need to exit select loop to reconstruct select fd lists
+            self.ports_changed = True
+            self.waker.notify()
+
+    def remove_port(self, port):
+        del self.ports[port.fileno()]
+        if self.epoll is not None:
+            self.epoll.unregister(port.fileno())
+        else:
+            self.ports_changed = True
+            self.waker.notify()
+
+    def stop(self):
+        self.stopped = True
+        self.waker.notify()
+
+    def run(self):
+        """
+        Called on the alien thread, this is the core multi-port receive loop
+        """
+        log.debug('select-loop-started', receiver=self.name)
+        if self.epoll is not None:
+            self._run_epoll()
+        else:
+            self._run_select()
+        log.debug('select-loop-exited', receiver=self.name)
+
+    def _run_epoll(self):
+        waker_fd = self.waker.fileno()
+        while not self.stopped:
+            try:
+                events = self.epoll.poll(1)
+            except IOError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                log.exception('frame-io-epoll-error', e=e)
+                break
+            with self.cvar:
+                for fd, _ in events:
+                    if fd == waker_fd:
+                        self.waker.wait()
+                        continue
+                    port = self.ports.get(fd)
+                    if port is not None:  # unless just removed
+                        port.recv()
+                self.cvar.notify_all()
+        self.epoll.close()
+
+    def _run_select(self):
+        # outer loop constructs sockets list for select
+        while not self.stopped:
+            sockets = [self.waker] + self.ports.values()
+            self.ports_changed = False
+            empty = []
+            # inner select loop
+
+            while not self.stopped:
+                try:
+                    _in, _out, _err = select.select(sockets, empty, empty, 1)
+                except Exception, e:
+                    log.exception('frame-io-select-error', e=e)
+                    break
+                with self.cvar:
+                    for port in _in:
+                        if port is self.waker:
+                            self.waker.wait()
+                            continue
+                        else:
+                            port.recv()
+                    self.cvar.notify_all()
+                if self.ports_changed:
+                    break  # break inner loop so we reconstruct sockets list
+
+
 @implementer(IComponent)
 class FrameIOManager(Thread):
     """
     Packet/Frame IO manager that can be used to send/receive raw frames
     on a set of network interfaces.
     """
-    def __init__(self):
+    def __init__(self, config=None):
         super(FrameIOManager, self).__init__()
+        config = config or {}
 
         self.ports = {}  # iface_name -> ActiveFrameReceiver
         self.queue = {}  # iface_name -> TODO
 
-        self.cvar = Condition()
-        self.waker = _SelectWakerDescriptor()
+        # ports are spread over the receivers, each on its own thread (the
+        # first one on this one); a port stays with its receiver
+        n_receivers = max(1, int(config.get('receiver_threads', 1)))
+        self.receivers = [_FrameIOReceiver(i) for i in xrange(n_receivers)]
+        self.receiver_threads = [
+            Thread(target=receiver.run, name='frameio-{}'.format(i))
+            for i, receiver in enumerate(self.receivers) if i > 0]
+        self.port_receivers = {}  # iface_name -> _FrameIOReceiver
         self.stopped = False
-        self.ports_changed = False
 
     # ~~~~~~~~~~~ exposed methods callable from main thread ~~~~~~~~~~~~~~~~~~~
 
     def start(self):
         """
-        Start the IO manager and its select loop thread
+        Start the IO manager and its receive loop threads
         """
         log.debug('starting')
         super(FrameIOManager, self).start()
-        log.info('started')
+        for thread in self.receiver_threads:
+            thread.start()
+        log.info('started', receivers=len(self.receivers))
         return self
 
     def stop(self):
         """
-        Stop the IO manager and its thread with the select loop
+        Stop the IO manager and its threads with the receive loops
         """
         log.debug('stopping')
         self.stopped = True
-        self.waker.notify()
+        for receiver in self.receivers:
+            receiver.stop()
         self.join()
+        for thread in self.receiver_threads:
+            thread.join()
         del self.ports
         log.info('stopped')
 
@@ -307,9 +458,9 @@ class FrameIOManager(Thread):
         assert iface_name not in self.ports
         port = _FrameIOPort(iface_name, callback, filter)
         self.ports[iface_name] = port
-        # need to exit select loop to reconstruct select fd lists
-        self.ports_changed = True
-        self.waker.notify()
+        receiver = min(self.receivers, key=lambda r: len(r.ports))
+        receiver.add_port(port)
+        self.port_receivers[iface_name] = receiver
         return port
 
     def del_interface(self, iface_name):
@@ -321,9 +472,7 @@ class FrameIOManager(Thread):
         assert iface_name in self.ports
         port = self.ports[iface_name]
         del self.ports[iface_name]
-        # need to exit select loop to reconstruct select fd lists
-        self.ports_changed = True
-        self.waker.notify()
+        self.port_receivers.pop(iface_name).remove_port(port)
 
     def send(self, iface_name, frame):
         """
@@ -338,33 +487,7 @@ class FrameIOManager(Thread):
 
     def run(self):
         """
-        Called on the alien thread, this is the core multi-port receive loop
+        Called on the alien thread, runs the receive loop of the first
+        receiver (the others run on their own threads)
         """
-
-        log.debug('select-loop-started')
-
-        # outer loop constructs sockets list for select
-        while not self.stopped:
-            sockets = [self.waker] + self.ports.values()
-            self.ports_changed = False
-            empty = []
-            # inner select loop
-
-            while not self.stopped:
-                try:
-                    _in, _out, _err = select.select(sockets, empty, empty, 1)
-                except Exception, e:
-                    log.exception('frame-io-select-error', e=e)
-                    break
-                with self.cvar:
-                    for port in _in:
-                        if port is self.waker:
-                            self.waker.wait()
-                            continue
-                        else:
-                            port.recv()
-                    self.cvar.notify_all()
-                if self.ports_changed:
-                    break  # break inner loop so we reconstruct sockets list
-
-        log.debug('select-loop-exited')
+        self.receivers[0].run()
@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+from collections import OrderedDict, deque
+from itertools import count
+
 from twisted.internet.defer import Deferred
 from twisted.internet.defer import succeed
 
@@ -87,3 +90,208 @@ class MessageQueue(object):
         return d
 
 
+class _SeqIndex(object):
+    """
+    Sequence numbers of queued entries by key, oldest first. Entries may be
+    removed in any order (see discard); those which are no longer live are
+    only dropped once at the head, or when they make up most of the bucket.
+    """
+
+    __slots__ = ('buckets',)  # key -> [deque of seqs, number of live seqs]
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, key, seq):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [deque(), 0]
+        bucket[0].append(seq)
+        bucket[1] += 1
+
+    def head(self, key):
+        """Return the oldest live seq of given key, None if there is none"""
+        bucket = self.buckets.get(key)
+        return None if bucket is None else bucket[0][0]
+
+    def discard(self, key, seq, live):
+        """
+        Account for the removal of the entry of given key and seq, which
+        is already removed from live (the container of live seqs)
+        """
+        bucket = self.buckets[key]
+        bucket[1] -= 1
+        if not bucket[1]:
+            del self.buckets[key]
+            return
+        seqs = bucket[0]
+        while seqs[0] not in live:
+            seqs.popleft()
+        if len(seqs) > 2 * bucket[1] + 16:
+            bucket[0] = deque(s for s in seqs if s in live)
+
+
+class IndexedMessageQueue(object):
+    """
+    A MessageQueue for messages with an xid (such as OpenFlow messages),
+    which indexes both its backlog and its waiters by xid and by message
+    class. Receiving by xid, by class or the next message (see get_xid,
+    get_class and get), as well as putting a message, take constant time
+    whatever the backlog, or time linear in the number of distinct message
+    classes. Only gets with an arbitrary predicate scan the backlog, and
+    only waiters with one are tried in turn on put. As with MessageQueue,
+    a message goes to the waiter which has waited the longest among the
+    ones it satisfies, and a get returns the oldest message satisfying it.
+
+    With maxsize, the producer (e.g., the transport of the connection
+    putting the received messages) is paused when the backlog reaches
+    maxsize, and resumed when it drains to half of that, or when a get has
+    to wait (as the message it waits for may not have been read yet). It is
+    not paused again while a get waits, so the backlog can then exceed
+    maxsize.
+    """
+
+    def __init__(self, maxsize=None, producer=None):
+        self.maxsize = maxsize
+        self.producer = producer  # with pauseProducing/resumeProducing
+        self.paused = False
+        self._seq = count()
+
+        # backlog, in arrival order
+        self.queue = OrderedDict()  # seq -> message
+        self._queued_by_xid = _SeqIndex()
+        self._queued_by_class = _SeqIndex()
+
+        # waiters, in order of waiting
+        self.waiting = OrderedDict()  # seq -> (d, index, key)
+        self._any_waiters = _SeqIndex()  # all under key None
+        self._xid_waiters = _SeqIndex()
+        self._class_waiters = _SeqIndex()
+        self._predicate_waiters = OrderedDict()  # seq -> predicate
+
+    def __len__(self):
+        return len(self.queue)
+
+    def set_producer(self, producer):
+        self.producer = producer
+        self.paused = False
+
+    def reset(self):
+        """
+        Purge all content as well as waiters (by errback-ing their entries).
+        :return: None
+        """
+        if self.paused:
+            self._resume()
+        waiting = self.waiting
+        self.__init__(self.maxsize, self.producer)
+        for d, _, _ in waiting.itervalues():
+            d.errback(Exception('mesage queue reset() was called'))
+
+    def put(self, obj):
+        """
+        Add an object to this queue
+        :param obj: arbitrary object that will be added to the queue
+        :return:
+        """
+
+        # if someone is waiting for this, return right away
+        candidates = [self._any_waiters.head(None),
+                      self._xid_waiters.head(getattr(obj, 'xid', None))]
+        candidates.extend(
+            bucket[0][0]
+            for klass, bucket in self._class_waiters.buckets.iteritems()
+            if isinstance(obj, klass))
+        for seq, predicate in self._predicate_waiters.iteritems():
+            if predicate(obj):
+                candidates.append(seq)
+                break
+        candidates = [seq for seq in candidates if seq is not None]
+        if candidates:
+            d = self._remove_waiter(min(candidates))
+            d.callback(obj)
+            return
+
+        # otherwise...
+        seq = next(self._seq)
+        self.queue[seq] = obj
+        self._queued_by_xid.add(getattr(obj, 'xid', None), seq)
+        self._queued_by_class.add(type(obj), seq)
+        if self.maxsize is not None and len(self.queue) >= self.maxsize \
+                and not self.paused and self.producer is not None \
+                and not self.waiting:
+            self.paused = True
+            self.producer.pauseProducing()
+
+    def get(self, predicate=None):
+        """
+        Attempt to retrieve and remove an object from the queue that
+        matches the optional predicate.
+        :return: Deferred which fires with the next object available.
+        If predicate was provided, only objects for which
+        predicate(obj) is True will be considered.
+        """
+        if predicate is None:
+            if self.queue:
+                return succeed(self._remove(next(iter(self.queue))))
+            return self._wait(self._any_waiters, None)
+
+        for seq, msg in self.queue.iteritems():
+            if predicate(msg):
+                return succeed(self._remove(seq))
+        return self._wait(None, predicate)
+
+    def get_xid(self, xid):
+        """As get, for the next object with the given xid"""
+        seq = self._queued_by_xid.head(xid)
+        if seq is not None:
+            return succeed(self._remove(seq))
+        return self._wait(self._xid_waiters, xid)
+
+    def get_class(self, klass):
+        """As get, for the next object which is an instance of klass"""
+        seqs = [bucket[0][0]
+                for cls, bucket in self._queued_by_class.buckets.iteritems()
+                if issubclass(cls, klass)]
+        if seqs:
+            return succeed(self._remove(min(seqs)))
+        return self._wait(self._class_waiters, klass)
+
+    def _remove(self, seq):
+        """Remove and return a message of the backlog"""
+        msg = self.queue.pop(seq)
+        self._queued_by_xid.discard(getattr(msg, 'xid', None), seq,
+                                    self.queue)
+        self._queued_by_class.discard(type(msg), seq, self.queue)
+        if self.paused and len(self.queue) <= self.maxsize // 2:
+            self._resume()
+        return msg
+
+    def _wait(self, index, key):
+        """
+        Add a waiter to given index under given key, or with key as its
+        predicate if index is None
+        """
+        seq = next(self._seq)
+        d = Deferred(canceller=lambda _: self._remove_waiter(seq))
+        self.waiting[seq] = (d, index, key)
+        if index is None:
+            self._predicate_waiters[seq] = key
+        else:
+            index.add(key, seq)
+        if self.paused:
+            self._resume()
+        return d
+
+    def _remove_waiter(self, seq):
+        """Remove a waiter (e.g., when its deferred is canceled); return it"""
+        d, index, key = self.waiting.pop(seq)
+        if index is None:
+            del self._predicate_waiters[seq]
+        else:
+            index.discard(key, seq, self.waiting)
+        return d
+
+    def _resume(self):
+        self.paused = False
+        self.producer.resumeProducing()
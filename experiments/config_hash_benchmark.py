@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Micro-benchmark of the hash cost per config revision, comparing the
+available config hash backends on Device, LogicalDevice and Flows messages.
+
+Run from the top level voltha directory (with protos built):
+
+    python experiments/config_hash_benchmark.py [n-flows]
+"""
+
+import sys
+from timeit import default_timer as timer
+
+from voltha.core.config.config_rev import ConfigDataRevision, \
+    hash_backends, set_hash_backend
+from voltha.core.flow_decomposer import mk_flow_stat, in_port, vlan_vid, \
+    output, set_field, push_vlan
+from voltha.protos import openflow_13_pb2 as ofp
+from voltha.protos.common_pb2 import AdminState, OperStatus
+from voltha.protos.device_pb2 import Device
+from voltha.protos.logical_device_pb2 import LogicalDevice
+from voltha.protos.openflow_13_pb2 import Flows
+
+
+def mk_device():
+    return Device(
+        id='0001a82b8c9ec5e5',
+        type='ponsim_olt',
+        root=True,
+        parent_id='00016d4e7ae1b8c0',
+        vendor='cord',
+        model='n/a',
+        hardware_version='n/a',
+        firmware_version='n/a',
+        software_version='1.0',
+        serial_number='2bab1a1c6f4c4ba9a7b1a2e5b10c1ee4',
+        adapter='ponsim_olt',
+        vlan=101,
+        host_and_port='172.17.0.1:50060',
+        admin_state=AdminState.ENABLED,
+        oper_status=OperStatus.ACTIVE
+    )
+
+
+def mk_logical_device():
+    return LogicalDevice(
+        id='0001a82b8c9ec5e5',
+        datapath_id=0xa82b8c9ec5e5,
+        desc=ofp.ofp_desc(
+            mfr_desc='cord project',
+            hw_desc='simualted pon',
+            sw_desc='simualted pon',
+            serial_num='2bab1a1c6f4c4ba9a7b1a2e5b10c1ee4',
+            dp_desc='n/a'
+        ),
+        switch_features=ofp.ofp_switch_features(
+            n_buffers=256,
+            n_tables=2,
+            capabilities=(
+                ofp.OFPC_FLOW_STATS
+                | ofp.OFPC_TABLE_STATS
+                | ofp.OFPC_PORT_STATS
+                | ofp.OFPC_GROUP_STATS
+            )
+        ),
+        root_device_id='0001a82b8c9ec5e5'
+    )
+
+
+def mk_flows(n):
+    return Flows(items=[
+        mk_flow_stat(
+            priority=1000 + i,
+            match_fields=[in_port(2 + i % 64), vlan_vid(4096 + i)],
+            actions=[
+                push_vlan(0x8100),
+                set_field(vlan_vid(4096 + 1000)),
+                output(1)
+            ]
+        ) for i in xrange(n)])
+
+
+def time_it(data, serialized=None, min_time=0.5):
+    """Return average seconds per hash of data"""
+    n = 0
+    t0 = timer()
+    while 1:
+        for _ in xrange(100):
+            ConfigDataRevision(data, serialized)
+        n += 100
+        dt = timer() - t0
+        if dt > min_time:
+            return dt / n
+
+
+def main():
+    n_flows = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    msgs = [
+        ('Device', mk_device()),
+        ('LogicalDevice', mk_logical_device()),
+        ('Flows[%d]' % n_flows, mk_flows(n_flows))
+    ]
+
+    configs = [(name, 6) for name in hash_backends()]
+    configs += [('blake2b', 16)] if 'blake2b' in hash_backends() else []
+
+    print '%-20s %-14s %8s %14s %20s' % (
+        'message', 'backend/digest', 'bytes', 'us/rev', 'us/rev (serialized)')
+    try:
+        for msg_name, msg in msgs:
+            serialized = msg.SerializeToString()
+            for backend_name, digest_size in configs:
+                set_hash_backend(backend_name, digest_size)
+                print '%-20s %-14s %8d %14.2f %20.2f' % (
+                    msg_name, '%s/%d' % (backend_name, digest_size),
+                    len(serialized),
+                    1e6 * time_it(msg),
+                    1e6 * time_it(msg, serialized))
+    finally:
+        set_hash_backend()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmark of EventBus.publish throughput with 10k topics, each with one
+explicit subscriber (as the proxied message and packet-in topics of the
+adapter agent have), and a growing number of regexp topic subscriptions,
+compared with matching every regexp subscription on each publish, as done
+before.
+
+Run from the top level voltha directory:
+
+    python experiments/event_bus_benchmark.py [n-topics] [n-messages]
+"""
+
+import re
+import sys
+from random import Random
+from timeit import default_timer as timer
+
+from common.event_bus import EventBus
+
+
+class LegacyEventBus(EventBus):
+    """Publish as done before, without growing the subscriber list"""
+
+    def publish(self, topic, msg):
+        subscribers = list(self.subscriptions.get(topic, []))
+        subscribers.extend(s for s in self.subscriptions.get(None, [])
+                           if s.topic.match(topic))
+        for candidate in subscribers:
+            candidate.callback(topic, msg)
+
+
+def mk_topics(n):
+    """Topics like those of the adapter agent and logical device agents"""
+    topics = []
+    for i in xrange(n):
+        kind = i % 3
+        if kind == 0:
+            topics.append('packet-in:ld-{}'.format(i))
+        elif kind == 1:
+            topics.append('rx:onu-{}'.format(i))
+        else:
+            topics.append('tx:onu-{}'.format(i))
+    return topics
+
+
+def mk_bus(cls, topics, n_regexps):
+    bus = cls()
+    received = [0]
+
+    def callback(topic, msg):
+        received[0] += 1
+
+    for topic in topics:
+        bus.subscribe(topic, callback)
+    # e.g., per device taps on proxied messages, and a few catch-alls
+    for i in xrange(n_regexps):
+        if i % 10 == 0:
+            pattern = r'.*:ld-{}$'.format(i)
+        else:
+            pattern = r'{}:onu-{}$'.format('rx' if i % 2 else 'tx', i)
+        bus.subscribe(re.compile(pattern), callback)
+    return bus, received
+
+
+def rate(bus, topics, n_messages):
+    t0 = timer()
+    for topic in topics[:n_messages]:
+        bus.publish(topic, None)
+    return n_messages / (timer() - t0)
+
+
+def main():
+    n_topics = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    topics = mk_topics(n_topics)
+    random = Random(0)
+    published = [random.choice(topics) for _ in xrange(n_messages)]
+
+    print '%8s %8s %16s %16s %16s' % (
+        'topics', 'regexps', 'msgs/s', 'first pass', 'legacy msgs/s')
+    for n_regexps in (0, 10, 100, 1000):
+        bus, received = mk_bus(EventBus, topics, n_regexps)
+        # the first publish of each topic resolves its subscribers
+        first_pass = rate(bus, topics, len(topics))
+        steady = rate(bus, published, n_messages)
+
+        legacy_bus, _ = mk_bus(LegacyEventBus, topics, n_regexps)
+        # matching all regexps gets slow, so measure on fewer messages
+        legacy = rate(legacy_bus, published,
+                      n_messages // max(1, n_regexps // 10))
+
+        print '%8d %8d %16d %16d %16d' % (
+            n_topics, n_regexps, steady, first_pass, legacy)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmark of the route table computation of a logical device, of its
+incremental update when an ONU is added, and of half-route lookups by
+ingress or egress port, for an OLT with a growing number of PON ports, each
+with the same number of ONUs.
+
+Run from the top level voltha directory (with protos built):
+
+    python experiments/route_table_benchmark.py [onus-per-pon]
+"""
+
+import sys
+from timeit import default_timer as timer
+
+import networkx as nx
+
+from voltha.protos import third_party
+from voltha.core.device_graph import DeviceGraph
+from voltha.protos import openflow_13_pb2 as ofp
+from voltha.protos.device_pb2 import Device, Port
+from voltha.protos.logical_device_pb2 import LogicalPort
+
+NNI_PORT_NO = 1
+UNI_PORT_NO = 2
+
+_ = third_party
+
+
+class FakeRootProxy(object):
+
+    def __init__(self):
+        self.devices = {}
+        self.ports = {}
+
+    def add_device(self, device, ports):
+        self.devices['/devices/{}'.format(device.id)] = device
+        self.ports['/devices/{}/ports'.format(device.id)] = ports
+
+    def get(self, path):
+        if path in self.devices:
+            return self.devices[path]
+        return self.ports[path]
+
+
+def add_onu(proxy, olt_pon_port, onu_id, logical_ports):
+    """Add ONU on given OLT PON port; return its logical port"""
+    olt_pon_port.peers.add(device_id=onu_id, port_no=1)
+    onu_pon_port = Port(port_no=1, type=Port.PON_ONU)
+    onu_pon_port.peers.add(device_id='olt', port_no=olt_pon_port.port_no)
+    proxy.add_device(
+        Device(id=onu_id, parent_id='olt'),
+        [onu_pon_port, Port(port_no=UNI_PORT_NO, type=Port.ETHERNET_UNI)])
+    logical_port = LogicalPort(
+        id=onu_id, device_id=onu_id, device_port_no=UNI_PORT_NO,
+        ofp_port=ofp.ofp_port(port_no=len(logical_ports)))
+    logical_ports.append(logical_port)
+    return logical_port
+
+
+def mk_pon_tree(n_pons, onus_per_pon):
+    """Return root proxy, OLT PON ports and logical ports of an OLT tree"""
+    proxy = FakeRootProxy()
+    olt_ports = [Port(port_no=NNI_PORT_NO, type=Port.ETHERNET_NNI)]
+    logical_ports = [LogicalPort(
+        id='nni', device_id='olt', device_port_no=NNI_PORT_NO,
+        ofp_port=ofp.ofp_port(port_no=0))]
+
+    for pon in xrange(n_pons):
+        olt_pon_port = Port(port_no=100 + pon, type=Port.PON_OLT)
+        olt_ports.append(olt_pon_port)
+        for i in xrange(onus_per_pon):
+            add_onu(proxy, olt_pon_port, 'onu-{}-{}'.format(pon, i),
+                    logical_ports)
+
+    proxy.add_device(Device(id='olt', root=True), olt_ports)
+    return proxy, olt_ports[1:], logical_ports
+
+
+def legacy_routes(boundary_ports, graph):
+    """Count routes the way they were found before: a search per port pair"""
+    n = 0
+    for source in boundary_ports:
+        for target in boundary_ports:
+            if source == target:
+                continue
+            path = nx.shortest_path(graph, source, target)
+            if len(path) % 3 == 0:
+                n += 1
+    return n
+
+
+def legacy_half_route(routes, ingress_port_no):
+    """Scan for a half route the way get_route did before"""
+    for (ingress, egress), route in routes.iteritems():
+        if ingress == ingress_port_no:
+            return [route[0], None]
+
+
+def main():
+    onus_per_pon = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+
+    print '%6s %8s %10s %12s %14s %14s %16s %16s' % (
+        'pons', 'onus', 'routes', 'build (s)', 'legacy (s)', 'add onu (ms)',
+        'half-route (us)', 'legacy (us)')
+    for n_pons in (1, 16, 64):
+        proxy, pon_ports, logical_ports = mk_pon_tree(n_pons, onus_per_pon)
+        graph = DeviceGraph()
+
+        t0 = timer()
+        _, routes = graph.compute_routes(proxy, logical_ports)
+        build = timer() - t0
+
+        # the pairwise search grows with the square of the number of ports,
+        # only run it where it completes in reasonable time
+        legacy = float('nan')
+        if len(logical_ports) <= 256:
+            boundary_ports, nx_graph = graph._build_graph(
+                proxy, logical_ports)
+            t0 = timer()
+            legacy_routes(boundary_ports, nx_graph)
+            legacy = timer() - t0
+
+        new_ports = [add_onu(proxy, pon_ports[i % n_pons], 'new-onu-%d' % i,
+                             logical_ports) for i in xrange(16)]
+        t0 = timer()
+        for logical_port in new_ports:
+            graph.add_logical_port(proxy, logical_port)
+        add = (timer() - t0) / len(new_ports)
+
+        uni_port_nos = [lp.ofp_port.port_no for lp in logical_ports[1:]]
+        t0 = timer()
+        for port_no in uni_port_nos:
+            routes.half_route_from(port_no)
+        half_route = (timer() - t0) / len(uni_port_nos)
+
+        sample = uni_port_nos[-16:]
+        t0 = timer()
+        for port_no in sample:
+            legacy_half_route(routes, port_no)
+        legacy_half = (timer() - t0) / len(sample)
+
+        print '%6d %8d %10d %12.3f %14.3f %14.3f %16.2f %16.2f' % (
+            n_pons, n_pons * onus_per_pon, len(routes), build, legacy,
+            1e3 * add, 1e6 * half_route, 1e6 * legacy_half)
+
+
+if __name__ == '__main__':
+    main()
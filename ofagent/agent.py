@@ -37,13 +37,15 @@ class Agent(protocol.ClientFactory):
                  datapath_id,
                  device_id,
                  rpc_stub,
-                 conn_retry_interval=1):
+                 conn_retry_interval=1,
+                 flow_mod_batch_window=0):
 
         self.controller_endpoint = controller_endpoint
         self.datapath_id = datapath_id
         self.device_id = device_id
         self.rpc_stub = rpc_stub
         self.retry_interval = conn_retry_interval
+        self.flow_mod_batch_window = flow_mod_batch_window
 
         self.running = False
         self.connector = None # will be a Connector instance once connected
@@ -108,7 +110,8 @@ class Agent(protocol.ClientFactory):
     def protocol(self):
         cxn = OpenFlowConnection(self)  # Low level message handler
         self.proto_handler = OpenFlowProtocolHandler(
-            self.datapath_id, self.device_id, self, cxn, self.rpc_stub)
+            self.datapath_id, self.device_id, self, cxn, self.rpc_stub,
+            flow_mod_batch_window=self.flow_mod_batch_window)
         return cxn
 
     def clientConnectionFailed(self, connector, reason):
@@ -37,7 +37,8 @@ log = get_logger()
 class ConnectionManager(object):
 
     def __init__(self, consul_endpoint, voltha_endpoint, controller_endpoint,
-                 voltha_retry_interval=0.5, devices_refresh_interval=5):
+                 voltha_retry_interval=0.5, devices_refresh_interval=5,
+                 flow_mod_batch_window=0):
 
         log.info('init-connection-manager')
         self.controller_endpoint = controller_endpoint
@@ -52,6 +53,7 @@ class ConnectionManager(object):
 
         self.voltha_retry_interval = voltha_retry_interval
         self.devices_refresh_interval = devices_refresh_interval
+        self.flow_mod_batch_window = flow_mod_batch_window
 
         self.running = False
 
@@ -176,7 +178,8 @@ class ConnectionManager(object):
         datapath_id = device.datapath_id
         device_id = device.id
         agent = Agent(self.controller_endpoint, datapath_id,
-                      device_id, self.grpc_client)
+                      device_id, self.grpc_client,
+                      flow_mod_batch_window=self.flow_mod_batch_window)
         agent.start()
         self.agent_map[datapath_id] = agent
         self.device_id_to_datapath_id_map[device_id] = datapath_id
@@ -27,7 +27,7 @@ from twisted.internet import threads
 from twisted.internet.defer import inlineCallbacks, returnValue, DeferredQueue
 
 from protos.voltha_pb2 import ID, VolthaLocalServiceStub, FlowTableUpdate, \
-    FlowGroupTableUpdate, PacketOut
+    FlowTableUpdates, FlowGroupTableUpdate, PacketOut
 from google.protobuf import empty_pb2
 
 
@@ -158,6 +158,16 @@ class GrpcClient(object):
             self.local_stub.UpdateLogicalDeviceFlowTable, req)
         returnValue(res)
 
+    @inlineCallbacks
+    def update_flow_table_batch(self, device_id, flow_mods):
+        req = FlowTableUpdates(
+            id=device_id,
+            flow_mods=flow_mods
+        )
+        res = yield threads.deferToThread(
+            self.local_stub.UpdateLogicalDeviceFlowTableBatch, req)
+        returnValue(res.items)
+
     @inlineCallbacks
     def update_group_table(self, device_id, group_mod):
         req = FlowGroupTableUpdate(
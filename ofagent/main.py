@@ -34,6 +34,7 @@ defs = dict(
                                          get_my_primary_local_ipv4()),
     grpc_endpoint=os.environ.get('GRPC_ENDPOINT', 'localhost:50055'),
     fluentd=os.environ.get('FLUENTD', None),
+    flow_mod_batch_window=float(os.environ.get('FLOW_MOD_BATCH_WINDOW', 0)),
     instance_id=os.environ.get('INSTANCE_ID', os.environ.get('HOSTNAME', '1')),
     internal_host_address=os.environ.get('INTERNAL_HOST_ADDRESS',
                                          get_my_primary_local_ipv4()),
@@ -84,6 +85,17 @@ def parse_args():
                         default=defs['fluentd'],
                         help=_help)
 
+    _help = ('send flow_mods to voltha in batches, up to the next barrier '
+             'or for at most the given number of seconds; 0 to send each '
+             'flow_mod by itself (default: %s)'
+             % defs['flow_mod_batch_window'])
+    parser.add_argument('--flow-mod-batch-window',
+                        dest='flow_mod_batch_window',
+                        action='store',
+                        type=float,
+                        default=defs['flow_mod_batch_window'],
+                        help=_help)
+
     _help = ('gRPC end-point to connect to. It can either be a direct'
              'definition in the form of <hostname>:<port>, or it can be an'
              'indirect definition in the form of @<service-name> where'
@@ -213,7 +225,8 @@ class Main(object):
         self.log.info('starting-internal-components')
         args = self.args
         self.connection_manager = yield ConnectionManager(
-            args.consul, args.grpc_endpoint, args.controller).start()
+            args.consul, args.grpc_endpoint, args.controller,
+            flow_mod_batch_window=args.flow_mod_batch_window).start()
         self.log.info('started-internal-services')
 
     @inlineCallbacks
@@ -18,25 +18,30 @@ from hexdump import hexdump
 from twisted.internet import protocol
 
 import loxi.of14
-from common.utils.message_queue import MessageQueue
+from common.utils.message_queue import IndexedMessageQueue
 
 log = structlog.get_logger()
 
 
 class OpenFlowConnection(protocol.Protocol):
 
+    # received messages not yet handled, beyond which we stop reading from
+    # the socket until the backlog drains
+    RX_BACKLOG_LIMIT = 1024
+
     def __init__(self, agent):
         self.agent = agent  # the protocol will call agent.enter_disconnected()
                             # and agent.enter_connected() methods to indicate
                             # when state change is necessary
         self.next_xid = 1
         self.read_buffer = None
-        self.rx = MessageQueue()
+        self.rx = IndexedMessageQueue(maxsize=self.RX_BACKLOG_LIMIT)
 
     def connectionLost(self, reason):
         self.agent.enter_disconnected('connection-lost', reason)
 
     def connectionMade(self):
+        self.rx.set_producer(self.transport)
         self.agent.enter_connected()
 
     def dataReceived(self, data):
@@ -112,13 +117,16 @@ class OpenFlowConnection(protocol.Protocol):
         return self.rx.get(predicate)
 
     def recv_any(self):
-        return self.recv(lambda _: True)
+        assert self.connected
+        return self.rx.get()
 
     def recv_xid(self, xid):
-        return self.recv(lambda msg: msg.xid == xid)
+        assert self.connected
+        return self.rx.get_xid(xid)
 
     def recv_class(self, klass):
-        return self.recv(lambda msg: isinstance(msg, klass))
+        assert self.connected
+        return self.rx.get_class(klass)
 
     def _gen_xid(self):
         xid = self.next_xid
@@ -14,7 +14,8 @@
 # limitations under the License.
 #
 import structlog
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue, DeferredLock
 
 import loxi.of13 as ofp
 from converter import to_loxi, pb2dict, to_grpc
@@ -27,7 +28,8 @@ class OpenFlowProtocolError(Exception): pass
 
 class OpenFlowProtocolHandler(object):
 
-    def __init__(self, datapath_id, device_id, agent, cxn, rpc):
+    def __init__(self, datapath_id, device_id, agent, cxn, rpc,
+                 flow_mod_batch_window=0):
         """
         The upper half of the OpenFlow protocol, focusing on message
         exchanges.
@@ -36,6 +38,9 @@ class OpenFlowProtocolHandler(object):
         :param cxn: The lower level message serdes part of the OF protocol.
         :param rpc: The application level stub on which RPC calls
           are made as result of processing incoming OpenFlow request messages.
+        :param flow_mod_batch_window: if not 0, flow_mods are sent to Voltha
+          in batches, up to the next barrier_request or group_mod, or for at
+          most this many seconds
         """
         self.datapath_id = datapath_id
         self.device_id = device_id
@@ -43,6 +48,11 @@ class OpenFlowProtocolHandler(object):
         self.cxn = cxn
         self.rpc = rpc
 
+        self.flow_mod_batch_window = flow_mod_batch_window
+        self.pending_flow_mods = []  # flow_mod requests of the next batch
+        self.flush_timer = None
+        self.flush_lock = DeferredLock()  # keeps batches in order
+
     @inlineCallbacks
     def start(self):
         """A new call is made after a fresh reconnect"""
@@ -97,8 +107,11 @@ class OpenFlowProtocolHandler(object):
             raise OpenFlowProtocolError(
                 'Cannot handle stats request type "{}"'.format(req.stats_type))
 
+    @inlineCallbacks
     def handle_barrier_request(self, req):
-        # TODO not really doing barrier yet, but we respond
+        # TODO not really doing barrier yet, but we respond (once pending
+        # flow_mods are applied)
+        yield self.flush_flow_mods()
         self.cxn.send(ofp.message.barrier_reply(xid=req.xid))
 
     def handle_experimenter_request(self, req):
@@ -106,7 +119,44 @@ class OpenFlowProtocolHandler(object):
 
     @inlineCallbacks
     def handle_flow_mod_request(self, req):
-        yield self.rpc.update_flow_table(self.device_id, to_grpc(req))
+        self.pending_flow_mods.append(req)
+        if not self.flow_mod_batch_window:
+            # sent right away, as a batch of one so that a failure is
+            # reported to the controller
+            yield self.flush_flow_mods()
+        elif self.flush_timer is None:
+            self.flush_timer = reactor.callLater(
+                self.flow_mod_batch_window, self.flush_flow_mods)
+
+    @inlineCallbacks
+    def flush_flow_mods(self):
+        """
+        Send the pending flow_mods to Voltha as a single batch, and report
+        the ones that failed to the controller
+        """
+        if self.flush_timer is not None:
+            if self.flush_timer.active():
+                self.flush_timer.cancel()
+            self.flush_timer = None
+
+        yield self.flush_lock.acquire()
+        try:
+            reqs, self.pending_flow_mods = self.pending_flow_mods, []
+            if not reqs:
+                return
+            try:
+                errors = yield self.rpc.update_flow_table_batch(
+                    self.device_id, [to_grpc(req) for req in reqs])
+                errors = [(error.index, error.code) for error in errors]
+            except Exception, e:
+                log.exception('flow-mod-batch-failed', e=e, count=len(reqs))
+                errors = [(i, ofp.OFPFMFC_UNKNOWN) for i in range(len(reqs))]
+            for index, code in errors:
+                req = reqs[index]
+                self.cxn.send(ofp.message.flow_mod_failed_error_msg(
+                    xid=req.xid, code=code, data=req.pack()[:64]))
+        finally:
+            self.flush_lock.release()
 
     def handle_get_async_request(self, req):
         raise NotImplementedError()
@@ -119,6 +169,8 @@ class OpenFlowProtocolHandler(object):
 
     @inlineCallbacks
     def handle_group_mod_request(self, req):
+        # flow_mods sent before refer to the groups as they were
+        yield self.flush_flow_mods()
         yield self.rpc.update_group_table(self.device_id, to_grpc(req))
 
     def handle_meter_mod_request(self, req):
@@ -53,6 +53,18 @@ class FlowUpdateHandler(PonSimServicer):
             self.ponsim.onu_install_flows(request.port, request.flows)
         return Empty()
 
+    @twisted_async
+    def UpdateFlowTableIncrementally(self, request, context):
+        log.info('flow-table-incremental-update', request=request,
+                 port=request.port)
+        if request.port == 0:
+            # by convention this is the olt port
+            self.ponsim.olt_update_flows(request.to_add, request.to_remove)
+        else:
+            self.ponsim.onu_update_flows(
+                request.port, request.to_add, request.to_remove)
+        return Empty()
+
 class GrpcServer(object):
 
     def __init__(self, port, ponsim):
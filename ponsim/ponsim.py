@@ -73,6 +73,13 @@ class SimDevice(object):
         # store flows in precedence order so we can roll down on frame arrival
         self.flows = sorted(flows, key=lambda fm: fm.priority, reverse=True)
 
+    def update_flows(self, to_add, to_remove):
+        # flows are identified by their id (a hash of their match criteria)
+        removed_ids = set(flow.id for flow in to_remove)
+        removed_ids.update(flow.id for flow in to_add)
+        flows = [flow for flow in self.flows if flow.id not in removed_ids]
+        self.install_flows(flows + list(to_add))
+
     def process_frame(self, ingress_port, ingress_frame):
         for flow in self.flows:
             if self.is_match(flow, ingress_port, ingress_frame):
@@ -229,6 +236,12 @@ class PonSim(object):
     def onu_install_flows(self, onu_port, flows):
         self.devices[onu_port].install_flows(flows)
 
+    def olt_update_flows(self, to_add, to_remove):
+        self.olt.update_flows(to_add, to_remove)
+
+    def onu_update_flows(self, onu_port, to_add, to_remove):
+        self.devices[onu_port].update_flows(to_add, to_remove)
+
     def ingress(self, port, frame):
         if not isinstance(frame, Packet):
             frame = Ether(frame)
@@ -132,6 +132,30 @@ class TestPonSim(TestCase):
         self.ingress_frame(in_frame)
         self.assertEqual(self.output, [(0, out_frame)])
 
+    def test_incremental_flow_updates(self):
+
+        olt_flow = mk_flow_stat(
+            match_fields=[in_port(2), vlan_vid(4096 + 1000)],
+            actions=[pop_vlan(), output(1)]
+        )
+        onu_flow = mk_flow_stat(
+            match_fields=[in_port(1), vlan_vid(4096 + 128)],
+            actions=[set_field(vlan_vid(4096 + 0)), output(2)]
+        )
+        self.pon.olt_update_flows([olt_flow], [])
+        self.pon.onu_update_flows(128, [onu_flow], [])
+
+        kw = dict(src='00:00:00:11:11:11', dst='00:00:00:22:22:22')
+        in_frame = Ether(**kw) / Dot1Q(vlan=1000) / Dot1Q(vlan=128) / IP()
+        out_frame = Ether(**kw) / Dot1Q(vlan=0) / IP()
+        self.ingress_frame(in_frame)
+        self.assertEqual(self.output, [(128, out_frame)])
+
+        # removing the onu flow stops the traffic, the olt flow stays
+        self.pon.onu_update_flows(128, [], [onu_flow])
+        self.assert_dont_pass(in_frame)
+        self.assertEqual(len(self.pon.olt.flows), 1)
+
 
     def setup_all_flows(self):
 
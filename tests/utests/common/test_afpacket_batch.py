@@ -0,0 +1,47 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import socket
+import sys
+from unittest import TestCase, main, skipUnless
+
+
+@skipUnless(sys.platform.startswith('linux'), 'recvmmsg is Linux only')
+class TestBatchReceiver(TestCase):
+
+    def setUp(self):
+        # datagrams of a socket pair stand for frames (without auxdata)
+        self.tx, self.rx = socket.socketpair(socket.AF_UNIX,
+                                             socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.tx.close()
+        self.rx.close()
+
+    def test_batches(self):
+        from common.frameio.afpacket_batch import BatchReceiver
+        receiver = BatchReceiver(self.rx, 1500, batch_size=4)
+        self.assertEqual(receiver.recv(), [])
+
+        frames = ['frame-{}'.format(i) * (i + 1) for i in xrange(6)]
+        for frame in frames:
+            self.tx.send(frame)
+        self.assertEqual(receiver.recv(), frames[:4])
+        self.assertEqual(receiver.recv(), frames[4:])
+        self.assertEqual(receiver.recv(), [])
+
+
+if __name__ == '__main__':
+    main()
@@ -20,7 +20,27 @@ from mock import call
 from twisted.internet.defer import DeferredQueue, inlineCallbacks
 from twisted.trial.unittest import TestCase
 
-from common.event_bus import EventBusClient, EventBus
+from common import event_bus
+from common.event_bus import EventBusClient, EventBus, OverflowPolicy
+
+
+class FakeReactor(object):
+    """Runs the calls scheduled so far on each turn (calls made meanwhile
+    wait for the next turn, as with the reactor)"""
+
+    def __init__(self):
+        self.calls = []
+
+    def callLater(self, delay, f, *args):
+        call = Mock()
+        call.cancel = lambda: self.calls.remove((call, f, args))
+        self.calls.append((call, f, args))
+        return call
+
+    def turn(self):
+        calls, self.calls = self.calls, []
+        for _, f, args in calls:
+            f(*args)
 
 
 class TestEventBus(TestCase):
@@ -178,6 +198,168 @@ class TestEventBus(TestCase):
 
         self.assertEqual(ebc.list_subscribers(), [])
 
+    def test_publish_does_not_grow_subscriptions(self):
+
+        bus = EventBus()
+        ebc = EventBusClient(bus)
+        news = Mock()
+        ebc.subscribe('news', news)
+        wildcard = Mock()
+        ebc.subscribe(re.compile(r'n.*'), wildcard)
+
+        for i in xrange(3):
+            ebc.publish('news', i)
+
+        self.assertEqual(news.call_count, 3)
+        self.assertEqual(wildcard.call_count, 3)
+        self.assertEqual(len(ebc.list_subscribers('news')), 1)
+        self.assertEqual(len(ebc.list_subscribers()), 2)
+
+    def test_subscription_changes_are_seen_by_publish(self):
+
+        bus = EventBus()
+        ebc = EventBusClient(bus)
+        first = Mock()
+        first_sub = ebc.subscribe(re.compile(r'rx:.*'), first)
+        ebc.publish('rx:1', 1)
+
+        # regexp subscribers are called in subscription order, after the
+        # explicit topic subscribers
+        calls = []
+        ebc.subscribe(re.compile(r'.*'), lambda t, m: calls.append('any'))
+        ebc.subscribe('rx:1', lambda t, m: calls.append('exact'))
+        ebc.subscribe(re.compile(r'rx:1'), lambda t, m: calls.append('rx:1'))
+        ebc.publish('rx:1', 2)
+        self.assertEqual(first.call_count, 2)
+        self.assertEqual(calls, ['exact', 'any', 'rx:1'])
+
+        ebc.unsubscribe(first_sub)
+        ebc.publish('rx:1', 3)
+        self.assertEqual(first.call_count, 2)
+        self.assertEqual(bus.regex_trie.children.keys(), ['r'])
+
+        for sub in ebc.list_subscribers():
+            ebc.unsubscribe(sub)
+        self.assertEqual(bus.regex_trie.children, {})
+        self.assertEqual(bus.subs_topic_map, {})
+
+    def test_regexp_index_against_brute_force(self):
+
+        bus = EventBus()
+        patterns = [r'rx:.*', r'rx:1.*', r'^tx:\d+', r'.*:7', r'packet-in:',
+                    r'(rx|tx):2', r'tx:[13]', r'rx:10?', r'RX:1']
+        subs = [bus.subscribe(re.compile(p), Mock()) for p in patterns]
+        subs.append(bus.subscribe(re.compile(r'RX:.*', re.I), Mock()))
+
+        for topic in ['rx:1', 'rx:10', 'rx:2', 'tx:1', 'tx:2', 'tx:7', 'tx:',
+                      'packet-in:ld', 'packet-out:ld', '', 'r']:
+            self.assertEqual(
+                [s for s in bus._resolve(topic)],
+                [s for s in subs if s.topic.match(topic)])
+
+    def use_fake_reactor(self):
+        reactor = FakeReactor()
+        self.patch(event_bus, 'reactor', reactor)
+        return reactor
+
+    def test_async_delivery(self):
+
+        reactor = self.use_fake_reactor()
+        ebc = EventBusClient(EventBus())
+        received = []
+        ebc.subscribe('news', lambda t, m: received.append(m), max_queue=10)
+        sync = Mock()
+        ebc.subscribe('news', sync)
+
+        self.assertEqual(ebc.publish('news', 1), None)
+        ebc.publish('news', 2)
+        self.assertEqual(received, [])
+        self.assertEqual(sync.call_count, 2)
+        self.assertEqual(ebc.queue_metrics(), {'news': dict(
+            depth=2, blocked=0, delivered=0, dropped=0)})
+
+        reactor.turn()
+        self.assertEqual(received, [1, 2])
+        self.assertEqual(ebc.queue_metrics()['news']['delivered'], 2)
+
+        # large backlogs are delivered over several reactor turns
+        for i in xrange(10):
+            ebc.publish('news', i)
+        self.patch(EventBus, 'DRAIN_BATCH', 4)
+        reactor.turn()
+        self.assertEqual(len(received), 6)
+        reactor.turn()
+        reactor.turn()
+        self.assertEqual(received[2:], range(10))
+
+    def test_async_overflow(self):
+
+        reactor = self.use_fake_reactor()
+        ebc = EventBusClient(EventBus())
+        oldest, newest = [], []
+        ebc.subscribe(re.compile('n.*'), lambda t, m: oldest.append(m),
+                      max_queue=2, overflow=OverflowPolicy.DROP_OLDEST)
+        ebc.subscribe('news', lambda t, m: newest.append(m),
+                      max_queue=2, overflow=OverflowPolicy.DROP_NEWEST)
+        for i in xrange(5):
+            ebc.publish('news', i)
+        metrics = ebc.queue_metrics()
+        self.assertEqual(metrics['n.*']['dropped'], 3)
+        self.assertEqual(metrics['news']['dropped'], 3)
+        self.assertEqual(metrics['news']['depth'], 2)
+
+        reactor.turn()
+        self.assertEqual(oldest, [3, 4])
+        self.assertEqual(newest, [0, 1])
+
+    def test_async_blocking_publisher(self):
+
+        reactor = self.use_fake_reactor()
+        ebc = EventBusClient(EventBus())
+        received = []
+        sub = ebc.subscribe('news', lambda t, m: received.append(m),
+                            max_queue=2, overflow=OverflowPolicy.BLOCK)
+        self.assertEqual(ebc.publish('news', 0), None)
+        self.assertEqual(ebc.publish('news', 1), None)
+        queued = []
+        for i in (2, 3, 4):
+            ebc.publish('news', i).addCallback(lambda _, i=i: queued.append(i))
+        self.assertEqual(ebc.queue_metrics()['news']['blocked'], 3)
+
+        reactor.turn()
+        self.assertEqual(received, [0, 1])
+        self.assertEqual(queued, [2, 3])
+        reactor.turn()
+        self.assertEqual(received, [0, 1, 2, 3])
+        self.assertEqual(queued, [2, 3, 4])
+
+        # unsubscribing drops the queue and releases blocked publishers
+        for i in (5, 6, 7):
+            d = ebc.publish('news', i)
+        ebc.unsubscribe(sub)
+        self.assertTrue(d.called)
+        reactor.turn()
+        self.assertEqual(received, [0, 1, 2, 3])
+        self.assertEqual(ebc.queue_metrics(), {})
+
+    def test_unsubscribed_during_publish(self):
+
+        reactor = self.use_fake_reactor()
+        ebc = EventBusClient(EventBus())
+        received = []
+        subs = []
+        ebc.subscribe('news', lambda t, m: [ebc.unsubscribe(s) for s in subs])
+        subs.append(ebc.subscribe('news', lambda t, m: received.append(m),
+                                  max_queue=2))
+        subs.append(ebc.subscribe('news', lambda t, m: received.append(m)))
+
+        # neither the queued nor the synchronous subscriber gets the message
+        ebc.publish('news', 1)
+        self.assertEqual(received, [])
+        reactor.turn()
+        self.assertEqual(received, [])
+        self.assertEqual(ebc.list_subscribers('news')[1:], [])
+
     @inlineCallbacks
     def test_deferred_queue_receiver(self):
 
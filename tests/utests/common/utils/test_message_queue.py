@@ -0,0 +1,152 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from random import Random
+from unittest import TestCase, main
+
+from mock import Mock
+from twisted.internet.defer import CancelledError
+
+from common.utils.message_queue import IndexedMessageQueue, MessageQueue
+
+
+class Msg(object):
+    def __init__(self, xid, n):
+        self.xid = xid
+        self.n = n
+
+
+class Hello(Msg): pass
+
+
+class Echo(Msg): pass
+
+
+class EchoReply(Echo): pass
+
+
+class TestIndexedMessageQueue(TestCase):
+
+    def test_same_as_message_queue(self):
+        random = Random(0)
+        classes = [Msg, Hello, Echo, EchoReply]
+
+        def random_get():
+            kind = random.randint(0, 3)
+            xid = random.randint(1, 4)
+            klass = random.choice(classes)
+            if kind == 0:
+                return lambda q: q.get(), \
+                    lambda q: q.get()
+            elif kind == 1:
+                return lambda q: q.get_xid(xid), \
+                    lambda q: q.get(lambda m: m.xid == xid)
+            elif kind == 2:
+                return lambda q: q.get_class(klass), \
+                    lambda q: q.get(lambda m: isinstance(m, klass))
+            else:
+                predicate = lambda m: m.n % 3 == 0
+                return lambda q: q.get(predicate), \
+                    lambda q: q.get(predicate)
+
+        queue = IndexedMessageQueue()
+        reference = MessageQueue()
+        results, expected = [], []
+        for n in xrange(2000):
+            if random.random() < 0.5:
+                msg = random.choice(classes)(random.randint(1, 4), n)
+                queue.put(msg)
+                reference.put(msg)
+            else:
+                get, reference_get = random_get()
+                get(queue).addCallback(lambda m: results.append(m.n))
+                reference_get(reference).addCallback(
+                    lambda m: expected.append(m.n))
+            self.assertEqual(results, expected)
+            self.assertEqual(len(queue), len(reference.queue))
+            self.assertEqual(len(queue.waiting), len(reference.waiting))
+
+    def test_cancel(self):
+        queue = IndexedMessageQueue()
+        d1 = queue.get_xid(1)
+        d2 = queue.get_xid(1)
+        d1.addErrback(lambda f: f.trap(CancelledError))
+        d1.cancel()
+        self.assertEqual(len(queue.waiting), 1)
+        received = []
+        d2.addCallback(received.append)
+        msg = Msg(1, 0)
+        queue.put(msg)
+        self.assertEqual(received, [msg])
+        self.assertEqual(queue._xid_waiters.buckets, {})
+
+    def test_backpressure(self):
+        producer = Mock()
+        queue = IndexedMessageQueue(maxsize=4, producer=producer)
+        for n in xrange(4):
+            queue.put(Msg(n, n))
+        producer.pauseProducing.assert_called_once_with()
+        self.assertTrue(queue.paused)
+
+        queue.get()
+        self.assertTrue(queue.paused)
+        queue.get_xid(3)
+        producer.resumeProducing.assert_called_once_with()
+        self.assertFalse(queue.paused)
+
+        # a get which has to wait resumes the producer
+        queue.put(Msg(4, 4))
+        queue.put(Msg(5, 5))
+        self.assertTrue(queue.paused)
+        queue.get_xid(7)
+        self.assertFalse(queue.paused)
+
+    def test_no_pause_while_waiting(self):
+        producer = Mock()
+        queue = IndexedMessageQueue(maxsize=4, producer=producer)
+        for n in xrange(4):
+            queue.put(Msg(n, n))
+        self.assertTrue(queue.paused)
+
+        # the reply waited for comes after more unrelated messages
+        received = []
+        queue.get_xid(99).addCallback(received.append)
+        self.assertFalse(queue.paused)
+        for n in xrange(4, 8):
+            queue.put(Msg(n, n))
+        self.assertFalse(queue.paused)
+        self.assertEqual(producer.pauseProducing.call_count, 1)
+        reply = Msg(99, 8)
+        queue.put(reply)
+        self.assertEqual(received, [reply])
+
+        # with no one waiting, the backlog pauses the producer again
+        queue.put(Msg(9, 9))
+        self.assertTrue(queue.paused)
+        self.assertEqual(producer.pauseProducing.call_count, 2)
+
+    def test_reset(self):
+        queue = IndexedMessageQueue()
+        queue.put(Msg(1, 0))
+        errors = []
+        queue.get_xid(2).addErrback(errors.append)
+        queue.reset()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(len(queue.waiting), 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import gc
+import os
+import shutil
+import tempfile
+import weakref
+from unittest import main, TestCase
+
+from mock import patch
+
+from voltha.core.config import config_checkpoint, config_root
+from voltha.core.config.config_checkpoint import codecs, iter_records, \
+    RECORD_ROOT
+from voltha.core.config.config_root import ConfigRoot
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, AdapterConfig, \
+    HealthStatus
+
+
+class Blobs(dict):
+    """Blobs read from a checkpoint, weakly referable"""
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'config.ckp')
+        self.node = ConfigRoot(VolthaInstance(instance_id='1'))
+        self.node.update('/health', HealthStatus(state=HealthStatus.HEALTHY))
+        for i in xrange(50):
+            self.node.add('/adapters', Adapter(
+                id=str(i), config=AdapterConfig(log_level=i % 4)))
+
+    def tearDown(self):
+        self.node.close_journal()
+        shutil.rmtree(self.dir)
+
+    def test_checkpoint_and_restore(self):
+        for codec in codecs():
+            self.node.checkpoint(self.path, codec=codec, journal=False)
+            self.assertFalse(os.path.exists(self.path + '.journal'))
+            restored = ConfigRoot.restore(VolthaInstance, self.path)
+            self.assertEqual(restored.get(deep=1), self.node.get(deep=1))
+            self.assertEqual(restored.latest.hash, self.node.latest.hash)
+
+    def test_restore_from_checkpoint_and_journal(self):
+        self.node.checkpoint(self.path)
+        self.node.update('/adapters/3', Adapter(id='3', version='2.0'))
+        self.node.remove('/adapters/7')
+        self.node.add('/adapters', Adapter(id='new'))
+
+        # uncommitted transactions are not journaled
+        txid = self.node.mk_txbranch()
+        self.node.update('/', VolthaInstance(instance_id='tx'), txid=txid)
+
+        restored = ConfigRoot.restore(VolthaInstance, self.path)
+        self.assertEqual(restored.get(deep=1), self.node.get(deep=1))
+        self.assertEqual(restored.get('/adapters/3').version, '2.0')
+
+        # the journal only holds the changed parts of the tree
+        journal_keys = [key for _, key, _ in
+                        iter_records(self.path + '.journal')]
+        self.assertLess(len(journal_keys), 20)
+
+        # and restored trees can be changed and checkpointed in turn
+        restored.update('/', VolthaInstance(instance_id='2'))
+        restored.checkpoint(self.path)
+        restored.close_journal()
+        restored = ConfigRoot.restore(VolthaInstance, self.path, lazy=True)
+        self.assertEqual(restored.get('/').instance_id, '2')
+        self.assertEqual(restored.get('/adapters/3').version, '2.0')
+
+    def test_journal_only_visits_changes(self):
+        for i in xrange(50, 1000):
+            self.node.add('/adapters', Adapter(id=str(i)))
+        self.node.checkpoint(self.path)
+
+        visited = []
+        changed_children = config_checkpoint._changed_children
+
+        def spy(children, prev_children):
+            pairs = changed_children(children, prev_children)
+            visited.extend(rev.hash for rev, _ in pairs)
+            return pairs
+
+        with patch.object(config_checkpoint, '_changed_children', spy):
+            self.node.update('/adapters/3', Adapter(id='3', version='2.0'))
+            self.node.update('/adapters/3', Adapter(id='3', version='3.0'))
+            self.node.add('/adapters', Adapter(id='new'))
+        self.assertEqual(len(visited), 3)
+
+        restored = ConfigRoot.restore(VolthaInstance, self.path)
+        self.assertEqual(restored.get(deep=1), self.node.get(deep=1))
+
+    def restore_watching_blobs(self, lazy):
+        """Restore self.path; return the root and a weakref to its blobs"""
+        refs = []
+        read_checkpoint = config_root.read_checkpoint
+
+        def spy(path, journal_path=None):
+            latest, blobs = read_checkpoint(path, journal_path)
+            blobs = Blobs(blobs)
+            refs.append(weakref.ref(blobs))
+            return latest, blobs
+
+        with patch.object(config_root, 'read_checkpoint', spy):
+            restored = ConfigRoot.restore(VolthaInstance, self.path,
+                                          lazy=lazy)
+        return restored, refs[0]
+
+    def test_restored_tree_does_not_hold_on_to_blobs(self):
+        self.node.checkpoint(self.path, journal=False)
+        restored, blobs = self.restore_watching_blobs(lazy=False)
+        gc.collect()
+        self.assertIsNone(blobs())
+
+        for i in xrange(50):
+            restored.update('/adapters/3', Adapter(id='3', version=str(i)))
+        self.assertEqual(restored.get('/adapters/3').version, '49')
+        for rev in (restored.latest,
+                    restored.latest._children['adapters'].get('3')):
+            self.assertIsNone(rev._kv_store)
+            self.assertIsNone(getattr(rev._config, '_serialized', None))
+
+    def test_lazily_restored_tree_does_not_grow_blobs(self):
+        self.node.checkpoint(self.path, journal=False)
+        restored, blobs = self.restore_watching_blobs(lazy=True)
+        size = len(blobs())
+        for i in xrange(50):
+            restored.update('/', VolthaInstance(instance_id=str(i)))
+            restored.update('/health', HealthStatus(
+                state=HealthStatus.OVERLOADED if i % 2 else
+                HealthStatus.DYING))
+        self.assertEqual(len(blobs()), size)
+        self.assertEqual(restored.get(deep=1).instance_id, '49')
+
+    def test_truncated_journal_frame_is_ignored(self):
+        journal_path = self.path + '.journal'
+        for codec in codecs():
+            self.node.checkpoint(self.path, codec=codec)
+            self.node.update('/adapters/3', Adapter(id='3', version=codec))
+            expected = self.node.get(deep=1)
+            size = os.path.getsize(journal_path)
+            self.node.update('/adapters/4', Adapter(id='4', version=codec))
+            self.node.close_journal()
+
+            # cut anywhere into the last frame, including its header
+            with open(journal_path, 'rb') as f:
+                journal = f.read()
+            for cut in xrange(size, len(journal)):
+                with open(journal_path, 'wb') as f:
+                    f.write(journal[:cut])
+                restored = ConfigRoot.restore(VolthaInstance, self.path)
+                self.assertEqual(restored.get(deep=1), expected)
+
+    def test_empty_journal_is_ignored(self):
+        journal_path = self.path + '.journal'
+        self.node.checkpoint(self.path)
+        expected = self.node.get(deep=1)
+        self.node.close_journal()
+        for size in (0, 3):
+            with open(journal_path, 'r+b') as f:
+                f.truncate(size)
+            restored = ConfigRoot.restore(VolthaInstance, self.path)
+            self.assertEqual(restored.get(deep=1), expected)
+
+        # an empty checkpoint is still an error
+        with open(self.path, 'wb'):
+            pass
+        self.assertRaises(ValueError, ConfigRoot.restore, VolthaInstance,
+                          self.path)
+
+    def test_records_are_in_dependency_order(self):
+        self.node.checkpoint(self.path, journal=False)
+        records = list(iter_records(self.path))
+        self.assertEqual(records[-1], (RECORD_ROOT, 'root',
+                                       self.node.latest.hash))
+        position = dict((key, i) for i, (_, key, _) in enumerate(records))
+        to_visit = [self.node.latest]
+        while to_visit:
+            rev = to_visit.pop()
+            self.assertLess(position[rev._config.hash], position[rev.hash])
+            for children in rev._children.itervalues():
+                for child_rev in children:
+                    self.assertLess(position[child_rev.hash],
+                                    position[rev.hash])
+                    to_visit.append(child_rev)
+
+    def test_bad_files(self):
+        with open(self.path, 'wb') as f:
+            f.write('not a checkpoint')
+        self.assertRaises(ValueError, ConfigRoot.restore, VolthaInstance,
+                          self.path)
+        self.assertRaises(ValueError, self.node.checkpoint, self.path,
+                          codec='no-such-codec')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,8 @@ import gc
 from mock import Mock
 
 from voltha.core.config.config_proxy import CallbackType, OperationContext
-from voltha.core.config.config_rev import _rev_cache
+from voltha.core.config.config_rev import _rev_cache, hash_backends, \
+    set_hash_backend, get_hash_backend
 from voltha.core.config.config_root import ConfigRoot, MergeConflictException
 from voltha.core.config.config_txn import ClosedTransactionError
 from voltha.protos import third_party
@@ -196,6 +197,26 @@ class TestConfigNodeDeep(DeepTestsBase):
         self.assertEqual(self.node.get(), self.base_shallow)
         self.assertEqual(self.node.get(hash=self.hash_orig), self.base_shallow)
 
+    def test_read_only_get(self):
+        adapter_rev = self.node.latest._children['adapters'][1]
+
+        # read-only shallow gets return the stored data as is
+        self.assertIs(self.node.get(read_only=True), self.node.latest.data)
+        self.assertIs(self.node.get('/adapters/1', read_only=True),
+                      adapter_rev.data)
+        self.assertIs(self.node.get('/adapters', read_only=True)[1],
+                      adapter_rev.data)
+
+        # while normal gets always hand out copies
+        self.assertIsNot(self.node.get('/adapters/1'), adapter_rev.data)
+        self.assertEqual(self.node.get('/adapters/1'), adapter_rev.data)
+
+        # deep gets have to assemble a new message either way
+        self.assertEqual(self.node.get(deep=1, read_only=True),
+                         self.node.get(deep=1))
+        self.assertEqual(self.node.get(deep=1, read_only=True),
+                         self.base_deep)
+
     def test_deep_get(self):
         self.assertEqual(self.node.get(deep=True), self.base_deep)
 
@@ -486,6 +507,12 @@ class TestNodeOwnershipAndHooks(DeepTestsBase):
         # once registered, callback can touch up object
         self.assertEqual(proxy.get().state, HealthStatus.OVERLOADED)
 
+        # even read-only gets shall run the callback on a private copy
+        self.assertEqual(proxy.get(read_only=True).state,
+                         HealthStatus.OVERLOADED)
+        self.assertEqual(self.node.latest._children['health'][0].data.state,
+                         HealthStatus.DYING)
+
     def test_pre_update_hook(self):
 
         proxy = self.node.get_proxy('/adapters/1')
@@ -613,6 +640,25 @@ class TestTransactionalLogic(DeepTestsBase):
 
         tx.cancel()
 
+    def test_commit_purges_branches_of_unchanged_nodes(self):
+        proxy = self.node.get_proxy('/')
+        tx = proxy.open_transaction()
+        # updating to the same value gives the node a transaction branch
+        # without changing anything
+        tx.update('/adapters/2', tx.get('/adapters/2'))
+        self.make_change(tx, '/adapters/1', 'config.log_level', 0)
+        tx.commit()
+        self.assertEqual(self.node._dirty_nodes, {})
+        self.assertEqual(self.node.get('/adapters/1').config.log_level, 0)
+
+    def test_no_op_transaction_keeps_latest(self):
+        proxy = self.node.get_proxy('/')
+        tx = proxy.open_transaction()
+        tx.update('/adapters/2', tx.get('/adapters/2'))
+        tx.commit()
+        self.assertEqual(self.node.latest.hash, self.hash_orig)
+        self.assertEqual(len(self.node.revisions), 1)
+
     def test_cannot_reuse_tx(self):
         proxy = self.node.get_proxy('/')
         tx = proxy.open_transaction()
@@ -1170,5 +1216,42 @@ class TestTransactionalLogic(DeepTestsBase):
         post_remove.assert_called_once_with(ad)
 
 
+class TestHashBackends(TestCase):
+
+    def tearDown(self):
+        set_hash_backend()
+
+    def build_tree(self):
+        node = ConfigRoot(VolthaInstance(instance_id='1'))
+        for i in xrange(3):
+            node.add('/adapters', Adapter(id=str(i)))
+        return node
+
+    def test_default_backend(self):
+        self.assertEqual(get_hash_backend().name, 'md5')
+        self.assertEqual(len(self.build_tree().latest.hash), 12)
+
+    def test_all_backends(self):
+        for name in hash_backends():
+            set_hash_backend(name, digest_size=4)
+            node = self.build_tree()
+            hash0 = node.latest.hash
+            self.assertEqual(len(hash0), 8)
+            node.update('/adapters/1', Adapter(id='1', version='2'))
+            self.assertNotEqual(node.latest.hash, hash0)
+            node.update('/adapters/1', Adapter(id='1'))
+            self.assertEqual(node.latest.hash, hash0)
+
+    def test_fixed_size_digests_are_truncated(self):
+        for name in hash_backends():
+            backend = set_hash_backend(name, digest_size=6)
+            self.assertEqual(len(backend('data')), 12)
+
+    def test_bad_backend_config(self):
+        self.assertRaises(ValueError, set_hash_backend, 'no-such-hash')
+        self.assertRaises(ValueError, set_hash_backend, 'md5', 17)
+        self.assertRaises(ValueError, set_hash_backend, 'md5', 0)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from hashlib import md5
+from random import choice, randint, seed
+from unittest import main, TestCase
+
+from voltha.core.config.config_children import KeyedChildren, CHUNK_SIZE
+
+
+class FakeData(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeConfig(object):
+    def __init__(self, id):
+        self._data = FakeData(id)
+
+
+class FakeRev(object):
+    def __init__(self, id, version=0):
+        self._config = FakeConfig(id)
+        self.version = version
+        self._hash = md5('%s:%s' % (id, version)).hexdigest()[:12]
+
+
+class CollidingKey(object):
+    """Key with a forced hash value to exercise HAMT collision buckets"""
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'CollidingKey(%s)' % self.name
+
+
+class TestKeyedChildren(TestCase):
+
+    def assertMatches(self, children, reference):
+        self.assertEqual(len(children), len(reference))
+        self.assertEqual(children.keys(), reference.keys())
+        self.assertEqual(list(children), reference.values())
+        for i, rev in enumerate(reference.itervalues()):
+            self.assertIs(children[i], rev)
+        for key, rev in reference.iteritems():
+            self.assertTrue(children.has_key(key))
+            self.assertIs(children.get(key), rev)
+
+    def test_empty(self):
+        children = KeyedChildren()
+        self.assertEqual(len(children), 0)
+        self.assertEqual(list(children), [])
+        self.assertFalse(children.has_key('x'))
+        self.assertRaises(KeyError, children.get, 'x')
+        self.assertRaises(KeyError, children.remove, 'x')
+        self.assertRaises(IndexError, children.__getitem__, 0)
+
+    def test_from_revs(self):
+        revs = [FakeRev(str(i)) for i in xrange(100)]
+        children = KeyedChildren.from_revs('id', revs)
+        self.assertMatches(children, OrderedDict((r._config._data.id, r)
+                                                 for r in revs))
+        self.assertIs(children[-1], revs[-1])
+
+    def test_from_revs_rejects_duplicate_keys(self):
+        revs = [FakeRev('a'), FakeRev('b'), FakeRev('a')]
+        self.assertRaises(ValueError, KeyedChildren.from_revs, 'id', revs)
+
+    def test_set_keeps_position(self):
+        revs = [FakeRev(i) for i in xrange(10)]
+        children = KeyedChildren.from_revs('id', revs)
+        new_rev = FakeRev(5, version=1)
+        children2 = children.set(5, new_rev)
+        self.assertIs(children2[5], new_rev)
+        self.assertIs(children[5], revs[5])  # original is unchanged
+        self.assertEqual(children2.keys(), range(10))
+
+    def test_remove_and_re_add_goes_to_end(self):
+        children = KeyedChildren.from_revs(
+            'id', [FakeRev(i) for i in xrange(5)])
+        children = children.remove(2)
+        self.assertEqual(children.keys(), [0, 1, 3, 4])
+        children = children.set(2, FakeRev(2))
+        self.assertEqual(children.keys(), [0, 1, 3, 4, 2])
+
+    def test_equality(self):
+        revs = [FakeRev(i) for i in xrange(5)]
+        children1 = KeyedChildren.from_revs('id', revs)
+        children2 = KeyedChildren.from_revs('id', revs)
+        self.assertEqual(children1, children2)
+        self.assertNotEqual(children1, children1.remove(3))
+        self.assertNotEqual(children1, children1.set(3, FakeRev(3)))
+
+    def test_hash_collisions(self):
+        keys = [CollidingKey(str(i)) for i in xrange(10)]
+        children = KeyedChildren()
+        reference = OrderedDict()
+        for key in keys:
+            rev = FakeRev(key)
+            children = children.set(key, rev)
+            reference[key] = rev
+        self.assertMatches(children, reference)
+        for key in keys[::2]:
+            children = children.remove(key)
+            del reference[key]
+        self.assertMatches(children, reference)
+
+    def test_random_operations_against_reference(self):
+        seed(0)
+        children = KeyedChildren()
+        reference = OrderedDict()
+        snapshots = []
+        for i in xrange(20 * CHUNK_SIZE * CHUNK_SIZE / 10):
+            op = randint(0, 9)
+            if op < 5 or not reference:
+                key = randint(0, 2000)
+                rev = FakeRev(key, version=i)
+                children = children.set(key, rev)
+                reference[key] = rev
+            elif op < 8:
+                key = choice(reference.keys())
+                children = children.remove(key)
+                del reference[key]
+            else:
+                key = choice(reference.keys())
+                rev = FakeRev(key, version=i)
+                children = children.set(key, rev)
+                reference[key] = rev
+            if i % 200 == 0:
+                snapshots.append((children, OrderedDict(reference)))
+        self.assertMatches(children, reference)
+
+        # older versions must not have been affected by later operations
+        for old_children, old_reference in snapshots:
+            self.assertMatches(old_children, old_reference)
+
+        # and we shall be able to drain the container completely
+        for key in reference.keys():
+            children = children.remove(key)
+        self.assertEqual(len(children), 0)
+        self.assertEqual(list(children), [])
+
+    def test_hash_depends_on_content_only(self):
+        revs = [FakeRev(i) for i in xrange(5 * CHUNK_SIZE)]
+
+        # build the same content through a very different history, which
+        # yields a different tree shape
+        children = KeyedChildren()
+        for rev in reversed(revs):
+            children = children.set(rev._config._data.id, FakeRev(-1))
+        for rev in revs:
+            children = children.remove(rev._config._data.id)
+        for rev in revs:
+            children = children.set(rev._config._data.id, rev)
+
+        bulk = KeyedChildren.from_revs('id', revs)
+        self.assertEqual(children.hash, bulk.hash)
+        self.assertNotEqual(KeyedChildren().hash, bulk.hash)
+
+    def test_hash_tracks_changes(self):
+        revs = [FakeRev(i) for i in xrange(3 * CHUNK_SIZE)]
+        children = KeyedChildren.from_revs('id', revs)
+        hash0 = children.hash
+
+        updated = children.set(7, FakeRev(7, version=1))
+        self.assertNotEqual(updated.hash, hash0)
+        self.assertEqual(updated.set(7, revs[7]).hash, hash0)
+        self.assertEqual(children.hash, hash0)
+
+        # order matters
+        reordered = children.remove(0).set(0, revs[0])
+        self.assertNotEqual(reordered.hash, hash0)
+
+        shrunk = children.remove(CHUNK_SIZE)
+        self.assertNotEqual(shrunk.hash, hash0)
+        self.assertEqual(shrunk.hash, KeyedChildren.from_revs(
+            'id', revs[:CHUNK_SIZE] + revs[CHUNK_SIZE + 1:]).hash)
+
+    def assertDiffMatches(self, children1, children2):
+        ref1 = OrderedDict(children1.iteritems())
+        ref2 = OrderedDict(children2.iteritems())
+        added = [k for k in ref2 if k not in ref1]
+        removed = [k for k in ref1 if k not in ref2]
+        changed = [k for k, rev in ref1.iteritems()
+                   if k in ref2 and ref2[k]._hash != rev._hash]
+        diff = children1.diff(children2)
+        self.assertEqual(diff[0], added)
+        self.assertEqual(diff[1], removed)
+        self.assertEqual(sorted(diff[2]), sorted(changed))
+
+    def test_diff(self):
+        seed(1)
+        base = KeyedChildren.from_revs(
+            'id', [FakeRev(i) for i in xrange(10 * CHUNK_SIZE)])
+        self.assertEqual(base.diff(base), ([], [], []))
+        for n_ops in (1, 5, 50, 500):
+            children = base
+            for i in xrange(n_ops):
+                op = randint(0, 2)
+                key = randint(0, 12 * CHUNK_SIZE)
+                if op == 0 and children.has_key(key):
+                    children = children.remove(key)
+                else:
+                    children = children.set(key, FakeRev(key, version=i))
+            self.assertDiffMatches(base, children)
+            self.assertDiffMatches(children, base)
+
+    def test_diff_of_removed_and_readded_keys(self):
+        revs = [FakeRev(i) for i in xrange(5)]
+        base = KeyedChildren.from_revs('id', revs)
+        same = base.remove(2).set(2, revs[2])
+        self.assertEqual(base.diff(same), ([], [], []))
+        changed = base.remove(2).set(2, FakeRev(2, version=1))
+        self.assertEqual(base.diff(changed), ([], [], [2]))
+
+    def test_diff_of_unrelated_containers(self):
+        children1 = KeyedChildren.from_revs(
+            'id', [FakeRev(i) for i in xrange(100)])
+        children2 = KeyedChildren.from_revs(
+            'id', [FakeRev(i) for i in reversed(xrange(50, 150))])
+        self.assertDiffMatches(children1, children2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import gc
+from unittest import main, TestCase
+
+from twisted.internet.task import Clock
+
+from voltha.core.config.config_gc import PersistedRevisionCollector
+from voltha.core.config.config_root import ConfigRoot
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, AdapterConfig
+
+
+class TestPersistedRevisionCollector(TestCase):
+
+    def setUp(self):
+        self.kv_store = dict()
+        # written through, for the store to reflect the tree at all times,
+        # and collected by the tests
+        self.node = ConfigRoot(
+            VolthaInstance(instance_id='1'), kv_store=self.kv_store,
+            persistence=dict(write_behind=dict(enabled=False),
+                             gc=dict(enabled=False)))
+        for i in xrange(20):
+            self.node.add('/adapters', Adapter(
+                id=str(i), config=AdapterConfig(log_level=i % 4)))
+
+    def tearDown(self):
+        # revisions still alive are never reclaimed, so make sure our tree
+        # does not linger on into other tests
+        del self.node
+        gc.collect()
+
+    def reachable_blobs(self):
+        keys = set()
+        to_visit = [self.node.latest]
+        while to_visit:
+            rev = to_visit.pop()
+            keys.update((rev.hash, rev._config._hash))
+            for children in rev._children.itervalues():
+                to_visit.extend(children)
+        return keys
+
+    def test_nothing_reclaimed_while_history_is_kept(self):
+        size = len(self.kv_store)
+        collector = PersistedRevisionCollector(self.node)
+        collector.collect()
+        self.assertEqual(len(self.kv_store), size)
+        self.assertEqual(collector.reclaimed_blobs, 0)
+        self.assertEqual(collector.cycles, 1)
+
+    def test_reclaims_pruned_revisions(self):
+        size = len(self.kv_store)
+        self.node.prune_untagged()
+        gc.collect()
+        # without the collector, nothing is removed from the store
+        self.assertEqual(len(self.kv_store), size)
+
+        reclaimable_bytes = sum(
+            len(blob) for key, blob in self.kv_store.iteritems()
+            if key != 'root' and key not in self.reachable_blobs())
+        collector = PersistedRevisionCollector(self.node)
+        collector.collect()
+
+        self.assertEqual(set(self.kv_store),
+                         self.reachable_blobs() | {'root'})
+        self.assertEqual(collector.reclaimed_blobs,
+                         size - len(self.kv_store))
+        self.assertEqual(collector.reclaimed_bytes, reclaimable_bytes)
+
+        reloaded = ConfigRoot.load(VolthaInstance, self.kv_store)
+        self.assertEqual(reloaded.get(deep=1), self.node.get(deep=1))
+        reloaded.close()
+
+    def test_incremental_collection_on_clock(self):
+        clock = Clock()
+        collector = PersistedRevisionCollector(
+            self.node, time_budget=0, interval=1, clock=clock).start()
+        self.node.prune_untagged()
+        gc.collect()
+
+        # a zero time budget still makes some progress per tick
+        clock.advance(1)
+        self.assertEqual(collector.cycles, 0)
+
+        # changes made while the cycle is in progress must survive
+        self.node.update('/adapters/3', Adapter(id='3', version='new'))
+        self.node.prune_untagged()
+        while not collector.cycles:
+            clock.advance(1)
+        collector.stop()
+
+        for key in self.reachable_blobs():
+            self.assertTrue(key in self.kv_store)
+        reloaded = ConfigRoot.load(VolthaInstance, self.kv_store)
+        self.assertEqual(reloaded.get('/adapters/3').version, 'new')
+        self.assertGreater(collector.reclaimed_blobs, 0)
+        reloaded.close()
+
+
+    def mk_collected_root(self, clock):
+        kv_store = dict()
+        root = ConfigRoot(
+            VolthaInstance(instance_id='1'), kv_store=kv_store,
+            persistence=dict(write_behind=dict(clock=clock),
+                             gc=dict(interval=1, time_budget=0.01,
+                                     clock=clock)))
+        for i in xrange(20):
+            root.add('/adapters', Adapter(id=str(i)))
+        root.prune_untagged()
+        gc.collect()
+        return root, kv_store
+
+    def test_config_root_collects_in_the_background(self):
+        clock = Clock()
+        root, kv_store = self.mk_collected_root(clock)
+        root.flush()
+        size = len(kv_store)
+        self.assertEqual(root.persistence_stats()['gc']['cycles'], 0)
+        while not root.persistence_stats()['gc']['cycles']:
+            clock.advance(1)
+        stats = root.persistence_stats()['gc']
+        self.assertGreater(stats['reclaimed_blobs'], 0)
+        self.assertGreater(stats['reclaimed_bytes'], 0)
+
+        # closing the root stops the collector, and flushes the deletes
+        root.close()
+        self.assertEqual(clock.getDelayedCalls(), [])
+        self.assertEqual(len(kv_store), size - stats['reclaimed_blobs'])
+        reloaded = ConfigRoot.load(VolthaInstance, kv_store,
+                                   persistence=dict(gc=dict(enabled=False)))
+        self.assertEqual(reloaded.get(deep=1), root.get(deep=1))
+        reloaded.close()
+
+    def test_loaded_config_root_is_collected(self):
+        clock = Clock()
+        root, kv_store = self.mk_collected_root(clock)
+        root.close()
+        loaded = ConfigRoot.load(
+            VolthaInstance, kv_store,
+            persistence=dict(write_behind=dict(clock=clock),
+                             gc=dict(interval=1, clock=clock)))
+        self.assertEqual(loaded.persistence_stats()['gc']['cycles'], 0)
+        clock.advance(1)
+        self.assertEqual(loaded.persistence_stats()['gc']['cycles'], 1)
+        loaded.close()
+
+    def test_collector_stops_with_dropped_root(self):
+        clock = Clock()
+        root, kv_store = self.mk_collected_root(clock)
+        self.assertEqual(len(clock.getDelayedCalls()), 2)  # gc and flush
+        del root
+        gc.collect()
+        clock.advance(1)
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+
+if __name__ == '__main__':
+    main()
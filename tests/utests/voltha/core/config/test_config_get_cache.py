@@ -0,0 +1,149 @@
+from unittest import main, TestCase
+
+from voltha.core.config.config_get_cache import ConfigGetCache, get_cache, \
+    pack_items
+from voltha.core.config.config_proxy import CallbackType
+from voltha.core.config.config_root import ConfigRoot
+from voltha.protos import third_party
+from voltha.protos.device_pb2 import Device, Devices
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, Adapters, \
+    AdapterConfig
+
+_ = third_party
+
+
+class TestConfigGetCache(TestCase):
+
+    def setUp(self):
+        self.node = ConfigRoot(VolthaInstance(
+            instance_id='1',
+            adapters=[Adapter(id=str(i), vendor='x' * 100,
+                              config=AdapterConfig(log_level=3))
+                      for i in xrange(5)]
+        ))
+        get_cache.clear()
+
+    def test_hits_and_misses(self):
+        cache = ConfigGetCache()
+        rev = self.node.latest
+
+        blob = cache.get(rev, 1)
+        self.assertEqual(blob, self.node.get(depth=1).SerializeToString())
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        self.assertIs(cache.get(rev, 1), blob)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # depth is part of the key; negative depths are all the same
+        cache.get(rev, 0)
+        cache.get(rev, None)
+        cache.get(rev, -1)
+        cache.get(rev, -5)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        self.assertEqual(len(cache), 3)
+
+    def test_size_bounded_lru_eviction(self):
+        revs = list(self.node.latest._children['adapters'])
+        blob_size = len(revs[0].get(0).SerializeToString())
+        cache = ConfigGetCache(max_size=3 * blob_size)
+
+        for rev in revs[:3]:
+            cache.get(rev, 0)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.size, 3 * blob_size)
+
+        cache.get(revs[0], 0)  # refresh, so that revs[1] is the oldest
+        cache.get(revs[3], 0)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size, 3 * blob_size)
+
+        hits = cache.hits
+        cache.get(revs[0], 0)
+        self.assertEqual(cache.hits, hits + 1)
+        cache.get(revs[1], 0)
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_oversized_results_are_not_cached(self):
+        cache = ConfigGetCache(max_size=10)
+        cache.get(self.node.latest, -1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_serialized_get(self):
+        self.assertEqual(
+            self.node.get('/adapters/2', serialized=True),
+            self.node.get('/adapters/2').SerializeToString())
+        self.assertEqual(
+            self.node.get(depth=-1, serialized=True),
+            self.node.get(deep=1).SerializeToString())
+        self.assertEqual(
+            pack_items(Adapters, self.node.get('/adapters', serialized=True)),
+            Adapters(items=self.node.get('/adapters')))
+
+        misses = get_cache.misses
+        self.node.get('/adapters/2', serialized=True)
+        self.assertEqual(get_cache.misses, misses)
+
+        # updates yield new revisions, hence new cache keys
+        self.node.update('/adapters/2', Adapter(id='2', version='2'))
+        self.assertEqual(
+            Adapter.FromString(self.node.get('/adapters/2', serialized=True)),
+            Adapter(id='2', version='2'))
+        self.assertEqual(get_cache.misses, misses + 1)
+
+    def test_serialized_get_with_get_callback(self):
+
+        def augment(msg):
+            msg.version = 'augmented'
+            return msg
+
+        proxy = self.node.get_proxy('/adapters/1')
+        proxy.register_callback(CallbackType.GET, augment)
+        blob = self.node.get('/adapters/1', serialized=True)
+        self.assertEqual(Adapter.FromString(blob).version, 'augmented')
+        self.assertEqual(len(get_cache), 0)
+
+    def test_packed_get(self):
+        for i in xrange(10):
+            self.node.add('/devices', Device(id=str(i), type='simulated_olt'))
+
+        # the way ListDevices polls
+        devices = self.node.get('/devices', packed=Devices)
+        self.assertEqual(devices, Devices(items=self.node.get('/devices')))
+        hits, misses = get_cache.hits, get_cache.misses
+        for _ in xrange(5):
+            self.assertIs(self.node.get('/devices', packed=Devices), devices)
+        self.assertEqual(get_cache.hits, hits + 5)
+        self.assertEqual(get_cache.misses, misses)
+
+        # a change elsewhere in the tree does not affect the container
+        self.node.update('/adapters/2', Adapter(id='2', version='2'))
+        self.assertIs(self.node.get('/devices', packed=Devices), devices)
+
+        # a changed item yields a new list, with only that item serialized
+        self.node.update('/devices/3', Device(id='3', type='other'))
+        misses = get_cache.misses
+        devices = self.node.get('/devices', packed=Devices)
+        self.assertEqual(devices.items[3].type, 'other')
+        self.assertEqual(get_cache.misses, misses + 2)
+
+        self.assertEqual(self.node.get('/adapters', packed=Adapters),
+                         Adapters(items=self.node.get('/adapters')))
+
+    def test_packed_get_with_get_callback(self):
+        self.node.get('/adapters', packed=Adapters)
+
+        def augment(msg):
+            msg.version = 'augmented'
+            return msg
+
+        # registering the callback drops the list cached without it
+        proxy = self.node.get_proxy('/adapters/1')
+        proxy.register_callback(CallbackType.GET, augment)
+        for _ in xrange(2):
+            adapters = self.node.get('/adapters', packed=Adapters)
+            self.assertEqual(adapters.items[1].version, 'augmented')
+
+
+if __name__ == '__main__':
+    main()
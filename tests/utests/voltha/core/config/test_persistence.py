@@ -3,6 +3,7 @@ from random import randint, seed
 from time import time
 from unittest import main, TestCase
 
+from voltha.core.config.config_gc import PersistedRevisionCollector
 from voltha.core.config.config_root import ConfigRoot
 from voltha.protos.openflow_13_pb2 import ofp_desc
 from voltha.protos.voltha_pb2 import VolthaInstance, HealthStatus, Adapter, \
@@ -13,6 +14,20 @@ n_adapters = 1000
 n_logical_nodes = 1000
 
 
+class CountingStore(dict):
+    """Dict based KV store counting the (bulk) fetches made"""
+
+    def __init__(self, *args, **kw):
+        super(CountingStore, self).__init__(*args, **kw)
+        self.gets = 0
+        self.bulk_gets = 0
+
+    def get_many(self, keys):
+        self.bulk_gets += 1
+        self.gets += len(keys)
+        return [self[key] for key in keys]
+
+
 class TestPersistence(TestCase):
 
     def pump_some_data(self, node):
@@ -43,6 +58,18 @@ class TestPersistence(TestCase):
                 )
             ))
 
+    def reachable_blobs(self, node):
+        keys = {'root'}
+        to_visit = [node.latest]
+        while to_visit:
+            rev = to_visit.pop()
+            keys.update((rev.hash, rev._config.hash))
+            for children in rev._children.itervalues():
+                to_visit.extend(children)
+        self.assertEqual(len(keys),
+                         5 + 2 * (1 + 1 + n_adapters + n_logical_nodes))
+        return keys
+
     def test_inmemory_kv_store(self):
         t0 = [time()]
         def pt(msg=''):
@@ -52,10 +79,15 @@ class TestPersistence(TestCase):
 
         kv_store = dict()
 
-        # create node and pump data
-        node = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+        # create node and pump data; revisions alive anywhere in the process
+        # keep their blobs, so start from a state no other test tree shares
+        node = ConfigRoot(VolthaInstance(
+            instance_id='persistence',
+            health=HealthStatus(state=HealthStatus.DYING)
+        ), kv_store=kv_store)
         pt('init')
         self.pump_some_data(node)
+        node.flush()
         pt('pump')
 
         # check that content of kv_store looks ok
@@ -64,16 +96,22 @@ class TestPersistence(TestCase):
 
         # this should actually drop if we pune
         node.prune_untagged()
+        PersistedRevisionCollector(node).collect()
+        node.flush()
         pt('prunning')
 
+        # all that is left is the latest tree
         size2 = len(kv_store)
-        self.assertEqual(size2, 7 + 2 * (1 + 1 + n_adapters + n_logical_nodes))
+        self.assertEqual(size2, 5 + 2 * (1 + 1 + n_adapters + n_logical_nodes))
+        self.assertEqual(self.reachable_blobs(node), set(kv_store))
         all_latest_data = node.get('/', deep=1)
+        latest_hash = node.latest.hash
         pt('deep get')
 
         # save dict so that deleting the node will not wipe it
         kv_store = copy(kv_store)
         pt('copy kv store')
+        node.close()
         del node
         pt('delete node')
         # self.assertEqual(size2, 1 + 2 * (1 + 1 + n_adapters + n_logical_nodes))
@@ -82,7 +120,72 @@ class TestPersistence(TestCase):
         node = ConfigRoot.load(VolthaInstance, kv_store)
         pt('load from kv store')
         self.assertEqual(node.get('/', deep=1), all_latest_data)
+        self.assertEqual(node.latest.hash, latest_hash)
         pt('deep get')
+        node.close()
+
+    def test_bulk_load(self):
+        kv_store = CountingStore()
+        node = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+        self.pump_some_data(node)
+        node.prune_untagged()
+        PersistedRevisionCollector(node).collect()
+        node.flush()
+
+        kv_store.gets = kv_store.bulk_gets = 0
+        loaded = ConfigRoot.load(VolthaInstance, kv_store)
+        self.assertEqual(loaded.get('/', deep=1), node.get('/', deep=1))
+        self.assertEqual(loaded.latest.hash, node.latest.hash)
+
+        # one bulk fetch for the revisions and one for the config data of
+        # each level of the tree (config data shared with the original tree
+        # is not fetched again)
+        self.assertLessEqual(kv_store.bulk_gets, 2 * 4)
+        self.assertLess(kv_store.gets, len(kv_store))
+        node.close()
+        loaded.close()
+
+    def test_lazy_load(self):
+        kv_store = CountingStore()
+        node = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+        self.pump_some_data(node)
+        node.prune_untagged()
+        PersistedRevisionCollector(node).collect()
+        node.close()
+        all_latest_data = node.get('/', deep=1)
+        latest_hash = node.latest.hash
+        del node
+
+        kv_store.gets = kv_store.bulk_gets = 0
+        loaded = ConfigRoot.load(VolthaInstance, kv_store, lazy=True)
+        self.assertLessEqual(kv_store.bulk_gets, 2)  # rev and config data
+        self.assertEqual(loaded.get('/').instance_id, '1')
+
+        # first access of a subtree loads just the level below
+        self.assertEqual(loaded.get('/adapters/7').id, '7')
+        gets = kv_store.gets
+        self.assertEqual(loaded.get('/logical_devices/3').id, '3')
+        self.assertEqual(kv_store.gets, gets)
+
+        # unloaded subtrees survive garbage collection
+        PersistedRevisionCollector(loaded).collect()
+        self.assertEqual(loaded.get('/', deep=1), all_latest_data)
+        self.assertEqual(loaded.latest.hash, latest_hash)
+        loaded.close()
+
+    def test_changes_after_load_are_persisted(self):
+        kv_store = dict()
+        node = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+        node.update('/', VolthaInstance(instance_id='1'))
+        node.close()
+        del node
+
+        loaded = ConfigRoot.load(VolthaInstance, kv_store)
+        loaded.update('/', VolthaInstance(instance_id='2'))
+        loaded.close()
+        reloaded = ConfigRoot.load(VolthaInstance, kv_store)
+        self.assertEqual(reloaded.get('/').instance_id, '2')
+        reloaded.close()
 
 
 if __name__ == '__main__':
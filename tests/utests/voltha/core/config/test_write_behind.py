@@ -0,0 +1,166 @@
+from unittest import main, TestCase
+
+from twisted.internet.task import Clock
+
+from voltha.core.config.config_root import ConfigRoot
+from voltha.core.config.config_write_behind import WriteBehindKVStore
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, AdapterConfig
+
+
+class RecordingStore(dict):
+    """Dict based store recording the bulk operations applied to it"""
+
+    def __init__(self):
+        super(RecordingStore, self).__init__()
+        self.ops = []
+
+    def put_many(self, items):
+        self.ops.append(('put', [k for k, _ in items]))
+        self.update(items)
+
+    def delete_many(self, keys):
+        self.ops.append(('delete', list(keys)))
+        for key in keys:
+            self.pop(key, None)
+
+
+class TestWriteBehindKVStore(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.backend = RecordingStore()
+        self.store = WriteBehindKVStore(
+            self.backend, flush_interval=0.5, max_pending=100,
+            clock=self.clock)
+
+    def test_writes_are_deferred_to_the_flush_window(self):
+        self.store['a'] = '1'
+        self.store['root'] = 'r1'
+        self.store['b'] = '2'
+        self.store['root'] = 'r2'
+        self.assertEqual(self.backend, {})
+
+        # buffered data is visible through the store
+        self.assertEqual(self.store['a'], '1')
+        self.assertEqual(self.store['root'], 'r2')
+        self.assertTrue('b' in self.store)
+
+        self.clock.advance(0.5)
+        self.assertEqual(self.backend, dict(a='1', b='2', root='r2'))
+        # one bulk write for the blobs, then the root pointer
+        self.assertEqual(self.backend.ops,
+                         [('put', ['a', 'b']), ('put', ['root'])])
+        self.assertEqual(self.store.flushes, 1)
+        self.assertEqual(self.store.pending, 0)
+
+    def test_size_triggered_flush(self):
+        for i in xrange(100):
+            self.store[str(i)] = 'x'
+        self.assertEqual(len(self.backend), 100)
+        self.assertEqual(self.store.flushes, 1)
+
+    def test_deletes_are_applied_after_root(self):
+        self.backend.update(dict(a='1', root='r1'))
+        del self.store['a']
+        self.store['b'] = '2'
+        self.store['root'] = 'r2'
+        self.assertFalse('a' in self.store)
+        self.assertRaises(KeyError, self.store.__getitem__, 'a')
+        self.store.flush()
+        self.assertEqual(self.backend.ops, [
+            ('put', ['b']), ('put', ['root']), ('delete', ['a'])])
+        self.assertEqual(self.backend, dict(b='2', root='r2'))
+
+    def test_delete_then_set_again(self):
+        self.backend['a'] = '1'
+        del self.store['a']
+        self.store['a'] = '1'
+        self.store.flush()
+        self.assertEqual(self.backend, dict(a='1'))
+
+    def test_plain_dict_backend(self):
+        backend = dict(old='x')
+        store = WriteBehindKVStore(backend, flush_interval=None)
+        store['a'] = '1'
+        del store['old']
+        del store['never-flushed']
+        self.assertEqual(backend, dict(old='x'))
+        store.flush()
+        self.assertEqual(backend, dict(a='1'))
+
+    def test_config_root_on_write_behind_store(self):
+        store = WriteBehindKVStore(self.backend, flush_interval=0.5,
+                                   clock=self.clock)
+        root = ConfigRoot(VolthaInstance(instance_id='1'), kv_store=store)
+        for i in xrange(10):
+            root.add('/adapters', Adapter(
+                id=str(i), config=AdapterConfig(log_level=i % 4)))
+        self.assertEqual(self.backend, {})
+
+        self.clock.advance(0.5)
+        self.assertEqual(store.pending, 0)
+        # everything, root last, in a single flush
+        self.assertEqual(self.backend.ops[-1], ('put', ['root']))
+        self.assertEqual(store.flushes, 1)
+
+        reloaded = ConfigRoot.load(VolthaInstance, kv_store=self.backend)
+        self.assertEqual(reloaded.get('/', deep=1), root.get('/', deep=1))
+        root.close()
+        reloaded.close()
+
+    def test_config_root_wraps_its_kv_store(self):
+        persistence = dict(write_behind=dict(
+            flush_interval=0.5, max_pending=10000, clock=self.clock))
+        root = ConfigRoot(VolthaInstance(instance_id='1'),
+                          kv_store=self.backend, persistence=persistence)
+        self.assertTrue(isinstance(root.kv_store, WriteBehindKVStore))
+
+        # a burst of changes ends up in a single bulk write plus the root
+        for i in xrange(200):
+            root.add('/adapters', Adapter(
+                id=str(i), config=AdapterConfig(log_level=i % 4)))
+        self.assertEqual(self.backend, {})
+        self.clock.advance(0.5)
+        self.assertEqual([op for op, _ in self.backend.ops], ['put', 'put'])
+        self.assertEqual(self.backend.ops[-1], ('put', ['root']))
+
+        # so does a tree loaded from the store
+        loaded = ConfigRoot.load(VolthaInstance, self.backend,
+                                 persistence=persistence)
+        self.assertEqual(loaded.get('/', deep=1), root.get('/', deep=1))
+        loaded.update('/adapters/3', Adapter(id='3', version='new'))
+        self.assertEqual(len(self.backend.ops), 2)
+        self.clock.advance(0.5)
+        self.assertEqual(self.backend.ops[-1], ('put', ['root']))
+        reloaded = ConfigRoot.load(VolthaInstance, self.backend)
+        self.assertEqual(reloaded.get('/adapters/3').version, 'new')
+        for tree in (root, loaded, reloaded):
+            tree.close()
+
+    def test_config_root_close_flushes_root_last(self):
+        root = ConfigRoot(
+            VolthaInstance(instance_id='1'), kv_store=self.backend,
+            persistence=dict(write_behind=dict(
+                flush_interval=0.5, clock=self.clock)))
+        root.update('/', VolthaInstance(instance_id='2'))
+        root.close()
+        self.assertEqual(self.backend.ops[-1], ('put', ['root']))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        reloaded = ConfigRoot.load(VolthaInstance, self.backend)
+        self.assertEqual(reloaded.get('/').instance_id, '2')
+        reloaded.close()
+
+    def test_config_root_write_through(self):
+        root = ConfigRoot(
+            VolthaInstance(instance_id='1'), kv_store=self.backend,
+            persistence=dict(write_behind=dict(enabled=False)))
+        self.assertTrue(root.kv_store is self.backend)
+        root.update('/', VolthaInstance(instance_id='2'))
+        reloaded = ConfigRoot.load(VolthaInstance, self.backend)
+        self.assertEqual(reloaded.get('/').instance_id, '2')
+        root.close()
+        reloaded.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+from unittest import TestCase, main
+
+from mock import Mock
+from twisted.internet.defer import Deferred, fail
+
+from voltha.core.device_agent import DeviceAgent
+from voltha.core.flow_decomposer import *
+from voltha.protos import third_party
+from voltha.protos.device_pb2 import Device, DeviceType
+from voltha.protos.openflow_13_pb2 import Flows, FlowGroups
+
+_ = third_party
+
+
+class TestDeviceAgent(TestCase):
+
+    def setUp(self):
+        self.device = Device(id='olt', type='olt_type')
+        self.device_type = DeviceType(
+            id='olt_type', accepts_bulk_flow_update=True,
+            accepts_add_remove_flow_updates=True)
+
+        self.core = Mock()
+        device_type_proxy = Mock()
+        device_type_proxy.get = lambda: self.device_type
+        self.core.get_proxy = lambda path: \
+            device_type_proxy if path.startswith('/device_types') else Mock()
+
+        self.agent = DeviceAgent(self.core, self.device)
+        self.agent.last_data = self.device
+        self.agent.adapter_agent = Mock()
+
+        self.flows = [
+            mk_flow_stat(match_fields=[in_port(i)], actions=[output(i + 1)])
+            for i in range(4)
+        ]
+
+    def changes(self):
+        update = self.agent.adapter_agent.update_flows_incrementally
+        self.assertEqual(update.call_count, 1)
+        kw = update.call_args[1]
+        update.reset_mock()
+        return kw['flow_changes'], kw['group_changes']
+
+    def test_flow_changes_are_passed_down(self):
+        self.agent._flow_table_updated(Flows(items=self.flows[:3]))
+        flow_changes, group_changes = self.changes()
+        self.assertEqual(list(flow_changes.to_add.items), self.flows[:3])
+        self.assertEqual(len(flow_changes.to_remove.items), 0)
+        self.assertEqual(len(group_changes.to_add.items), 0)
+
+        modified = mk_flow_stat(match_fields=[in_port(0)],
+                                actions=[output(7)])
+        self.assertEqual(modified.id, self.flows[0].id)
+        self.agent._flow_table_updated(Flows(
+            items=[modified, self.flows[1], self.flows[3]]))
+        flow_changes, _ = self.changes()
+        self.assertEqual(list(flow_changes.to_add.items),
+                         [modified, self.flows[3]])
+        self.assertEqual(list(flow_changes.to_remove.items),
+                         [self.flows[0], self.flows[2]])
+
+        self.agent.adapter_agent.update_flows_bulk.assert_not_called()
+
+    def test_group_changes_are_passed_down(self):
+        group = mk_group_stat(group_id=1, buckets=[])
+        self.agent._group_table_updated(FlowGroups(items=[group]))
+        flow_changes, group_changes = self.changes()
+        self.assertEqual(list(group_changes.to_add.items), [group])
+        self.assertEqual(len(flow_changes.to_add.items), 0)
+
+        self.agent._group_table_updated(FlowGroups())
+        _, group_changes = self.changes()
+        self.assertEqual(list(group_changes.to_remove.items), [group])
+
+    def test_no_changes_are_not_passed_down(self):
+        self.agent._flow_table_updated(Flows(items=self.flows))
+        self.changes()
+        self.agent._flow_table_updated(Flows(items=self.flows))
+        self.agent.adapter_agent.update_flows_incrementally.assert_not_called()
+
+    def test_failed_changes_are_passed_down_again(self):
+        update = self.agent.adapter_agent.update_flows_incrementally
+        update.return_value = fail(RuntimeError('adapter failed'))
+        errors = []
+        self.agent._flow_table_updated(
+            Flows(items=self.flows[:2])).addErrback(errors.append)
+        self.changes()
+        self.assertEqual(len(errors), 1)
+
+        update.return_value = None
+        self.agent._flow_table_updated(Flows(items=self.flows[1:3]))
+        flow_changes, _ = self.changes()
+        self.assertEqual(list(flow_changes.to_add.items), self.flows[1:3])
+        self.assertEqual(len(flow_changes.to_remove.items), 0)
+
+    def test_changes_are_kept_until_the_adapter_is_done(self):
+        update = self.agent.adapter_agent.update_flows_incrementally
+        update.return_value = d = Deferred()
+        self.agent._flow_table_updated(Flows(items=self.flows[:2]))
+        self.changes()
+        d.callback(None)
+
+        update.return_value = None
+        self.agent._flow_table_updated(Flows(items=self.flows[:3]))
+        flow_changes, _ = self.changes()
+        self.assertEqual(list(flow_changes.to_add.items), [self.flows[2]])
+
+    def test_overlapping_changes_are_passed_down_in_turn(self):
+        update = self.agent.adapter_agent.update_flows_incrementally
+        d1, d2 = Deferred(), Deferred()
+        update.side_effect = [d1, d2, None]
+        self.agent._flow_table_updated(Flows(items=self.flows[:2]))
+        self.agent._flow_table_updated(Flows(items=self.flows[:3]))
+        self.agent._flow_table_updated(Flows(items=self.flows[:1]))
+
+        # the second update waits for the first one
+        flow_changes, _ = self.changes()
+        self.assertEqual(list(flow_changes.to_add.items), self.flows[:2])
+        d1.callback(None)
+        flow_changes, _ = self.changes()
+        self.assertEqual(list(flow_changes.to_add.items), [self.flows[2]])
+        d2.callback(None)
+        flow_changes, _ = self.changes()
+        self.assertEqual(len(flow_changes.to_add.items), 0)
+        self.assertEqual(list(flow_changes.to_remove.items), self.flows[1:3])
+
+    def test_flow_stats_of_removed_flows_are_dropped(self):
+        self.agent._flow_table_updated(Flows(items=self.flows))
+        self.agent.flow_stats.update_all(
+            (f.id, 1, 64) for f in self.flows)
+        self.agent._flow_table_updated(Flows(items=self.flows[1:]))
+        self.assertNotIn(self.flows[0].id, self.agent.flow_stats)
+        self.assertEqual(self.agent.flow_stats.get(self.flows[1].id), (1, 64))
+
+    def test_bulk_update(self):
+        self.device_type.accepts_add_remove_flow_updates = False
+        self.agent._flow_table_updated(Flows(items=self.flows))
+        self.assertEqual(
+            self.agent.adapter_agent.update_flows_bulk.call_count, 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+from random import Random
+from unittest import TestCase, main
+
+from voltha.core.flow_classifier import FlowClassifier, match_covers, \
+    match_fields
+from voltha.core.flow_decomposer import *
+from voltha.protos import third_party
+
+_ = third_party
+
+
+def masked(field, **mask):
+    field.has_mask = True
+    for name, value in mask.iteritems():
+        setattr(field, name, value)
+    return field
+
+
+def overlap(flow1, flow2):
+    """Brute force reference: a packet may match both flows"""
+    if flow1.table_id != flow2.table_id or flow1.priority != flow2.priority:
+        return False
+    fields1 = match_fields(flow1.match)
+    fields2 = match_fields(flow2.match)
+    for field_type, (value, mask) in fields1.iteritems():
+        if field_type in fields2:
+            value2, mask2 = fields2[field_type]
+            if value & mask2 != value2 & mask:
+                return False
+    return True
+
+
+class TestFlowClassifier(TestCase):
+
+    def mk_flow(self, match_fields, priority=1000, table_id=0):
+        return mk_flow_stat(priority=priority, table_id=table_id,
+                            match_fields=match_fields, actions=[output(1)])
+
+    def test_match_covers(self):
+        flow = self.mk_flow([in_port(1), vlan_vid(4096 + 10),
+                             ipv4_dst(0x0a000001)])
+        self.assertTrue(match_covers(ofp.ofp_match(), flow.match))
+        for fields, expected in [
+            ([in_port(1)], True),
+            ([in_port(2)], False),
+            ([in_port(1), vlan_vid(4096 + 10)], True),
+            ([eth_type(0x800)], False),
+            ([masked(ipv4_dst(0x0a000000), ipv4_dst_mask=0xff000000)], True),
+            ([masked(ipv4_dst(0x0b000000), ipv4_dst_mask=0xff000000)], False),
+            ([masked(ipv4_dst(0x0a000001), ipv4_dst_mask=0xffffffff)], True)
+        ]:
+            mod = mk_simple_flow_mod(match_fields=fields, actions=[])
+            self.assertEqual(match_covers(mod.match, flow.match), expected)
+
+        # a masked field does not cover an exact field of a wider mask
+        flow = self.mk_flow(
+            [masked(ipv4_dst(0x0a000000), ipv4_dst_mask=0xff000000)])
+        mod = mk_simple_flow_mod(match_fields=[ipv4_dst(0x0a000000)],
+                                 actions=[])
+        self.assertFalse(match_covers(mod.match, flow.match))
+
+    def test_add_and_remove(self):
+        classifier = FlowClassifier()
+        flows = [self.mk_flow([in_port(i)]) for i in range(3)] + \
+            [self.mk_flow([])]
+        for flow in flows:
+            classifier.add(flow.id, flow)
+        self.assertEqual(len(classifier), 4)
+        for flow in flows:
+            classifier.remove(flow.id)
+            self.assertNotIn(flow.id, classifier)
+        self.assertEqual(classifier._tables, {})
+
+    def test_queries_against_brute_force(self):
+        random = Random(0)
+
+        def random_fields():
+            fields = []
+            if random.random() < 0.8:
+                fields.append(in_port(random.randint(1, 4)))
+            if random.random() < 0.5:
+                fields.append(vlan_vid(4096 + random.randint(1, 3)))
+            if random.random() < 0.5:
+                if random.random() < 0.5:
+                    fields.append(ipv4_dst(random.choice([1, 2, 0x101])))
+                else:
+                    fields.append(masked(ipv4_dst(random.choice([0, 0x100])),
+                                         ipv4_dst_mask=0xff00))
+            return fields
+
+        flows = dict()
+        for _ in range(300):
+            flow = self.mk_flow(random_fields(),
+                                priority=random.choice([1, 2]),
+                                table_id=random.choice([0, 1]))
+            flows[flow.id] = flow
+        classifier = FlowClassifier(flows.iteritems())
+
+        for _ in range(200):
+            query = self.mk_flow(random_fields(),
+                                 priority=random.choice([1, 2]),
+                                 table_id=random.choice([0, 1]))
+            self.assertEqual(
+                sorted(classifier.find_overlapping(
+                    query.table_id, query.priority, query.match)),
+                sorted(key for key, flow in flows.iteritems()
+                       if overlap(flow, query)))
+            self.assertEqual(
+                sorted(classifier.find_covered(query.table_id, query.match)),
+                sorted(key for key, flow in flows.iteritems()
+                       if flow.table_id == query.table_id and
+                       match_covers(query.match, flow.match)))
+            self.assertEqual(
+                sorted(classifier.find_covered(ofp.OFPTT_ALL, query.match)),
+                sorted(key for key, flow in flows.iteritems()
+                       if match_covers(query.match, flow.match)))
+
+
+if __name__ == '__main__':
+    main()
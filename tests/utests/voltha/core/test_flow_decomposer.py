@@ -632,6 +632,154 @@ class TestFlowDecomposer(FlowHelpers, FlowDecomposer):
             ]
         ))
 
+    def test_incremental_decomposition(self):
+        flow1 = mk_flow_stat(
+            priority=500,
+            match_fields=[
+                in_port(1),
+                vlan_vid(ofp.OFPVID_PRESENT | 0),
+                vlan_pcp(0)
+            ],
+            actions=[
+                set_field(vlan_vid(ofp.OFPVID_PRESENT | 101)),
+            ],
+            next_table_id=1
+        )
+        flow2 = mk_flow_stat(
+            priority=500,
+            match_fields=[
+                in_port(1),
+                vlan_vid(ofp.OFPVID_PRESENT | 101),
+                vlan_pcp(0)
+            ],
+            actions=[
+                push_vlan(0x8100),
+                set_field(vlan_vid(ofp.OFPVID_PRESENT | 1000)),
+                set_field(vlan_pcp(0)),
+                output(0)
+            ]
+        )
+        flow3 = mk_flow_stat(
+            priority=1000,
+            match_fields=[
+                in_port(1),
+                vlan_vid(ofp.OFPVID_PRESENT | 0),
+                eth_type(0x888e)
+            ],
+            actions=[
+                output(ofp.OFPP_CONTROLLER)
+            ]
+        )
+
+        def assertRulesEqual(table, flows):
+            expected = self.decompose_rules(flows, [])
+            self.assertEqual(set(table.device_rules), set(expected))
+            for device_id, (flows, groups) in expected.iteritems():
+                self.assertEqual(set(table.device_rules[device_id][0]),
+                                 set(flows))
+                self.assertEqual(set(table.device_rules[device_id][1]),
+                                 set(groups))
+
+        table = DecomposedFlowTable(self.get_all_default_rules())
+        changes = self.update_decomposed_rules(table, [flow1, flow2], [])
+        self.assertEqual(changes, (set(['onu1', 'olt']), set()))
+        assertRulesEqual(table, [flow1, flow2])
+
+        # only the devices of added or removed flows are affected
+        changes = self.update_decomposed_rules(table, [flow2, flow3], [])
+        self.assertEqual(changes, (set(['onu1', 'olt']), set()))
+        assertRulesEqual(table, [flow2, flow3])
+        changes = self.update_decomposed_rules(table, [flow2], [])
+        self.assertEqual(changes, (set(['olt']), set()))
+        assertRulesEqual(table, [flow2])
+
+        # changed counters do not change the decomposition
+        flow2.packet_count = 100
+        changes = self.update_decomposed_rules(table, [flow2], [])
+        self.assertEqual(changes, (set(), set()))
+
+        # default rules are kept, and not modified in place
+        changes = self.update_decomposed_rules(table, [], [])
+        self.assertEqual(changes, (set(['olt']), set()))
+        assertRulesEqual(table, [])
+        self.assertEqual(len(self._default_rules['olt'][0]), 1)
+
+    def test_default_rules_are_copied_on_write(self):
+        flow = mk_flow_stat(
+            priority=1000,
+            match_fields=[
+                in_port(1),
+                vlan_vid(ofp.OFPVID_PRESENT | 0),
+                eth_type(0x888e)
+            ],
+            actions=[
+                output(ofp.OFPP_CONTROLLER)
+            ]
+        )
+        table = DecomposedFlowTable(self._default_rules)
+        self.update_decomposed_rules(table, [flow], [])
+
+        # only the olt receives a flow, all other devices share the defaults
+        self.assertEqual(len(table.device_rules['olt'][0]), 2)
+        self.assertEqual(len(self._default_rules['olt'][0]), 1)
+        for device_id in ('onu1', 'onu2', 'onu3', 'onu4'):
+            self.assertIs(table.device_rules[device_id],
+                          self._default_rules[device_id])
+
+
+    def test_decompositions_are_memoized(self):
+        flow = mk_flow_stat(
+            priority=1000,
+            match_fields=[
+                in_port(1),
+                vlan_vid(ofp.OFPVID_PRESENT | 0),
+                eth_type(0x888e)
+            ],
+            actions=[
+                output(ofp.OFPP_CONTROLLER)
+            ]
+        )
+        mc_flow = mk_flow_stat(
+            priority=1000,
+            match_fields=[
+                in_port(0),
+                vlan_vid(ofp.OFPVID_PRESENT | 170),
+                vlan_pcp(0),
+                eth_type(0x800),
+                ipv4_dst(0xe00a0a0a)
+            ],
+            actions=[
+                group(10)
+            ]
+        )
+        grp = mk_group_stat(
+            group_id=10,
+            buckets=[
+                ofp.ofp_bucket(actions=[
+                    pop_vlan(),
+                    output(1)
+                ])
+            ]
+        )
+        grp_map = {10: grp}
+
+        rules = self.decompose_flow(flow, grp_map)
+        self.assertIs(self.decompose_flow(flow, {}), rules)
+        mc_rules = self.decompose_flow(mc_flow, grp_map)
+        self.assertIs(self.decompose_flow(mc_flow, grp_map), mc_rules)
+
+        # a changed group only affects the flows referring to it
+        grp.desc.buckets[0].actions[1].output.port = 2
+        self.assertIsNot(self.decompose_flow(mc_flow, grp_map), mc_rules)
+        self.assertIs(self.decompose_flow(flow, grp_map), rules)
+
+        # and so do changed instructions
+        flow.instructions[0].actions.actions.extend([pop_vlan()])
+        self.assertIsNot(self.decompose_flow(flow, grp_map), rules)
+
+        self.invalidate_decompositions()
+        self.assertIsNot(self.decompose_flow(mc_flow, grp_map), mc_rules)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,59 @@
+from unittest import TestCase, main
+
+from voltha.core.flow_decomposer import *
+from voltha.core.flow_stats import FlowStatsTable
+from voltha.protos import third_party
+from voltha.protos.openflow_13_pb2 import Flows
+
+_ = third_party
+
+
+class TestFlowStatsTable(TestCase):
+
+    def setUp(self):
+        self.flows = Flows(items=[
+            mk_flow_stat(match_fields=[in_port(i)], actions=[output(i + 1)])
+            for i in range(3)
+        ])
+        self.ids = [f.id for f in self.flows.items]
+
+    def test_update_and_get(self):
+        stats = FlowStatsTable()
+        self.assertEqual(stats.get(self.ids[0]), (0, 0))
+        stats.update(self.ids[0], 10, 1000)
+        stats.update_all([(self.ids[1], 1, 64), (self.ids[0], 11, 1064)])
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(stats.get(self.ids[0]), (11, 1064))
+        self.assertEqual(stats.get(self.ids[1]), (1, 64))
+
+        # counters are unsigned 64-bit
+        stats.update(self.ids[2], 2 ** 64 - 1, 2 ** 63)
+        self.assertEqual(stats.get(self.ids[2]), (2 ** 64 - 1, 2 ** 63))
+
+    def test_slots_are_reused(self):
+        stats = FlowStatsTable()
+        stats.update_all([(i, i, i) for i in self.ids])
+        stats.remove(self.ids[1])
+        self.assertNotIn(self.ids[1], stats)
+        self.assertEqual(stats.get(self.ids[1]), (0, 0))
+        stats.update(42, 4, 2)
+        self.assertEqual(len(stats._packet_counts), 3)
+        self.assertEqual(stats.get(42), (4, 2))
+
+        stats.retain([42, self.ids[0]])
+        self.assertEqual(sorted(stats._slots), sorted([42, self.ids[0]]))
+
+    def test_merge(self):
+        stats = FlowStatsTable()
+        self.assertIs(stats.merge(self.flows), self.flows)
+
+        stats.update(self.ids[1], 5, 320)
+        merged = stats.merge(self.flows)
+        self.assertEqual([(f.packet_count, f.byte_count) for f in merged.items],
+                         [(0, 0), (5, 320), (0, 0)])
+        # the flows merged into are left as they were
+        self.assertEqual(self.flows.items[1].packet_count, 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -246,6 +246,140 @@ class test_logical_device_agent(FlowHelpers):
         ))
         self.assertEqual(len(self.flows.items), 4)
 
+    def test_delete_flows_by_match(self):
+        for i in range(4):
+            self.lda.update_flow_table(mk_simple_flow_mod(
+                match_fields=[in_port(i % 2), vlan_vid(4096 + i)],
+                actions=[output(i + 1)]
+            ))
+
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            command=ofp.OFPFC_DELETE,
+            out_port=ofp.OFPP_ANY,
+            out_group=ofp.OFPG_ANY,
+            match_fields=[in_port(1)],
+            actions=[]
+        ))
+        self.assertEqual(
+            [get_in_port(f) for f in self.flows.items], [0, 0])
+
+    def test_add_overlapping_flow(self):
+        error = self.lda.update_flow_table(mk_simple_flow_mod(
+            match_fields=[in_port(1), vlan_vid(4096 + 1)],
+            actions=[output(2)]
+        ))
+        self.assertIsNone(error)
+        for fields, added in [
+            ([in_port(1)], False),
+            ([in_port(2)], True),
+            ([in_port(1), vlan_vid(4096 + 2)], True)
+        ]:
+            n = len(self.flows.items)
+            error = self.lda.update_flow_table(mk_simple_flow_mod(
+                flags=ofp.OFPFF_CHECK_OVERLAP,
+                match_fields=fields,
+                actions=[output(3)]
+            ))
+            self.assertEqual(len(self.flows.items), n + added)
+            self.assertEqual(error, None if added else ofp.OFPFMFC_OVERLAP)
+
+    def test_flow_mod_batch(self):
+        writes = []
+        update_flows = self.flows_proxy.update
+        def count_writes(path, flows):
+            writes.append(flows)
+            update_flows(path, flows)
+        self.flows_proxy.update = count_writes
+
+        flow_mods = [
+            mk_simple_flow_mod(match_fields=[in_port(i)],
+                               actions=[output(i + 1)])
+            for i in range(3)
+        ] + [
+            mk_simple_flow_mod(match_fields=[in_port(1)],
+                               flags=ofp.OFPFF_CHECK_OVERLAP,
+                               actions=[output(7)]),
+            mk_simple_flow_mod(match_fields=[in_port(1)],
+                               command=ofp.OFPFC_MODIFY,
+                               actions=[output(7)]),
+            mk_simple_flow_mod(command=ofp.OFPFC_DELETE_STRICT,
+                               match_fields=[in_port(0)],
+                               actions=[])
+        ]
+        errors = self.lda.update_flow_table_batch(flow_mods)
+
+        self.assertEqual(errors, [(3, ofp.OFPFMFC_OVERLAP),
+                                  (4, ofp.OFPFMFC_UNKNOWN)])
+        self.assertEqual(len(writes), 1)
+        self.assertEqual([get_in_port(f) for f in self.flows.items], [1, 2])
+
+    def test_flow_table_changed_elsewhere(self):
+        self.lda.decompose_flow = lambda flow, group_map: {}
+        for i in range(3):
+            self.lda.update_flow_table(mk_simple_flow_mod(
+                match_fields=[in_port(i)],
+                actions=[output(i + 1)]
+            ))
+
+        # a flow table written by someone else replaces the agent's index
+        flows = Flows()
+        flows.CopyFrom(self.flows)
+        flows.items[1].packet_count = 42
+        del flows.items[2]
+        self.flows = flows
+        self.lda._flow_table_updated(flows)
+
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            match_fields=[in_port(1)],
+            actions=[output(7)]
+        ))
+        self.assertEqual(len(self.flows.items), 2)
+        self.assertEqual(get_out_port(self.flows.items[1]), 7)
+        self.assertEqual(self.flows.items[1].packet_count, 42)
+
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            command=ofp.OFPFC_DELETE_STRICT,
+            match_fields=[in_port(2)],
+            actions=[]
+        ))
+        self.assertEqual(len(self.flows.items), 2)
+
+    def test_flow_stats(self):
+        # flags are part of the flow id, so set on the flow from the start
+        for i in range(3):
+            self.lda.update_flow_table(mk_simple_flow_mod(
+                match_fields=[in_port(i)],
+                flags=ofp.OFPFF_RESET_COUNTS if i == 1 else 0,
+                actions=[output(i + 1)]
+            ))
+        ids = [f.id for f in self.flows.items]
+        flows_written = self.flows
+        self.lda.flow_stats.update_all((flow_id, 10, 1000) for flow_id in ids)
+        self.assertIs(self.flows, flows_written)
+
+        # counters are kept on modify, unless asked to reset them
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            match_fields=[in_port(0)],
+            actions=[output(7)]
+        ))
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            match_fields=[in_port(1)],
+            flags=ofp.OFPFF_RESET_COUNTS,
+            actions=[output(7)]
+        ))
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            command=ofp.OFPFC_DELETE_STRICT,
+            match_fields=[in_port(2)],
+            actions=[]
+        ))
+        self.assertEqual(self.lda.flow_stats.get(ids[0]), (10, 1000))
+        self.assertNotIn(ids[1], self.lda.flow_stats)
+        self.assertNotIn(ids[2], self.lda.flow_stats)
+
+        merged = self.lda.flow_stats.merge(self.flows)
+        self.assertEqual([f.packet_count for f in merged.items], [10, 0])
+        self.assertEqual([f.packet_count for f in self.flows.items], [0, 0])
+
     # ~~~~~~~~~~~~~~~~~~~ TEST GROUP TABLE MANIPULATION ~~~~~~~~~~~~~~~~~~~~~~~
 
     def test_add_group(self):
@@ -425,6 +559,56 @@ class test_logical_device_agent(FlowHelpers):
         self.assertEqual(route[1].ingress_port, self.ports['olt'][1])
         self.assertEqual(route[1].egress_port, self.ports['olt'][0])
 
+    def test_half_routes(self):
+        route = self.lda.get_route(None, ofp.OFPP_CONTROLLER)
+        self.assertEqual(route[0], None)
+        self.assertEqual(route[1].device, self.devices['olt'])
+        self.assertEqual(route[1].egress_port, self.ports['olt'][0])
+
+        route = self.lda.get_route(2, None)
+        self.assertEqual(route[0].device, self.devices['onu2'])
+        self.assertEqual(route[0].ingress_port, self.ports['onu2'][0])
+        self.assertEqual(route[1], None)
+
+        self.assertRaises(Exception, self.lda.get_route, 7, None)
+
+    def test_routes_updated_on_port_add_and_remove(self):
+        self.lda._flow_table_updated(self.flows)  # decompose default rules
+        routes = dict(self.lda._routes)
+
+        self.devices['onu3'] = Device(
+            id='onu3', parent_id='olt', parent_port_no=1, vlan=103)
+        self.ports['onu3'] = [
+            Port(port_no=0, type=Port.ETHERNET_UNI, device_id='onu3'),
+            Port(port_no=1, type=Port.PON_ONU, device_id='onu3',
+                 peers=[Port.PeerPort(device_id='olt', port_no=1)])
+        ]
+        self.ports['olt'][1].peers.add(device_id='onu3', port_no=1)
+        self.device_flows['onu3'] = Flows()
+        port = LogicalPort(id='3', device_id='onu3', device_port_no=0,
+                           ofp_port=ofp.ofp_port(port_no=3))
+        self.ld_ports.append(port)
+        self.lda._port_added(port)
+
+        # same routes as when computed from scratch
+        self.assertEqual(set(self.lda._routes.keys()),
+                         set(routes.keys()) | set([(0, 3), (3, 0)]))
+        _, expected = LogicalDeviceAgent(self.core, self.ld).compute_routes(
+            self.root_proxy, self.ld_ports)
+        for key, route in expected.iteritems():
+            self.assertEqual(self.lda._routes[key], route)
+        self.assertEqual(self.lda.get_route(3, None)[0].device,
+                         self.devices['onu3'])
+
+        # the default rules of the new device are written right away
+        self.assertEqual(len(self.device_flows['onu3'].items), 3)
+
+        self.ld_ports.remove(port)
+        self.lda._port_removed(port)
+        self.assertEqual(self.lda._routes, routes)
+        self.assertNotIn('onu3', self.lda.get_all_default_rules())
+        self.assertRaises(Exception, self.lda.get_route, 3, None)
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~ FLOW DECOMP TESTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def test_eapol_flow_decomp_case(self):
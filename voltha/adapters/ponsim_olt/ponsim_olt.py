@@ -43,7 +43,7 @@ from voltha.protos.openflow_13_pb2 import OFPPS_LIVE, OFPPF_FIBER, OFPPF_1GB_FD,
     OFPC_GROUP_STATS, OFPC_PORT_STATS, OFPC_TABLE_STATS, OFPC_FLOW_STATS, \
     ofp_switch_features, ofp_desc
 from voltha.protos.openflow_13_pb2 import ofp_port
-from voltha.protos.ponsim_pb2 import FlowTable
+from voltha.protos.ponsim_pb2 import FlowTable, FlowTableChanges
 from voltha.registry import registry
 
 _ = third_party
@@ -64,7 +64,8 @@ class PonSimOltAdapter(object):
         DeviceType(
             id=name,
             adapter=name,
-            accepts_bulk_flow_update=True
+            accepts_bulk_flow_update=True,
+            accepts_add_remove_flow_updates=True
         )
     ]
 
@@ -119,7 +120,13 @@ class PonSimOltAdapter(object):
         return handler.update_flow_table(flows.items)
 
     def update_flows_incrementally(self, device, flow_changes, group_changes):
-        raise NotImplementedError()
+        log.info('incremental-flow-update', device_id=device.id,
+                 flow_changes=flow_changes, group_changes=group_changes)
+        assert len(group_changes.to_add.items) == 0
+        assert len(group_changes.to_remove.items) == 0
+        handler = self.devices_handlers[device.id]
+        return handler.update_flow_table_incrementally(
+            flow_changes.to_add.items, flow_changes.to_remove.items)
 
     def send_proxied_message(self, proxy_address, msg):
         log.info('send-proxied-message', proxy_address=proxy_address, msg=msg)
@@ -301,6 +308,17 @@ class PonSimOltHandler(object):
         ))
         self.log.info('success')
 
+    def update_flow_table_incrementally(self, to_add, to_remove):
+        stub = ponsim_pb2.PonSimStub(self.get_channel())
+        self.log.info('pushing-olt-flow-table-changes',
+                      added=len(to_add), removed=len(to_remove))
+        stub.UpdateFlowTableIncrementally(FlowTableChanges(
+            port=0,
+            to_add=to_add,
+            to_remove=to_remove
+        ))
+        self.log.info('success')
+
     def send_proxied_message(self, proxy_address, msg):
         self.log.info('sending-proxied-message')
         if isinstance(msg, FlowTable):
@@ -308,6 +326,11 @@ class PonSimOltHandler(object):
             self.log.info('pushing-onu-flow-table', port=msg.port)
             res = stub.UpdateFlowTable(msg)
             self.adapter_agent.receive_proxied_message(proxy_address, res)
+        elif isinstance(msg, FlowTableChanges):
+            stub = ponsim_pb2.PonSimStub(self.get_channel())
+            self.log.info('pushing-onu-flow-table-changes', port=msg.port)
+            res = stub.UpdateFlowTableIncrementally(msg)
+            self.adapter_agent.receive_proxied_message(proxy_address, res)
 
     def packet_out(self, egress_port, msg):
         self.log.info('sending-packet-out', egress_port=egress_port,
@@ -35,7 +35,7 @@ from voltha.protos.health_pb2 import HealthStatus
 from voltha.protos.logical_device_pb2 import LogicalPort
 from voltha.protos.openflow_13_pb2 import OFPPS_LIVE, OFPPF_FIBER, OFPPF_1GB_FD
 from voltha.protos.openflow_13_pb2 import ofp_port
-from voltha.protos.ponsim_pb2 import FlowTable
+from voltha.protos.ponsim_pb2 import FlowTable, FlowTableChanges
 
 _ = third_party
 log = structlog.get_logger()
@@ -50,7 +50,8 @@ class PonSimOnuAdapter(object):
         DeviceType(
             id=name,
             adapter=name,
-            accepts_bulk_flow_update=True
+            accepts_bulk_flow_update=True,
+            accepts_add_remove_flow_updates=True
         )
     ]
 
@@ -104,7 +105,13 @@ class PonSimOnuAdapter(object):
         return handler.update_flow_table(flows.items)
 
     def update_flows_incrementally(self, device, flow_changes, group_changes):
-        raise NotImplementedError()
+        log.info('incremental-flow-update', device_id=device.id,
+                 flow_changes=flow_changes, group_changes=group_changes)
+        assert len(group_changes.to_add.items) == 0
+        assert len(group_changes.to_remove.items) == 0
+        handler = self.devices_handlers[device.id]
+        return handler.update_flow_table_incrementally(
+            flow_changes.to_add.items, flow_changes.to_remove.items)
 
     def send_proxied_message(self, proxy_address, msg):
         log.info('send-proxied-message', proxy_address=proxy_address, msg=msg)
@@ -203,8 +210,21 @@ class PonSimOnuHandler(object):
         device.oper_status = OperStatus.ACTIVE
         self.adapter_agent.update_device(device)
 
-    @inlineCallbacks
     def update_flow_table(self, flows):
+        return self._send_flow_message(FlowTable(
+            port=self.proxy_address.channel_id,
+            flows=flows
+        ))
+
+    def update_flow_table_incrementally(self, to_add, to_remove):
+        return self._send_flow_message(FlowTableChanges(
+            port=self.proxy_address.channel_id,
+            to_add=to_add,
+            to_remove=to_remove
+        ))
+
+    @inlineCallbacks
+    def _send_flow_message(self, msg):
 
         # we need to proxy through the OLT to get to the ONU
 
@@ -212,10 +232,6 @@ class PonSimOnuHandler(object):
         while self.incoming_messages.pending:
             yield self.incoming_messages.get()
 
-        msg = FlowTable(
-            port=self.proxy_address.channel_id,
-            flows=flows
-        )
         self.adapter_agent.send_proxied_message(self.proxy_address, msg)
 
         yield self.incoming_messages.get()
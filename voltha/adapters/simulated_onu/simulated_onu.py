@@ -50,7 +50,8 @@ class SimulatedOnuAdapter(object):
         DeviceType(
             id='simulated_onu',
             adapter=name,
-            accepts_bulk_flow_update=True
+            accepts_bulk_flow_update=True,
+            accepts_add_remove_flow_updates=True
         )
     ]
 
@@ -189,144 +190,159 @@ class SimulatedOnuAdapter(object):
         assert len(groups.items) == 0, "Cannot yet deal with groups"
 
         for flow in flows.items:
-            in_port = get_in_port(flow)
-            assert in_port is not None
+            self._translate_flow(flow)
 
-            if in_port == 2:
+    def update_flows_incrementally(self, device, flow_changes, group_changes):
+        log.debug('incremental-flow-update', device_id=device.id,
+                  flow_changes=flow_changes, group_changes=group_changes)
 
-                # Downstream rule
+        # sample code that analyzes the incoming flow table changes
+        assert len(group_changes.to_add.items) == 0, \
+            "Cannot yet deal with groups"
+        assert len(group_changes.to_remove.items) == 0, \
+            "Cannot yet deal with groups"
 
-                for field in get_ofb_fields(flow):
-                    if field.type == ETH_TYPE:
-                        _type = field.eth_type
-                        pass  # construct ether type based condition here
+        for flow in flow_changes.to_remove.items:
+            pass  # remove low level device flow rule of flow.id here
 
-                    elif field.type == IP_PROTO:
-                        _proto = field.ip_proto
-                        pass  # construct ip_proto based condition here
+        for flow in flow_changes.to_add.items:
+            self._translate_flow(flow)
 
-                    elif field.type == IN_PORT:
-                        _port = field.port
-                        pass  # construct in_port based condition here
+    def _translate_flow(self, flow):
+        in_port = get_in_port(flow)
+        assert in_port is not None
 
-                    elif field.type == VLAN_VID:
-                        _vlan_vid = field.vlan_vid
-                        pass  # construct VLAN ID based filter condition here
+        if in_port == 2:
 
-                    elif field.type == VLAN_PCP:
-                        _vlan_pcp = field.vlan_pcp
-                        pass  # construct VLAN PCP based filter condition here
+            # Downstream rule
 
-                    # TODO
-                    else:
-                        raise NotImplementedError('field.type={}'.format(
-                            field.type))
+            for field in get_ofb_fields(flow):
+                if field.type == ETH_TYPE:
+                    _type = field.eth_type
+                    pass  # construct ether type based condition here
+
+                elif field.type == IP_PROTO:
+                    _proto = field.ip_proto
+                    pass  # construct ip_proto based condition here
+
+                elif field.type == IN_PORT:
+                    _port = field.port
+                    pass  # construct in_port based condition here
 
-                for action in get_actions(flow):
+                elif field.type == VLAN_VID:
+                    _vlan_vid = field.vlan_vid
+                    pass  # construct VLAN ID based filter condition here
 
-                    if action.type == OUTPUT:
-                        pass  # construct packet emit rule here
+                elif field.type == VLAN_PCP:
+                    _vlan_pcp = field.vlan_pcp
+                    pass  # construct VLAN PCP based filter condition here
 
-                    elif action.type == PUSH_VLAN:
-                        if action.push.ethertype != 0x8100:
-                            log.error('unhandled-ether-type',
-                                      ethertype=action.push.ethertype)
-                        pass  # construct vlan push command here
+                # TODO
+                else:
+                    raise NotImplementedError('field.type={}'.format(
+                        field.type))
 
-                    elif action.type == POP_VLAN:
-                        pass  # construct vlan pop command here
+            for action in get_actions(flow):
 
-                    elif action.type == SET_FIELD:
-                        assert (action.set_field.field.oxm_class ==
-                                ofp.OFPXMC_OPENFLOW_BASIC)
-                        field = action.set_field.field.ofb_field
-                        if field.type == VLAN_VID:
-                            pass  # construct vlan_id set command here
-                        else:
-                            log.error('unsupported-action-set-field-type',
-                                      field_type=field.type)
+                if action.type == OUTPUT:
+                    pass  # construct packet emit rule here
 
+                elif action.type == PUSH_VLAN:
+                    if action.push.ethertype != 0x8100:
+                        log.error('unhandled-ether-type',
+                                  ethertype=action.push.ethertype)
+                    pass  # construct vlan push command here
+
+                elif action.type == POP_VLAN:
+                    pass  # construct vlan pop command here
+
+                elif action.type == SET_FIELD:
+                    assert (action.set_field.field.oxm_class ==
+                            ofp.OFPXMC_OPENFLOW_BASIC)
+                    field = action.set_field.field.ofb_field
+                    if field.type == VLAN_VID:
+                        pass  # construct vlan_id set command here
                     else:
-                        log.error('unsupported-action-type',
-                                  action_type=action.type)
+                        log.error('unsupported-action-set-field-type',
+                                  field_type=field.type)
 
-                # final assembly of low level device flow rule and pushing it
-                # down to device
-                pass
+                else:
+                    log.error('unsupported-action-type',
+                              action_type=action.type)
 
-            elif in_port == 1:
+            # final assembly of low level device flow rule and pushing it
+            # down to device
+            pass
 
-                # Upstream rule
+        elif in_port == 1:
 
-                for field in get_ofb_fields(flow):
-                    if field.type == ETH_TYPE:
-                        _type = field.eth_type
-                        pass  # construct ether type based condition here
+            # Upstream rule
 
-                    elif field.type == IP_PROTO:
-                        _proto = field.ip_proto
-                        pass  # construct ip_proto based condition here
+            for field in get_ofb_fields(flow):
+                if field.type == ETH_TYPE:
+                    _type = field.eth_type
+                    pass  # construct ether type based condition here
 
-                    elif field.type == IN_PORT:
-                        _port = field.port
-                        pass  # construct in_port based condition here
+                elif field.type == IP_PROTO:
+                    _proto = field.ip_proto
+                    pass  # construct ip_proto based condition here
 
-                    elif field.type == VLAN_VID:
-                        _vlan_vid = field.vlan_vid
-                        pass  # construct VLAN ID based filter condition here
+                elif field.type == IN_PORT:
+                    _port = field.port
+                    pass  # construct in_port based condition here
 
-                    elif field.type == VLAN_PCP:
-                        _vlan_pcp = field.vlan_pcp
-                        pass  # construct VLAN PCP based filter condition here
+                elif field.type == VLAN_VID:
+                    _vlan_vid = field.vlan_vid
+                    pass  # construct VLAN ID based filter condition here
 
-                    elif field.type == IPV4_DST:
-                        _ipv4_dst = field.ipv4_dst
-                        pass  # construct IPv4 DST address based condition
+                elif field.type == VLAN_PCP:
+                    _vlan_pcp = field.vlan_pcp
+                    pass  # construct VLAN PCP based filter condition here
 
-                    elif field.type == UDP_DST:
-                        _udp_dst = field.udp_dst
-                        pass  # construct UDP SDT based filter here
+                elif field.type == IPV4_DST:
+                    _ipv4_dst = field.ipv4_dst
+                    pass  # construct IPv4 DST address based condition
 
-                    # TODO
-                    else:
-                        raise NotImplementedError('field.type={}'.format(
-                            field.type))
-
-                for action in get_actions(flow):
-
-                    if action.type == OUTPUT:
-                        pass  # construct packet emit rule here
-
-                    elif action.type == PUSH_VLAN:
-                        if action.push.ethertype != 0x8100:
-                            log.error('unhandled-ether-type',
-                                      ethertype=action.push.ethertype)
-                        pass  # construct vlan push command here
-
-                    elif action.type == SET_FIELD:
-                        assert (action.set_field.field.oxm_class ==
-                                ofp.OFPXMC_OPENFLOW_BASIC)
-                        field = action.set_field.field.ofb_field
-                        if field.type == VLAN_VID:
-                            pass  # construct vlan_id set command here
-                        else:
-                            log.error('unsupported-action-set-field-type',
-                                      field_type=field.type)
+                elif field.type == UDP_DST:
+                    _udp_dst = field.udp_dst
+                    pass  # construct UDP SDT based filter here
 
-                    else:
-                        log.error('unsupported-action-type',
-                                  action_type=action.type)
+                # TODO
+                else:
+                    raise NotImplementedError('field.type={}'.format(
+                        field.type))
 
-                # final assembly of low level device flow rule and pushing it
-                # down to device
-                pass
+            for action in get_actions(flow):
 
-            else:
-                raise Exception('Port should be 1 or 2 by our convention')
+                if action.type == OUTPUT:
+                    pass  # construct packet emit rule here
 
+                elif action.type == PUSH_VLAN:
+                    if action.push.ethertype != 0x8100:
+                        log.error('unhandled-ether-type',
+                                  ethertype=action.push.ethertype)
+                    pass  # construct vlan push command here
 
-    def update_flows_incrementally(self, device, flow_changes, group_changes):
-        raise NotImplementedError()
+                elif action.type == SET_FIELD:
+                    assert (action.set_field.field.oxm_class ==
+                            ofp.OFPXMC_OPENFLOW_BASIC)
+                    field = action.set_field.field.ofb_field
+                    if field.type == VLAN_VID:
+                        pass  # construct vlan_id set command here
+                    else:
+                        log.error('unsupported-action-set-field-type',
+                                  field_type=field.type)
+
+                else:
+                    log.error('unsupported-action-type',
+                              action_type=action.type)
+
+            # final assembly of low level device flow rule and pushing it
+            # down to device
+            pass
+
+        else:
+            raise Exception('Port should be 1 or 2 by our convention')
 
     def send_proxied_message(self, proxy_address, msg):
         raise NotImplementedError()
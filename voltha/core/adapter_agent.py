@@ -24,7 +24,7 @@ from scapy.packet import Packet
 from twisted.internet.defer import inlineCallbacks, returnValue
 from zope.interface import implementer
 
-from common.event_bus import EventBusClient
+from common.event_bus import EventBusClient, OverflowPolicy
 from voltha.adapters.interface import IAdapterAgent
 from voltha.protos import third_party
 from voltha.protos.device_pb2 import Device, Port
@@ -46,6 +46,12 @@ class AdapterAgent(object):
     defined in
     """
 
+    # proxied messages queued for the adapter, so that handling them does
+    # not hold up the adapter receiving them (e.g., from its frame io);
+    # parent adapters do not wait for the queue to drain, so when it is
+    # full the oldest message is dropped (counted in the event bus metrics)
+    PROXIED_MESSAGE_QUEUE_SIZE = 256
+
     def __init__(self, adapter_name, adapter_cls):
         self.adapter_name = adapter_name
         self.adapter_cls = adapter_cls
@@ -139,7 +145,7 @@ class AdapterAgent(object):
         return self.adapter.update_flows_bulk(device, flows, groups)
 
     def update_flows_incrementally(self, device, flow_changes, group_changes):
-        return self.update_flows_incrementally(
+        return self.adapter.update_flows_incrementally(
             device, flow_changes, group_changes)
 
     # ~~~~~~~~~~~~~~~~~~~ Adapter-Facing Service ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -172,6 +178,15 @@ class AdapterAgent(object):
         device_agent = self.core.get_device_agent(device_id)
         device_agent.remove_device(device_id)
 
+    def update_flow_stats(self, device_id, flow_stats):
+        """
+        Update the flow counters of a device; these are not stored in the
+        config tree, so this is cheap enough to be done at any rate
+        :param flow_stats: iterable of (flow id, packet_count, byte_count)
+        """
+        device_agent = self.core.get_device_agent(device_id)
+        device_agent.flow_stats.update_all(flow_stats)
+
     def add_port(self, device_id, port):
         assert isinstance(port, Port)
 
@@ -233,6 +248,14 @@ class AdapterAgent(object):
         frame = ofp_packet_out.data
         self.adapter.receive_packet_out(logical_device_id, out_port, frame)
 
+    def update_logical_flow_stats(self, logical_device_id, flow_stats):
+        """
+        Update the flow counters of a logical device, see update_flow_stats
+        :param flow_stats: iterable of (flow id, packet_count, byte_count)
+        """
+        agent = self.core.get_logical_device_agent(logical_device_id)
+        agent.flow_stats.update_all(flow_stats)
+
     def add_logical_port(self, logical_device_id, port):
         assert isinstance(port, LogicalPort)
         self._make_up_to_date(
@@ -276,7 +299,9 @@ class AdapterAgent(object):
     def register_for_proxied_messages(self, proxy_address):
         topic = self._gen_rx_proxy_address_topic(proxy_address)
         self._rx_event_subscriptions[topic] = self.event_bus.subscribe(
-            topic, lambda t, m: self._receive_proxied_message(proxy_address, m))
+            topic, lambda t, m: self._receive_proxied_message(proxy_address, m),
+            max_queue=self.PROXIED_MESSAGE_QUEUE_SIZE,
+            overflow=OverflowPolicy.DROP_OLDEST)
 
     def _receive_proxied_message(self, proxy_address, msg):
         self.adapter.receive_proxied_message(proxy_address, msg)
@@ -0,0 +1,342 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Checkpoint and journal files for the config tree.
+
+A checkpoint holds all blobs of the latest config tree in a single file;
+the journal next to it receives the blobs of every subsequently committed
+revision that are not in the tree of the revision journaled (or
+checkpointed) before it, found by diffing the two trees. Restoring a tree
+is a sequential read of both files followed by an in-memory load, instead
+of a key by key walk of the KV store.
+
+Both files use the same format: a header (magic, format version, codec),
+followed by frames. A frame is its stored and raw length (two big endian
+32 bit integers) followed by its (possibly compressed) payload, which is a
+sequence of records. A record is its type (byte), key length (16 bit) and
+value length (32 bit), followed by key and value. Blob records carry the
+same blobs PersistedConfigRevision puts in a KV store, with children always
+preceding their parents; root records carry the hash of the latest root
+revision and close each frame. With the 'none' codec, files can be read
+through a memory map without copying. A truncated trailing frame (e.g.,
+after a crash while appending to the journal) is ignored, and so is a
+journal without a complete header (after a crash right after creating it).
+"""
+
+import mmap
+import os
+import zlib
+from struct import Struct
+
+import structlog
+
+from voltha.core.config.config_children import KeyedChildren
+from voltha.core.config.config_rev_persisted import PersistedConfigRevision
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = structlog.get_logger()
+
+MAGIC = 'VCKP'
+FORMAT_VERSION = 1
+
+RECORD_BLOB = 1
+RECORD_ROOT = 2
+
+_header = Struct('>4sBB')
+_frame_header = Struct('>II')
+_record_header = Struct('>BHI')
+
+MAX_FRAME_SIZE = 1024 * 1024  # raw bytes per checkpoint frame
+
+
+class Codec(object):
+
+    __slots__ = ('name', 'id', 'compress', 'decompress')
+
+    def __init__(self, name, id, compress, decompress):
+        self.name = name
+        self.id = id
+        self.compress = compress
+        self.decompress = decompress
+
+
+def _mk_codecs():
+    codecs = [
+        Codec('none', 0, None, None),
+        Codec('zlib', 1, zlib.compress, zlib.decompress)
+    ]
+    if lz4_frame is not None:
+        codecs.append(Codec('lz4', 2, lz4_frame.compress,
+                            lz4_frame.decompress))
+    if zstandard is not None:
+        codecs.append(Codec(
+            'zstd', 3,
+            lambda raw: zstandard.ZstdCompressor().compress(raw),
+            lambda blob: zstandard.ZstdDecompressor().decompress(blob)))
+    return codecs
+
+_codecs = _mk_codecs()
+_codecs_by_name = dict((c.name, c) for c in _codecs)
+_codecs_by_id = dict((c.id, c) for c in _codecs)
+
+
+def codecs():
+    """Return the names of all available codecs"""
+    return [c.name for c in _codecs]
+
+
+def _get_codec(name):
+    try:
+        return _codecs_by_name[name]
+    except KeyError:
+        raise ValueError('Unknown or unavailable codec \'{}\''.format(name))
+
+
+class _FrameWriter(object):
+
+    __slots__ = ('_file', '_codec', '_records', '_size')
+
+    def __init__(self, file, codec):
+        self._file = file
+        self._codec = codec
+        self._records = []
+        self._size = 0
+
+    def add(self, record_type, key, value):
+        self._records.append(
+            _record_header.pack(record_type, len(key), len(value)))
+        self._records.append(key)
+        self._records.append(value)
+        self._size += _record_header.size + len(key) + len(value)
+
+    @property
+    def size(self):
+        return self._size
+
+    def write(self):
+        if not self._records:
+            return
+        raw = ''.join(self._records)
+        payload = raw if self._codec.compress is None \
+            else self._codec.compress(raw)
+        self._file.write(_frame_header.pack(len(payload), len(raw)))
+        self._file.write(payload)
+        self._records = []
+        self._size = 0
+
+
+def _write_header(f, codec):
+    f.write(_header.pack(MAGIC, FORMAT_VERSION, codec.id))
+
+
+def _changed_children(children, prev_children):
+    """
+    Return list of (child rev, prev child rev or None) for the children not
+    in prev_children (where the prev child rev is the one the child replaces
+    under the same key, if any)
+    """
+    if prev_children is None:
+        return [(child_rev, None) for child_rev in children]
+    if isinstance(children, KeyedChildren) and \
+            isinstance(prev_children, KeyedChildren):
+        # skips the chunks shared by both
+        added, _, changed = prev_children.diff(children)
+        pairs = [(children.get(key), None) for key in added]
+        pairs.extend((children.get(key), prev_children.get(key))
+                     for key in changed)
+        return pairs
+    prev_hashes = set(child_rev._hash for child_rev in prev_children)
+    return [(child_rev, None) for child_rev in children
+            if child_rev._hash not in prev_hashes]
+
+
+def _add_tree(frame, rev, rev_cls, prev=None, max_frame_size=None):
+    """
+    Add records for the blobs of the tree of rev, children first, except
+    for those of the tree of prev (already written): subtrees shared with
+    prev are not visited, so the cost is proportional to the changes
+    """
+    written = set()  # blobs are also shared within a tree
+    stack = [(rev, prev, False)]
+    while stack:
+        rev, prev, children_done = stack.pop()
+        if rev._hash in written or \
+                (prev is not None and rev._hash == prev._hash):
+            continue
+        if not children_done:
+            stack.append((rev, prev, True))
+            for field_name, children in rev._children.iteritems():
+                prev_children = None if prev is None \
+                    else prev._children.get(field_name)
+                stack.extend(
+                    (child_rev, prev_child_rev, False)
+                    for child_rev, prev_child_rev in
+                    _changed_children(children, prev_children))
+            continue
+        config = rev._config
+        if config._hash not in written and \
+                (prev is None or config._hash != prev._config._hash):
+            frame.add(RECORD_BLOB, config._hash,
+                      rev_cls.encode_config(config))
+            written.add(config._hash)
+        frame.add(RECORD_BLOB, rev._hash, rev_cls.encode(rev))
+        written.add(rev._hash)
+        if max_frame_size is not None and frame.size >= max_frame_size:
+            frame.write()
+
+
+def write_checkpoint(rev, path, codec='none',
+                     rev_cls=PersistedConfigRevision):
+    """
+    Write the tree of given (root) revision into a checkpoint file. The file
+    is written under a temporary name and renamed when complete, so an
+    existing checkpoint is replaced atomically.
+    """
+    codec = _get_codec(codec)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        _write_header(f, codec)
+        frame = _FrameWriter(f, codec)
+        _add_tree(frame, rev, rev_cls, max_frame_size=MAX_FRAME_SIZE)
+        frame.add(RECORD_ROOT, 'root', rev._hash)
+        frame.write()
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+class ConfigJournal(object):
+    """
+    Append-only journal of the committed revisions following a checkpoint.
+    Each append writes a single frame with the blobs of the new revision
+    that are not in the tree of the previously appended (or checkpointed)
+    one. Only that revision is remembered, so blobs of older revisions that
+    reappear are written again.
+    """
+
+    __slots__ = ('_file', '_codec', '_prev', '_rev_cls', '_sync')
+
+    def __init__(self, path, rev, codec='none',
+                 rev_cls=PersistedConfigRevision, sync=False):
+        """
+        :param path: journal file, truncated when opened
+        :param rev: the (root) revision written to the checkpoint
+        :param sync: fsync the journal after every append
+        """
+        self._codec = _get_codec(codec)
+        self._prev = rev
+        self._rev_cls = rev_cls
+        self._sync = sync
+        self._file = open(path, 'wb')
+        _write_header(self._file, self._codec)
+        self._file.flush()
+
+    def append(self, rev):
+        frame = _FrameWriter(self._file, self._codec)
+        _add_tree(frame, rev, self._rev_cls, self._prev)
+        frame.add(RECORD_ROOT, 'root', rev._hash)
+        frame.write()
+        self._file.flush()
+        if self._sync:
+            os.fsync(self._file.fileno())
+        self._prev = rev
+
+    def close(self):
+        self._file.close()
+
+
+def iter_records(path, allow_empty=False):
+    """
+    Yield (record type, key, value) tuples of a checkpoint or journal. A
+    file too short to hold a header (e.g., a journal left behind by a crash
+    right after it was created) is treated as having no records, if
+    allow_empty is True.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < _header.size:
+            if allow_empty:
+                log.warn('empty-file-ignored', path=path)
+                return
+            raise ValueError('{} is not a config checkpoint'.format(path))
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, version, codec_id = _header.unpack_from(m, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('{} is not a config checkpoint'.format(path))
+        codec = _codecs_by_id.get(codec_id)
+        if codec is None:
+            raise ValueError('{} uses unavailable codec {}'.format(
+                path, codec_id))
+
+        offset = _header.size
+        while offset < len(m):
+            if offset + _frame_header.size > len(m):
+                log.warn('truncated-frame-ignored', path=path)
+                break
+            stored_len, raw_len = _frame_header.unpack_from(m, offset)
+            offset += _frame_header.size
+            if offset + stored_len > len(m):
+                log.warn('truncated-frame-ignored', path=path)
+                break
+            if codec.decompress is None:
+                payload, pos, end = m, offset, offset + stored_len
+            else:
+                payload = codec.decompress(m[offset:offset + stored_len])
+                pos, end = 0, raw_len
+            offset += stored_len
+
+            while pos < end:
+                record_type, key_len, value_len = \
+                    _record_header.unpack_from(payload, pos)
+                pos += _record_header.size
+                key = payload[pos:pos + key_len]
+                pos += key_len
+                yield record_type, key, payload[pos:pos + value_len]
+                pos += value_len
+    finally:
+        m.close()
+
+
+def read_checkpoint(path, journal_path=None):
+    """
+    Read checkpoint (and journal) files sequentially; return the hash of the
+    latest root revision and a dict of all blobs
+    """
+    blobs = {}
+    latest = None
+    paths = [path]
+    if journal_path is not None and os.path.exists(journal_path):
+        paths.append(journal_path)
+    for p in paths:
+        for record_type, key, value in iter_records(
+                p, allow_empty=p is journal_path):
+            if record_type == RECORD_BLOB:
+                blobs[key] = value
+            elif record_type == RECORD_ROOT:
+                latest = value
+    if latest is None:
+        raise ValueError('{} holds no config tree'.format(path))
+    return latest, blobs
@@ -0,0 +1,569 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Persistent (immutable) containers used to hold the child revisions of keyed
+container fields of a config revision.
+
+A keyed container (e.g., /devices) can hold tens of thousands of entries, so
+looking up a child by its key, or replacing a single child with a new
+revision, must not cost O(N). KeyedChildren keeps the children in their
+insertion order in a chunked tree, and maps each key to the position of its
+entry with a hash array mapped trie (HAMT). Both structures are persistent:
+every "modifying" operation returns a new instance which shares all but
+O(log N) of its internal nodes with the original.
+
+Each chunk of the tree also caches a digest of the revision hashes stored
+under it, so the hash of a container can be derived from O(log N) fresh
+chunk digests after a single child is replaced. The digest is a polynomial
+hash over the sequence of child hashes; since it composes associatively,
+it only depends on the ordered content and not on the shape of the tree
+(which is important, since a tree re-built from persistence will not have
+the same shape as the original one).
+"""
+
+from bisect import bisect_left
+
+CHUNK_SIZE = 32  # max number of entries held by a single tree node
+
+_DIGEST_MODULUS = (1 << 61) - 1  # Mersenne prime
+_DIGEST_BASE = 0x1d8e4e27c47d124f % _DIGEST_MODULUS
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ HAMT index ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+_HAMT_BITS = 5
+_HAMT_MASK = (1 << _HAMT_BITS) - 1
+_HAMT_HASH_BITS = 32
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+class _HamtNode(object):
+    """
+    Bitmap-compressed trie node. Each slot is either a (key, value) tuple,
+    a nested _HamtNode, or, once all hash bits are used up, a _HamtBucket.
+    """
+    __slots__ = ('bitmap', 'slots')
+
+    def __init__(self, bitmap, slots):
+        self.bitmap = bitmap
+        self.slots = slots
+
+
+class _HamtBucket(object):
+    """Holds (key, value) tuples whose keys have identical hashes"""
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+_EMPTY_HAMT = _HamtNode(0, ())
+
+
+def _hamt_hash(key):
+    return hash(key) & 0xffffffff
+
+
+def _hamt_get(node, h, key):
+    shift = 0
+    while 1:
+        bit = 1 << ((h >> shift) & _HAMT_MASK)
+        if not node.bitmap & bit:
+            raise KeyError(key)
+        entry = node.slots[_popcount(node.bitmap & (bit - 1))]
+        if isinstance(entry, _HamtNode):
+            node = entry
+            shift += _HAMT_BITS
+        elif isinstance(entry, _HamtBucket):
+            for k, v in entry.pairs:
+                if k == key:
+                    return v
+            raise KeyError(key)
+        elif entry[0] == key:
+            return entry[1]
+        else:
+            raise KeyError(key)
+
+
+def _hamt_merge_pairs(shift, h1, pair1, h2, pair2):
+    """Build the smallest sub-trie holding two pairs with different keys"""
+    if shift >= _HAMT_HASH_BITS:
+        return _HamtBucket((pair1, pair2))
+    idx1 = (h1 >> shift) & _HAMT_MASK
+    idx2 = (h2 >> shift) & _HAMT_MASK
+    if idx1 == idx2:
+        sub = _hamt_merge_pairs(shift + _HAMT_BITS, h1, pair1, h2, pair2)
+        return _HamtNode(1 << idx1, (sub,))
+    slots = (pair1, pair2) if idx1 < idx2 else (pair2, pair1)
+    return _HamtNode((1 << idx1) | (1 << idx2), slots)
+
+
+def _hamt_set(node, shift, h, key, value):
+    """Return (new_node, added) where added tells if key was new"""
+    if isinstance(node, _HamtBucket):
+        pairs = [p for p in node.pairs if p[0] != key]
+        added = len(pairs) == len(node.pairs)
+        pairs.append((key, value))
+        return _HamtBucket(tuple(pairs)), added
+
+    bit = 1 << ((h >> shift) & _HAMT_MASK)
+    pos = _popcount(node.bitmap & (bit - 1))
+    slots = node.slots
+
+    if not node.bitmap & bit:
+        new_slots = slots[:pos] + ((key, value),) + slots[pos:]
+        return _HamtNode(node.bitmap | bit, new_slots), True
+
+    entry = slots[pos]
+    if isinstance(entry, (_HamtNode, _HamtBucket)):
+        new_entry, added = _hamt_set(entry, shift + _HAMT_BITS, h, key, value)
+    elif entry[0] == key:
+        new_entry, added = (key, value), False
+    else:
+        new_entry = _hamt_merge_pairs(shift + _HAMT_BITS,
+                                      _hamt_hash(entry[0]), entry,
+                                      h, (key, value))
+        added = True
+    new_slots = slots[:pos] + (new_entry,) + slots[pos + 1:]
+    return _HamtNode(node.bitmap, new_slots), added
+
+
+def _hamt_delete(node, shift, h, key):
+    """Return the new node (None if it became empty); KeyError if missing"""
+    if isinstance(node, _HamtBucket):
+        pairs = tuple(p for p in node.pairs if p[0] != key)
+        if len(pairs) == len(node.pairs):
+            raise KeyError(key)
+        return _HamtBucket(pairs) if len(pairs) > 1 else pairs[0]
+
+    bit = 1 << ((h >> shift) & _HAMT_MASK)
+    if not node.bitmap & bit:
+        raise KeyError(key)
+    pos = _popcount(node.bitmap & (bit - 1))
+    slots = node.slots
+
+    entry = slots[pos]
+    if isinstance(entry, (_HamtNode, _HamtBucket)):
+        new_entry = _hamt_delete(entry, shift + _HAMT_BITS, h, key)
+        if isinstance(new_entry, _HamtNode) and \
+                len(new_entry.slots) == 1 and \
+                not isinstance(new_entry.slots[0], (_HamtNode, _HamtBucket)):
+            # pull a lonely pair up, so lookups stay short
+            new_entry = new_entry.slots[0]
+    elif entry[0] == key:
+        new_entry = None
+    else:
+        raise KeyError(key)
+
+    if new_entry is None:
+        if node.bitmap == bit:
+            return None
+        return _HamtNode(node.bitmap & ~bit, slots[:pos] + slots[pos + 1:])
+    return _HamtNode(node.bitmap, slots[:pos] + (new_entry,) + slots[pos + 1:])
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ordered chunk tree ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class _Chunk(object):
+    """
+    Node of the ordered tree. Entries are ordered by a sequence number which
+    is assigned (monotonically) when a key is first added to the container,
+    hence the tree order is the insertion order.
+
+    In a leaf, slots holds (key, rev) tuples; in a branch, it holds the child
+    chunks. In both cases, seqs[i] is the highest sequence number found under
+    slots[i].
+
+    The digest of the chunk is computed on first use and then cached, which
+    is safe since chunks are never modified once built.
+    """
+    __slots__ = ('leaf', 'seqs', 'slots', 'count', '_digest', '_scale')
+
+    def __init__(self, leaf, seqs, slots):
+        self.leaf = leaf
+        self.seqs = seqs
+        self.slots = slots
+        self.count = len(slots) if leaf else sum(c.count for c in slots)
+        self._digest = None
+        self._scale = None
+
+    def digest(self):
+        """
+        Return (digest, scale) of the chunk, where digest is the polynomial
+        hash of all rev hashes under the chunk and scale is base ** count,
+        both modulo _DIGEST_MODULUS.
+        """
+        if self._digest is None:
+            digest, scale = 0, 1
+            if self.leaf:
+                for _, rev in self.slots:
+                    digest = (digest * _DIGEST_BASE +
+                              int(rev._hash, 16)) % _DIGEST_MODULUS
+                    scale = scale * _DIGEST_BASE % _DIGEST_MODULUS
+            else:
+                for child in self.slots:
+                    child_digest, child_scale = child.digest()
+                    digest = (digest * child_scale +
+                              child_digest) % _DIGEST_MODULUS
+                    scale = scale * child_scale % _DIGEST_MODULUS
+            self._digest, self._scale = digest, scale
+        return self._digest, self._scale
+
+
+def _chunk_find(chunk, seq):
+    i = bisect_left(chunk.seqs, seq)
+    if i == len(chunk.seqs) or (chunk.leaf and chunk.seqs[i] != seq):
+        raise KeyError(seq)
+    return i
+
+
+def _chunk_get(chunk, seq):
+    while not chunk.leaf:
+        chunk = chunk.slots[_chunk_find(chunk, seq)]
+    return chunk.slots[_chunk_find(chunk, seq)]
+
+
+def _chunk_replace(chunk, seq, item):
+    i = _chunk_find(chunk, seq)
+    slot = item if chunk.leaf else _chunk_replace(chunk.slots[i], seq, item)
+    return _Chunk(chunk.leaf, chunk.seqs,
+                  chunk.slots[:i] + [slot] + chunk.slots[i + 1:])
+
+
+def _chunk_append(chunk, seq, item):
+    """
+    Append item to the right edge of the tree (seq must be higher than any
+    seq already in the tree). Returns a list of one or two chunks; two if
+    the chunk had to overflow into a new right sibling.
+    """
+    if chunk.leaf:
+        if len(chunk.slots) < CHUNK_SIZE:
+            return [_Chunk(True, chunk.seqs + [seq], chunk.slots + [item])]
+        return [chunk, _Chunk(True, [seq], [item])]
+
+    tail = _chunk_append(chunk.slots[-1], seq, item)
+    seqs = chunk.seqs[:-1] + [c.seqs[-1] for c in tail]
+    slots = chunk.slots[:-1] + tail
+    if len(slots) <= CHUNK_SIZE:
+        return [_Chunk(False, seqs, slots)]
+    return [_Chunk(False, seqs[:-1], slots[:-1]),
+            _Chunk(False, seqs[-1:], slots[-1:])]
+
+
+def _chunk_delete(chunk, seq):
+    """Return new chunk without seq, or None if chunk became empty"""
+    i = _chunk_find(chunk, seq)
+    seqs = list(chunk.seqs)
+    slots = list(chunk.slots)
+
+    if chunk.leaf:
+        del seqs[i]
+        del slots[i]
+
+    else:
+        child = _chunk_delete(slots[i], seq)
+        if child is None:
+            del seqs[i]
+            del slots[i]
+        else:
+            seqs[i] = child.seqs[-1]
+            slots[i] = child
+            # keep the tree from degenerating into lots of tiny chunks by
+            # merging an underflowing child into one of its neighbors
+            if len(child.slots) < CHUNK_SIZE / 4 and len(slots) > 1:
+                j = i - 1 if i > 0 else i + 1
+                lo, hi = min(i, j), max(i, j)
+                left, right = slots[lo], slots[hi]
+                if len(left.slots) + len(right.slots) <= CHUNK_SIZE:
+                    merged = _Chunk(left.leaf, left.seqs + right.seqs,
+                                    left.slots + right.slots)
+                    seqs[lo:hi + 1] = [merged.seqs[-1]]
+                    slots[lo:hi + 1] = [merged]
+
+    if not slots:
+        return None
+    return _Chunk(chunk.leaf, seqs, slots)
+
+
+def _chunk_at(chunk, index):
+    while not chunk.leaf:
+        for child in chunk.slots:
+            if index < child.count:
+                chunk = child
+                break
+            index -= child.count
+    return chunk.slots[index]
+
+
+def _chunk_iter(chunk):
+    if chunk.leaf:
+        for item in chunk.slots:
+            yield item
+    else:
+        for child in chunk.slots:
+            for item in _chunk_iter(child):
+                yield item
+
+
+def _chunks_build(seqs, items):
+    """Bulk-build a tree from already ordered seqs and items"""
+    level = [
+        _Chunk(True, seqs[i:i + CHUNK_SIZE], items[i:i + CHUNK_SIZE])
+        for i in xrange(0, len(items), CHUNK_SIZE)]
+    while len(level) > 1:
+        level = [
+            _Chunk(False, [c.seqs[-1] for c in level[i:i + CHUNK_SIZE]],
+                   level[i:i + CHUNK_SIZE])
+            for i in xrange(0, len(level), CHUNK_SIZE)]
+    return level[0] if level else None
+
+
+def _chunk_diff(chunk1, chunk2):
+    """
+    Yield (seq, key, rev1, rev2) for every entry that differs between the
+    two trees, where rev1 or rev2 is None for entries only found in the
+    other tree. Subtrees shared by both trees are skipped without looking
+    into them, so diffing a tree against one derived from it by a few
+    set/remove operations costs O(changes * log N).
+    """
+    # frontiers of not yet compared chunks and (seq, key, rev) entries,
+    # kept in reverse order so that the next one can be popped off the end
+    frontier1 = [] if chunk1 is None else [chunk1]
+    frontier2 = [] if chunk2 is None else [chunk2]
+
+    def expand(frontier):
+        chunk = frontier.pop()
+        if chunk.leaf:
+            frontier.extend(reversed([
+                (seq, key, rev)
+                for seq, (key, rev) in zip(chunk.seqs, chunk.slots)]))
+        else:
+            frontier.extend(reversed(chunk.slots))
+
+    while frontier1 and frontier2:
+        head1, head2 = frontier1[-1], frontier2[-1]
+        if head1 is head2:
+            frontier1.pop()
+            frontier2.pop()
+        elif isinstance(head1, _Chunk):
+            if isinstance(head2, _Chunk) and head2.count > head1.count:
+                expand(frontier2)
+            else:
+                expand(frontier1)
+        elif isinstance(head2, _Chunk):
+            expand(frontier2)
+        else:
+            seq1, key1, rev1 = head1
+            seq2, key2, rev2 = head2
+            if seq1 == seq2 and key1 == key2:
+                if rev1 is not rev2 and rev1._hash != rev2._hash:
+                    yield seq1, key1, rev1, rev2
+                frontier1.pop()
+                frontier2.pop()
+            elif seq1 <= seq2:
+                yield seq1, key1, rev1, None
+                frontier1.pop()
+            else:
+                yield seq2, key2, None, rev2
+                frontier2.pop()
+
+    for frontier, removed in ((frontier1, True), (frontier2, False)):
+        while frontier:
+            if isinstance(frontier[-1], _Chunk):
+                expand(frontier)
+            else:
+                seq, key, rev = frontier.pop()
+                if removed:
+                    yield seq, key, rev, None
+                else:
+                    yield seq, key, None, rev
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ public class ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class KeyedChildren(object):
+    """
+    Immutable, insertion-ordered map of key to child ConfigRevision, used as
+    the children entry of keyed container fields in ConfigRevision.
+
+    It behaves as a read-only sequence of revs (len, iteration and indexing
+    by position), and offers O(log N) lookup by key and O(log N) "mutators"
+    which return a new KeyedChildren.
+    """
+
+    __slots__ = (
+        '_index',  # HAMT of key -> seq
+        '_tree',  # ordered chunk tree of seq -> (key, rev); None if empty
+        '_next_seq'  # seq to assign to the next added key
+    )
+
+    def __init__(self, index=_EMPTY_HAMT, tree=None, next_seq=0):
+        self._index = index
+        self._tree = tree
+        self._next_seq = next_seq
+
+    @classmethod
+    def from_revs(cls, keyname, revs):
+        """
+        Build from an iterable of revs, keyed by the keyname field of their
+        config data. Raises ValueError on duplicate keys.
+        """
+        index = _EMPTY_HAMT
+        items = []
+        for rev in revs:
+            key = getattr(rev._config._data, keyname)
+            index, added = _hamt_set(
+                index, 0, _hamt_hash(key), key, len(items))
+            if not added:
+                raise ValueError('Duplicate key "{}"'.format(key))
+            items.append((key, rev))
+        seqs = range(len(items))
+        return cls(index, _chunks_build(seqs, items), len(items))
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ sequence protocol ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def __len__(self):
+        return 0 if self._tree is None else self._tree.count
+
+    def __iter__(self):
+        if self._tree is not None:
+            for _, rev in _chunk_iter(self._tree):
+                yield rev
+
+    def __getitem__(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('children index out of range')
+        return _chunk_at(self._tree, index)[1]
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, KeyedChildren) or len(self) != len(other):
+            return False
+        if self._tree is other._tree:
+            return True
+        return all(a is b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'KeyedChildren({})'.format(list(self.iteritems()))
+
+    @property
+    def hash(self):
+        """
+        Digest of the ordered sequence of child rev hashes, to be used when
+        hashing the parent rev. Only chunks created since the last call are
+        (re)hashed.
+        """
+        if self._tree is None:
+            return '0:0'
+        return '%d:%x' % (self._tree.count, self._tree.digest()[0])
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ keyed access ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def keys(self):
+        return [key for key, _ in self.iteritems()]
+
+    def iteritems(self):
+        if self._tree is not None:
+            for item in _chunk_iter(self._tree):
+                yield item
+
+    def has_key(self, key):
+        try:
+            _hamt_get(self._index, _hamt_hash(key), key)
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key):
+        """Return rev stored under key, raise KeyError if not present"""
+        seq = _hamt_get(self._index, _hamt_hash(key), key)
+        return _chunk_get(self._tree, seq)[1]
+
+    def set(self, key, rev):
+        """
+        Return a new KeyedChildren where key maps to rev. An existing entry
+        keeps its position, a new one is appended at the end.
+        """
+        h = _hamt_hash(key)
+        try:
+            seq = _hamt_get(self._index, h, key)
+        except KeyError:
+            seq = self._next_seq
+            index, _ = _hamt_set(self._index, 0, h, key, seq)
+            if self._tree is None:
+                tree = _Chunk(True, [seq], [(key, rev)])
+            else:
+                chunks = _chunk_append(self._tree, seq, (key, rev))
+                tree = chunks[0] if len(chunks) == 1 else _Chunk(
+                    False, [c.seqs[-1] for c in chunks], chunks)
+            return KeyedChildren(index, tree, seq + 1)
+        tree = _chunk_replace(self._tree, seq, (key, rev))
+        return KeyedChildren(self._index, tree, self._next_seq)
+
+    def remove(self, key):
+        """Return a new KeyedChildren without key; KeyError if missing"""
+        h = _hamt_hash(key)
+        seq = _hamt_get(self._index, h, key)
+        index = _hamt_delete(self._index, 0, h, key) or _EMPTY_HAMT
+        tree = _chunk_delete(self._tree, seq)
+        while tree is not None and not tree.leaf and len(tree.slots) == 1:
+            tree = tree.slots[0]
+        return KeyedChildren(index, tree, self._next_seq)
+
+    def diff(self, other):
+        """
+        Compare with other (typically derived from self) by key. Return
+        the lists of added_keys (in other only, in the order of other),
+        removed_keys (in self only, in the order of self) and changed_keys
+        (in both, but with revs of different hashes).
+        """
+        added = []
+        removed = []
+        changed = []
+        for _, key, rev1, rev2 in _chunk_diff(self._tree, other._tree):
+            if rev2 is None:
+                removed.append((key, rev1))
+            elif rev1 is None:
+                added.append((key, rev2))
+            else:
+                changed.append(key)
+
+        if added and removed:
+            # a key removed and re-added (or, for unrelated containers, the
+            # same key under a different position) is in both
+            removed_revs = dict(removed)
+            readded = {}
+            for key, rev2 in added:
+                rev1 = removed_revs.get(key)
+                if rev1 is not None:
+                    readded[key] = rev1._hash != rev2._hash
+            if readded:
+                changed.extend(k for k, _ in added if readded.get(k))
+                added = [(k, r) for k, r in added if k not in readded]
+                removed = [(k, r) for k, r in removed if k not in readded]
+
+        return [k for k, _ in added], [k for k, _ in removed], changed
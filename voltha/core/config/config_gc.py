@@ -0,0 +1,207 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Incremental mark-and-sweep garbage collector for the blobs of a persisted
+config tree.
+
+A collection cycle snapshots the keys of the KV store, marks every blob
+reachable from the revisions of the root node (all branches and tags), and
+then sweeps the unmarked keys of the snapshot. Both phases run in small
+steps on the reactor, bounded by a time budget per tick. Blobs stored while
+a cycle is in progress are not in the snapshot, and revisions that are
+still alive in memory are never swept, so the tree can keep changing while
+a cycle runs.
+
+ConfigRoot starts a collector for its KV store, set up from the gc
+persistence settings, and stops it when closed.
+"""
+
+from time import time
+from weakref import ref
+
+import structlog
+from twisted.internet.task import LoopingCall
+
+from voltha.core.config.config_rev import _rev_cache
+
+log = structlog.get_logger()
+
+
+class PersistedRevisionCollector(object):
+
+    __slots__ = (
+        '_root',  # weak reference, not to keep a dropped tree alive
+        '_pointer_keys',
+        '_time_budget',
+        '_interval',
+        '_clock',
+        '_loop',
+        '_phase',  # None (idle), 'mark' or 'sweep'
+        '_marked',  # set of reachable hashes
+        '_to_visit',  # stack of revisions to mark
+        '_to_visit_stored',  # stack of hashes of not loaded revisions
+        '_candidates',  # iterator over the keys to sweep
+        'cycles',
+        'reclaimed_blobs',
+        'reclaimed_bytes'
+    )
+
+    def __init__(self, root, time_budget=0.005, interval=1.0,
+                 pointer_keys=('root',), clock=None):
+        """
+        :param root: the ConfigRoot the persisted blobs belong to
+        :param time_budget: max seconds to spend per tick
+        :param interval: seconds between ticks
+        :param pointer_keys: keys in the KV store that are not blobs
+        :param clock: twisted clock used for scheduling (defaults to reactor)
+        """
+        self._root = ref(root)
+        self._pointer_keys = frozenset(pointer_keys)
+        self._time_budget = time_budget
+        self._interval = interval
+        self._clock = clock
+        self._loop = None
+        self._phase = None
+        self._marked = None
+        self._to_visit = None
+        self._to_visit_stored = None
+        self._candidates = None
+        self.cycles = 0
+        self.reclaimed_blobs = 0
+        self.reclaimed_bytes = 0
+
+    def start(self):
+        self._loop = LoopingCall(self.tick)
+        if self._clock is not None:
+            self._loop.clock = self._clock
+        self._loop.start(self._interval, now=False)
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self._loop = None
+
+    def stats(self):
+        return dict(
+            cycles=self.cycles,
+            reclaimed_blobs=self.reclaimed_blobs,
+            reclaimed_bytes=self.reclaimed_bytes
+        )
+
+    def collect(self):
+        """Run (or finish) a full collection cycle synchronously"""
+        if self._phase is None:
+            self._begin()
+        while self._phase is not None:
+            self._step(None)
+
+    def tick(self):
+        """Make progress with the current cycle for at most time_budget"""
+        root = self._root()
+        if root is None:
+            # the tree is gone, so are the references to its blobs
+            self.stop()
+            return
+        if root.kv_store is None:
+            return
+        if self._phase is None:
+            self._begin()
+        self._step(time() + self._time_budget)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Internals ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _begin(self):
+        root = self._root()
+        kv_store = root.kv_store
+        self._candidates = iter([key for key in kv_store.keys()
+                                 if key not in self._pointer_keys])
+        self._marked = set()
+        self._to_visit = []
+        self._to_visit_stored = []
+        for branch in root._branches.itervalues():
+            self._to_visit.extend(branch._revs.values())
+            if branch._latest is not None:
+                self._to_visit.append(branch._latest)
+        self._to_visit.extend(root._tags.itervalues())
+        self._phase = 'mark'
+
+    def _step(self, deadline):
+        n = 0
+        while self._phase is not None:
+            # checking the time is costly relative to a single step
+            n += 1
+            if deadline is not None and n % 64 == 0 and time() > deadline:
+                return
+            if self._phase == 'mark':
+                self._mark_one()
+            else:
+                self._sweep_one()
+
+    def _mark_one(self):
+        if self._to_visit:
+            rev = self._to_visit.pop()
+            if rev._hash in self._marked:
+                return
+            self._marked.add(rev._hash)
+            self._marked.add(rev._config._hash)
+            # do not force lazily loaded subtrees into memory
+            refs = getattr(rev, 'unloaded_children_refs', None)
+            if refs is not None:
+                for hashes in refs.itervalues():
+                    self._to_visit_stored.extend(hashes)
+            else:
+                for children in rev._children.itervalues():
+                    self._to_visit.extend(children)
+        elif self._to_visit_stored:
+            hash = self._to_visit_stored.pop()
+            if hash in self._marked:
+                return
+            self._marked.add(hash)
+            root = self._root()
+            config_hash, refs = root._rev_cls.decode(root.kv_store[hash])
+            self._marked.add(config_hash)
+            for hashes in refs.itervalues():
+                self._to_visit_stored.extend(hashes)
+        else:
+            self._phase = 'sweep'
+
+    def _sweep_one(self):
+        try:
+            key = next(self._candidates)
+        except StopIteration:
+            self._end()
+            return
+        if key in self._marked or key in _rev_cache:
+            return  # reachable, or still alive (e.g., created meanwhile)
+        kv_store = self._root().kv_store
+        try:
+            size = len(kv_store[key])
+            del kv_store[key]
+        except KeyError:
+            return
+        self.reclaimed_blobs += 1
+        self.reclaimed_bytes += size
+
+    def _end(self):
+        self._phase = None
+        self._marked = None
+        self._to_visit = None
+        self._to_visit_stored = None
+        self._candidates = None
+        self.cycles += 1
+        log.debug('config-gc-cycle-done', **self.stats())
@@ -0,0 +1,175 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Size bounded LRU cache of serialized config get results.
+
+Config revisions are immutable and content addressed, hence the serialized
+result of getting a revision to a given depth is fully determined by
+(rev.hash, depth). Entries therefore never need to be invalidated; entries
+of revisions that are no longer current simply age out of the cache.
+
+The same holds for the items of a container field, keyed by the hash of the
+child revisions: the packed container message (such as Devices) served for
+list requests is cached as well, so that repeatedly listing an unchanged
+container is a single lookup. These entries are dropped when GET callbacks
+are registered, as the callbacks may alter the items.
+"""
+
+from collections import OrderedDict
+
+from google.protobuf.internal.encoder import _VarintBytes
+from google.protobuf.internal.wire_format import PackTag, \
+    WIRETYPE_LENGTH_DELIMITED
+
+from voltha.core.config.config_children import KeyedChildren
+
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024  # bytes
+
+
+class ConfigGetCache(object):
+
+    __slots__ = (
+        '_entries',  # key -> (cached value, size in bytes), in LRU order
+        '_size',  # total number of cached bytes
+        'max_size',
+        'hits',
+        'misses',
+        'evictions'
+    )
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self._entries = OrderedDict()
+        self._size = 0
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, rev, depth):
+        """
+        Return the serialized config data of rev, assembled to the given
+        depth (see ConfigRevision.get)
+        """
+        key = (rev.hash, _normalize_depth(depth))
+        blob = self._lookup(key)
+        if blob is not None:
+            return blob
+
+        blob = rev.get(key[1], True).SerializeToString()
+        self._store(key, blob, len(blob))
+        return blob
+
+    def get_items(self, container_cls, children, depth, get_blobs):
+        """
+        Return a container_cls message (such as Devices) holding the config
+        data of the children revs, assembled to the given depth. On a miss,
+        get_blobs() is called for the serialized items and a flag telling if
+        the result may be cached. The returned message is shared, and must
+        not be modified.
+        """
+        key = (container_cls, _children_key(children),
+               _normalize_depth(depth))
+        msg = self._lookup(key)
+        if msg is not None:
+            return msg
+
+        blobs, cacheable = get_blobs()
+        raw = _pack(container_cls, blobs)
+        msg = container_cls.FromString(raw)
+        if cacheable:
+            self._store(key, msg, len(raw))
+        return msg
+
+    def drop_items(self):
+        """Drop the cached container messages, keeping the single items"""
+        # items are keyed by (container_cls, children key, depth), single
+        # revisions by (hash, depth)
+        for key in [key for key in self._entries if len(key) == 3]:
+            _, size = self._entries.pop(key)
+            self._size -= size
+
+    def _lookup(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries[key] = entry  # re-insert as most recently used
+        self.hits += 1
+        return entry[0]
+
+    def _store(self, key, value, size):
+        if size > self.max_size:
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        while self._size > self.max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self):
+        return dict(
+            entries=len(self._entries),
+            size=self._size,
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions
+        )
+
+
+def _normalize_depth(depth):
+    if not depth:
+        return 0
+    elif depth < 0:
+        return -1  # all negative depths mean the full subtree
+    return depth
+
+
+def _children_key(children):
+    if isinstance(children, KeyedChildren):
+        return children.hash
+    return tuple(rev.hash for rev in children)
+
+
+def _pack(container_cls, blobs, field_name='items'):
+    field = container_cls.DESCRIPTOR.fields_by_name[field_name]
+    tag = _VarintBytes(PackTag(field.number, WIRETYPE_LENGTH_DELIMITED))
+    return ''.join(tag + _VarintBytes(len(blob)) + blob for blob in blobs)
+
+
+# shared by all config trees; keys are content hashes so this is safe
+get_cache = ConfigGetCache()
+
+
+def pack_items(container_cls, blobs, field_name='items'):
+    """
+    Build a container message (such as Devices) from the serialized form of
+    its items, without having to copy the items one by one.
+    """
+    return container_cls.FromString(_pack(container_cls, blobs, field_name))
@@ -13,17 +13,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from copy import copy
-
 from jsonpatch import JsonPatch
 from jsonpatch import make_patch
 
 from common.utils.json_format import MessageToDict
 from voltha.core.config.config_branch import ConfigBranch
+from voltha.core.config.config_children import KeyedChildren
+from voltha.core.config.config_get_cache import get_cache
 from voltha.core.config.config_proxy import CallbackType, ConfigProxy
 from voltha.core.config.config_rev import is_proto_message, children_fields, \
     ConfigRevision, access_rights
-from voltha.core.config.config_rev_persisted import PersistedConfigRevision
+from voltha.core.config.config_rev_persisted import PersistedTreeLoader
 from voltha.core.config.merge_3way import merge_3way
 from voltha.protos import third_party
 from voltha.protos import meta_pb2
@@ -47,10 +47,10 @@ def check_access_violation(new_msg, old_msg):
 
 
 def find_rev_by_key(revs, keyname, value):
-    for i, rev in enumerate(revs):
-        if getattr(rev._config._data, keyname) == value:
-            return i, rev
-    raise KeyError('key {}={} not found'.format(keyname, value))
+    try:
+        return revs.get(value)
+    except KeyError:
+        raise KeyError('key {}={} not found'.format(keyname, value))
 
 
 class ConfigNode(object):
@@ -103,15 +103,10 @@ class ConfigNode(object):
             field_value = getattr(data, field_name)
             if field.is_container:
                 if field.key:
-                    keys_seen = set()
-                    children[field_name] = lst = []
-                    for v in field_value:
-                        rev = self._mknode(v, txid=txid).latest
-                        key = getattr(v, field.key)
-                        if key in keys_seen:
-                            raise ValueError('Duplicate key "{}"'.format(key))
-                        lst.append(rev)
-                        keys_seen.add(key)
+                    children[field_name] = KeyedChildren.from_revs(
+                        field.key,
+                        (self._mknode(v, txid=txid).latest
+                         for v in field_value))
                 else:
                     children[field_name] = [
                         self._mknode(v, txid=txid).latest for v in field_value]
@@ -141,7 +136,19 @@ class ConfigNode(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ get operation ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def get(self, path=None, hash=None, depth=0, deep=False, txid=None):
+    def get(self, path=None, hash=None, depth=0, deep=False, txid=None,
+            read_only=False, serialized=False, packed=None):
+        """
+        Get config data at path. With read_only=True, the caller promises
+        not to modify the returned data, which allows us to return data
+        shared with the config tree instead of copying it.
+        With serialized=True, the serialized form of the data is returned
+        instead (a list of such for containers), served from the shared
+        get cache when possible.
+        With packed set to a container message class (such as Devices), the
+        items of the container at path are returned in such a message, which
+        is served from the shared get cache and must not be modified.
+        """
 
         # depth preparation
         if deep:
@@ -161,12 +168,13 @@ class ConfigNode(object):
         else:
             rev = branch.latest
 
-        return self._get(rev, path, depth)
+        return self._get(rev, path, depth, read_only, serialized, packed)
 
-    def _get(self, rev, path, depth):
+    def _get(self, rev, path, depth, read_only=False, serialized=False,
+             packed=None):
 
         if not path:
-            return self._do_get(rev, depth)
+            return self._do_get(rev, depth, read_only, serialized)
 
         # ... otherwise
         name, _, path = path.partition('/')
@@ -178,37 +186,70 @@ class ConfigNode(object):
                     # need to escalate further
                     key, _, path = path.partition('/')
                     key = field.key_from_str(key)
-                    _, child_rev = find_rev_by_key(children, field.key, key)
+                    child_rev = find_rev_by_key(children, field.key, key)
                     child_node = child_rev.node
-                    return child_node._get(child_rev, path, depth)
+                    return child_node._get(
+                        child_rev, path, depth, read_only, serialized, packed)
                 else:
                     # we are the node of interest
+                    if packed is not None:
+                        return self._get_packed(children, depth, packed)
                     response = []
                     for child_rev in children:
                         child_node = child_rev.node
-                        value = child_node._do_get(child_rev, depth)
+                        value = child_node._do_get(
+                            child_rev, depth, read_only, serialized)
                         response.append(value)
                     return response
             else:
                 if path:
                     raise LookupError(
                         'Cannot index into container with no key defined')
+                if packed is not None:
+                    return self._get_packed(
+                        rev._children[name], depth, packed)
                 response = []
                 for child_rev in rev._children[name]:
                     child_node = child_rev.node
-                    value = child_node._do_get(child_rev, depth)
+                    value = child_node._do_get(
+                        child_rev, depth, read_only, serialized)
                     response.append(value)
                 return response
         else:
             child_rev = rev._children[name][0]
             child_node = child_rev.node
-            return child_node._get(child_rev, path, depth)
+            return child_node._get(
+                child_rev, path, depth, read_only, serialized, packed)
 
-    def _do_get(self, rev, depth):
-        msg = rev.get(depth)
-        if self._proxy is not None:
+    def _get_packed(self, children, depth, container_cls):
+
+        def get_blobs():
+            blobs = []
+            cacheable = True
+            for child_rev in children:
+                child_node = child_rev.node
+                if child_node._has_get_callbacks():
+                    cacheable = False
+                blobs.append(child_node._do_get(child_rev, depth,
+                                                serialized=True))
+            return blobs, cacheable
+
+        return get_cache.get_items(container_cls, children, depth, get_blobs)
+
+    def _has_get_callbacks(self):
+        return self._proxy is not None and \
+            self._proxy.has_callbacks(CallbackType.GET)
+
+    def _do_get(self, rev, depth, read_only=False, serialized=False):
+        if self._has_get_callbacks():
+            # GET callbacks may augment the data, so they need a private copy
+            # and their result cannot be cached
+            msg = rev.get(depth)
             msg = self._proxy.invoke_callbacks(CallbackType.GET, msg)
-        return msg
+            return msg.SerializeToString() if serialized else msg
+        if serialized:
+            return get_cache.get(rev, depth)
+        return rev.get(depth, read_only)
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~ update operation ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -234,8 +275,8 @@ class ConfigNode(object):
             if field.key:
                 key, _, path = path.partition('/')
                 key = field.key_from_str(key)
-                children = copy(rev._children[name])
-                idx, child_rev = find_rev_by_key(children, field.key, key)
+                children = rev._children[name]
+                child_rev = find_rev_by_key(children, field.key, key)
                 child_node = child_rev.node
                 new_child_rev = child_node.update(
                     path, data, strict, txid, mk_branch)
@@ -244,7 +285,7 @@ class ConfigNode(object):
                     return branch._latest
                 if getattr(new_child_rev.data, field.key) != key:
                     raise ValueError('Cannot change key field')
-                children[idx] = new_child_rev
+                children = children.set(key, new_child_rev)
                 rev = rev.update_children(name, children, branch)
                 self._make_latest(branch, rev)
                 return rev
@@ -323,16 +364,12 @@ class ConfigNode(object):
                     if self._proxy is not None:
                         self._proxy.invoke_callbacks(
                             CallbackType.PRE_ADD, data)
-                    children = copy(rev._children[name])
+                    children = rev._children[name]
                     key = getattr(data, field.key)
-                    try:
-                        find_rev_by_key(children, field.key, key)
-                    except KeyError:
-                        pass
-                    else:
+                    if children.has_key(key):
                         raise ValueError('Duplicate key "{}"'.format(key))
                     child_rev = self._mknode(data).latest
-                    children.append(child_rev)
+                    children = children.set(key, child_rev)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev,
                                       ((CallbackType.POST_ADD, data),))
@@ -345,11 +382,11 @@ class ConfigNode(object):
                     # need to escalate
                     key, _, path = path.partition('/')
                     key = field.key_from_str(key)
-                    children = copy(rev._children[name])
-                    idx, child_rev = find_rev_by_key(children, field.key, key)
+                    children = rev._children[name]
+                    child_rev = find_rev_by_key(children, field.key, key)
                     child_node = child_rev.node
                     new_child_rev = child_node.add(path, data, txid, mk_branch)
-                    children[idx] = new_child_rev
+                    children = children.set(key, new_child_rev)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev)
                     return rev
@@ -383,18 +420,18 @@ class ConfigNode(object):
                 key = field.key_from_str(key)
                 if path:
                     # need to escalate
-                    children = copy(rev._children[name])
-                    idx, child_rev = find_rev_by_key(children, field.key, key)
+                    children = rev._children[name]
+                    child_rev = find_rev_by_key(children, field.key, key)
                     child_node = child_rev.node
                     new_child_rev = child_node.remove(path, txid, mk_branch)
-                    children[idx] = new_child_rev
+                    children = children.set(key, new_child_rev)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev)
                     return rev
                 else:
                     # need to remove from this very node
-                    children = copy(rev._children[name])
-                    idx, child_rev = find_rev_by_key(children, field.key, key)
+                    children = rev._children[name]
+                    child_rev = find_rev_by_key(children, field.key, key)
                     if self._proxy is not None:
                         data = child_rev.data
                         self._proxy.invoke_callbacks(
@@ -402,7 +439,7 @@ class ConfigNode(object):
                         post_anno = ((CallbackType.POST_REMOVE, data),)
                     else:
                         post_anno = ()
-                    del children[idx]
+                    children = children.remove(key)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev, post_anno)
                     return rev
@@ -422,18 +459,21 @@ class ConfigNode(object):
     def _del_txbranch(self, txid):
         del self._branches[txid]
 
-    def _merge_txbranch(self, txid, dry_run=False):
+    def _merge_txbranch(self, txid, commits):
         """
         Make latest in branch to be latest in the common branch, but only
         if no conflict is detected. Conflict is where the txbranch branch
         point no longer matches the latest in the default branch. This has
         to be verified recursively.
+        The merge is only computed here, raising MergeConflictException on
+        conflict; the (node, branch, rev, changes) tuples needed to make it
+        effective are appended to commits, children first.
         """
 
         def merge_child(child_rev):
             child_branch = child_rev._branch
             if child_branch._txid == txid:
-                child_rev = child_branch._node._merge_txbranch(txid, dry_run)
+                child_rev = child_branch._node._merge_txbranch(txid, commits)
             return child_rev
 
         src_branch = self._branches[txid]
@@ -443,13 +483,12 @@ class ConfigNode(object):
         src_rev = src_branch.latest  # head rev of source branch
         dst_rev = dst_branch.latest  # head rev of target branch
 
-        rev, changes = merge_3way(
-            fork_rev, src_rev, dst_rev, merge_child, dry_run)
-
-        if not dry_run:
-            self._make_latest(dst_branch, rev, change_announcements=changes)
-            del self._branches[txid]
+        if src_rev._hash == fork_rev._hash:
+            # nothing changed under this node in the transaction
+            return dst_rev
 
+        rev, changes = merge_3way(fork_rev, src_rev, dst_rev, merge_child)
+        commits.append((self, dst_branch, rev, changes))
         return rev
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Diff utility ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -540,7 +579,7 @@ class ConfigNode(object):
                 key, _, path = path.partition('/')
                 key = field.key_from_str(key)
                 children = rev._children[name]
-                _, child_rev = find_rev_by_key(children, field.key, key)
+                child_rev = find_rev_by_key(children, field.key, key)
                 child_node = child_rev.node
                 return child_node._get_proxy(path, root, full_path, exclusive)
 
@@ -561,13 +600,7 @@ class ConfigNode(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~ Persistence loading ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def load_latest(self, latest_hash):
-
+    def load_latest(self, latest_hash, lazy=False):
         root = self._root
-        kv_store = root._kv_store
-
-        branch = ConfigBranch(self, self._auto_prune)
-        rev = PersistedConfigRevision.load(
-            branch, kv_store, self._type, latest_hash)
-        self._make_latest(branch, rev)
-        self._branches[None] = branch
+        loader = PersistedTreeLoader(root._kv_store, root._rev_cls, lazy)
+        loader.load(self, latest_hash)
@@ -16,6 +16,7 @@
 import structlog
 from enum import Enum
 
+from voltha.core.config.config_get_cache import get_cache
 from voltha.core.config.config_txn import ConfigTransaction
 
 log = structlog.get_logger()
@@ -89,8 +90,10 @@ class ConfigProxy(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~ CRUD handlers ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def get(self, path='/', depth=None, deep=None, txid=None):
-        return self._node.get(path, depth=depth, deep=deep, txid=txid)
+    def get(self, path='/', depth=None, deep=None, txid=None,
+            read_only=False):
+        return self._node.get(path, depth=depth, deep=deep, txid=txid,
+                              read_only=read_only)
 
     def update(self, path, data, strict=False, txid=None):
         assert path.startswith('/')
@@ -132,6 +135,9 @@ class ConfigProxy(object):
     def register_callback(self, callback_type, callback, *args, **kw):
         lst = self._callbacks.setdefault(callback_type, [])
         lst.append((callback, args, kw))
+        if callback_type == CallbackType.GET:
+            # cached container items may include our node's unaltered data
+            get_cache.drop_items()
 
     def unregister_callback(self, callback_type, callback, *args, **kw):
         lst = self._callbacks.setdefault(callback_type, [])
@@ -139,6 +145,9 @@ class ConfigProxy(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~ Callback dispatch ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+    def has_callbacks(self, callback_type):
+        return bool(self._callbacks.get(callback_type))
+
     def invoke_callbacks(self, callback_type, context, proceed_on_errors=False):
         lst = self._callbacks.get(callback_type, [])
         for callback, args, kw in lst:
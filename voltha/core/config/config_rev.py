@@ -23,15 +23,29 @@ classes directly must obey the rules.
 
 import weakref
 from copy import copy
-from hashlib import md5
+from hashlib import md5, sha1
 
 from google.protobuf.descriptor import Descriptor
 from simplejson import dumps
 
 from common.utils.json_format import MessageToJson
+from voltha.core.config.config_children import KeyedChildren
 from voltha.protos import third_party
 from voltha.protos import meta_pb2
 
+try:
+    from hashlib import blake2b
+except ImportError:
+    try:
+        from pyblake2 import blake2b
+    except ImportError:
+        blake2b = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 
 def is_proto_message(o):
     """
@@ -50,6 +64,108 @@ def message_to_json_concise(m):
     return MessageToJson(m, False, True, False)
 
 
+class HashBackend(object):
+    """
+    Hash function used to derive the content hashes of config revisions.
+    The backend produces hex digest strings of digest_size bytes from a
+    sequence of string chunks, so callers never have to concatenate the
+    chunks (e.g., a potentially large serialized message) up-front.
+    """
+
+    __slots__ = (
+        '_name',
+        '_new',  # callable returning a fresh hashlib-style hash object
+        '_hex_size'
+    )
+
+    def __init__(self, name, new, digest_size):
+        self._name = name
+        self._new = new
+        self._hex_size = 2 * digest_size
+
+    @property
+    def name(self):
+        return self._name
+
+    def __call__(self, *chunks):
+        h = self._new()
+        for chunk in chunks:
+            h.update(chunk)
+        return h.hexdigest()[:self._hex_size]
+
+
+# name -> (function making the hash object factory for a digest size,
+#          max digest size in bytes); HashBackend truncates the digests of
+#          hash functions of a fixed size to the requested size
+_hash_backend_types = {
+    'md5': (lambda digest_size: md5, 16),
+    'sha1': (lambda digest_size: sha1, 20),
+}
+if blake2b is not None:
+    _hash_backend_types['blake2b'] = (
+        lambda digest_size: lambda: blake2b(digest_size=digest_size), 64)
+if xxhash is not None:
+    _hash_backend_types['xxhash64'] = (lambda digest_size: xxhash.xxh64, 8)
+
+
+def register_hash_backend(name, mk_new, max_digest_size):
+    """
+    Make a new hash backend available for set_hash_backend().
+    :param name: name of the backend
+    :param mk_new: called with the requested digest size (in bytes), shall
+    return a callable producing hashlib-style hash objects
+    :param max_digest_size: the longest digest (in bytes) the backend can do
+    """
+    _hash_backend_types[name] = (mk_new, max_digest_size)
+
+
+def hash_backends():
+    """Return the names of all available hash backends"""
+    return sorted(_hash_backend_types.iterkeys())
+
+
+def set_hash_backend(name='md5', digest_size=6):
+    """
+    Select the hash function used for all config revisions. Since revisions
+    are content addressed, this shall be called before any config tree is
+    created (or loaded from persistence).
+    :param name: one of hash_backends()
+    :param digest_size: digest size in bytes; the hex hash strings will be
+    twice as long
+    :return: the new HashBackend
+    """
+    global _hash_backend
+    try:
+        mk_new, max_digest_size = _hash_backend_types[name]
+    except KeyError:
+        raise ValueError('Unknown hash backend "{}" (available: {})'.format(
+            name, ', '.join(hash_backends())))
+    if not 0 < digest_size <= max_digest_size:
+        raise ValueError('Digest size of "{}" must be within 1..{}'.format(
+            name, max_digest_size))
+    _hash_backend = HashBackend(name, mk_new(digest_size), digest_size)
+    return _hash_backend
+
+
+def get_hash_backend():
+    return _hash_backend
+
+
+_hash_backend = None
+set_hash_backend()
+
+
+_type_prefix_cache = {}  # memoized hash prefix per protobuf message type
+
+
+def _type_prefix(cls):
+    prefix = _type_prefix_cache.get(cls)
+    if prefix is None:
+        prefix = _type_prefix_cache[cls] = '{}:{}:'.format(
+            cls.__module__, cls.__name__)
+    return prefix
+
+
 _rev_cache = weakref.WeakValueDictionary()  # cache of config revs
 
 
@@ -199,9 +315,9 @@ class ConfigDataRevision(object):
         '__weakref__'
     )
 
-    def __init__(self, data):
+    def __init__(self, data, serialized=None):
         self._data = data
-        self._hash = self._hash_data(data)
+        self._hash = self._hash_data(data, serialized)
 
     @property
     def data(self):
@@ -211,19 +327,21 @@ class ConfigDataRevision(object):
     def hash(self):
         return self._hash
 
-    @staticmethod
-    def _hash_data(data):
-        """Hash function to be used to track version changes of config nodes"""
+    def _hash_data(self, data, serialized=None):
+        """
+        Hash function to be used to track version changes of config nodes.
+        If the caller already has the serialized form of a protobuf data
+        (e.g., when loading from persistence), it can pass it in as
+        serialized to spare re-serializing it.
+        """
         if isinstance(data, (dict, list)):
-            to_hash = dumps(data)
+            return _hash_backend(dumps(data))
         elif is_proto_message(data):
-            to_hash = ':'.join((
-                data.__class__.__module__,
-                data.__class__.__name__,
-                data.SerializeToString()))
+            if serialized is None:
+                serialized = data.SerializeToString()
+            return _hash_backend(_type_prefix(data.__class__), serialized)
         else:
-            to_hash = str(hash(data))
-        return md5(to_hash).hexdigest()[:12]
+            return _hash_backend(str(hash(data)))
 
 
 class ConfigRevision(object):
@@ -243,9 +361,11 @@ class ConfigRevision(object):
         '__weakref__'
     )
 
-    def __init__(self, branch, data, children=None):
+    config_data_cls = ConfigDataRevision
+
+    def __init__(self, branch, data, children=None, serialized=None):
         self._branch = branch
-        self._config = ConfigDataRevision(data)
+        self._config = self.config_data_cls(data, serialized)
         self._children = children
         self._finalize()
 
@@ -259,13 +379,20 @@ class ConfigRevision(object):
             self._config = _rev_cache[self._config._hash]  # re-use!
 
     def _hash_content(self):
-        # hash is derived from config hash and hashes of all children
-        m = md5('' if self._config is None else self._config._hash)
+        # hash is derived from config hash and hashes of all children;
+        # keyed containers provide a digest computed from their (cached)
+        # chunk hashes so we do not need to visit all children. Fields are
+        # visited in a fixed order so the hash does not depend on how the
+        # children dict was assembled (e.g., when loaded from persistence).
+        chunks = ['' if self._config is None else self._config._hash]
         if self._children is not None:
-            for children in self._children.itervalues():
-                assert isinstance(children, list)
-                m.update(''.join(c._hash for c in children))
-        return m.hexdigest()[:12]
+            for field_name in sorted(self._children.iterkeys()):
+                children = self._children[field_name]
+                if isinstance(children, KeyedChildren):
+                    chunks.append(children.hash)
+                else:
+                    chunks.extend(c._hash for c in children)
+        return _hash_backend(*chunks)
 
     @property
     def hash(self):
@@ -283,27 +410,33 @@ class ConfigRevision(object):
     def type(self):
         return self._config.data.__class__
 
-    def get(self, depth):
+    def get(self, depth, read_only=False):
         """
         Get config data of node. If depth > 0, recursively assemble the
         branch nodes. If depth is < 0, this results in a fully exhaustive
         "complete config".
+        If read_only is True, the caller promises not to modify the returned
+        message, which allows us to hand out the stored (shared) config data
+        instead of a copy of it whenever no children need to be assembled.
         """
         orig_data = self._config.data
+        if read_only and not depth:
+            return orig_data
         data = orig_data.__class__()
         data.CopyFrom(orig_data)
         if depth:
-            # collect children
+            # collect children; since they are merged (copied) into data, we
+            # can safely fetch them in read-only mode
             cfields = children_fields(self.type).iteritems()
             for field_name, field in cfields:
                 if field.is_container:
                     for rev in self._children[field_name]:
-                        child_data = rev.get(depth=depth - 1)
+                        child_data = rev.get(depth - 1, True)
                         child_data_holder = getattr(data, field_name).add()
                         child_data_holder.MergeFrom(child_data)
                 else:
                     rev = self._children[field_name][0]
-                    child_data = rev.get(depth=depth - 1)
+                    child_data = rev.get(depth - 1, True)
                     child_data_holder = getattr(data, field_name)
                     child_data_holder.MergeFrom(child_data)
         return data
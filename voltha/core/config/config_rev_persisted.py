@@ -22,95 +22,139 @@ from bz2 import compress, decompress
 import structlog
 from simplejson import dumps, loads
 
-from voltha.core.config.config_rev import ConfigRevision, children_fields
+from voltha.core.config.config_branch import ConfigBranch
+from voltha.core.config.config_children import KeyedChildren
+from voltha.core.config.config_rev import ConfigRevision, children_fields, \
+    ConfigDataRevision, _rev_cache
 
 log = structlog.get_logger()
 
 
+class PersistedConfigDataRevision(ConfigDataRevision):
+    """
+    Config data revision which holds on to the serialized form of its data
+    (produced anyhow for hashing) until it is stored, so that storing does
+    not need to serialize the data a second time.
+    """
+
+    __slots__ = ('_serialized',)
+
+    def _hash_data(self, data, serialized=None):
+        if serialized is None and not isinstance(data, (dict, list)):
+            serialized = data.SerializeToString()
+        self._serialized = serialized
+        return super(PersistedConfigDataRevision, self)._hash_data(
+            data, serialized)
+
+    def pop_serialized(self):
+        """Return serialized data (once), or None if no longer available"""
+        serialized, self._serialized = self._serialized, None
+        return serialized
+
+
 class PersistedConfigRevision(ConfigRevision):
 
     compress = False
 
-    __slots__ = ('_kv_store',)
+    __slots__ = (
+        '_kv_store',
+        '_children_refs'  # hashes of children not loaded yet (lazy loading)
+    )
 
-    def __init__(self, branch, data, children=None):
+    config_data_cls = PersistedConfigDataRevision
+
+    def __init__(self, branch, data, children=None, serialized=None):
         self._kv_store = branch._node._root.kv_store
-        super(PersistedConfigRevision, self).__init__(branch, data, children)
+        self._children_refs = None
+        super(PersistedConfigRevision, self).__init__(
+            branch, data, children, serialized)
+
+    def __getattr__(self, name):
+        # only called for unset slots: the children of lazily loaded
+        # revisions are loaded from the store on first access
+        if name == '_children' and self._children_refs is not None:
+            self._children_refs[0].load_children([self])
+            return self._children
+        raise AttributeError(name)
 
     def _finalize(self):
         super(PersistedConfigRevision, self)._finalize()
         self.store()
 
-    def __del__(self):
-        try:
-            if self._config.__weakref__ is None:
-                del self._kv_store[self._config._hash]
-            assert self.__weakref__ is None
-            del self._kv_store[self._hash]
-        except Exception, e:
-            # this should never happen
-            log.exception('del-error', hash=hash, e=e)
+    @property
+    def unloaded_children_refs(self):
+        """
+        Return dict of field name to list of children hashes if the
+        children of this revision are not loaded yet, None otherwise
+        """
+        if self._children_refs is None:
+            return None
+        return self._children_refs[1]
 
     def store(self):
-        # crude serialization of children hash and config data hash
+        if self._kv_store is None:
+            # loaded into a tree without a KV store (see ConfigRoot.restore)
+            if isinstance(self._config, PersistedConfigDataRevision):
+                self._config.pop_serialized()
+            return
+
         if self._hash in self._kv_store:
             return
 
         self.store_config()
+        self._kv_store[self._hash] = self.encode(self)
 
+    @classmethod
+    def encode(cls, rev):
+        """Return blob of a (any) config revision, see decode"""
+        # crude serialization of children hash and config data hash
         children_lists = {}
-        for field_name, children in self._children.iteritems():
-            hashes = [rev.hash for rev in children]
+        for field_name, children in rev._children.iteritems():
+            hashes = [child_rev.hash for child_rev in children]
             children_lists[field_name] = hashes
 
         data = dict(
             children=children_lists,
-            config=self._config._hash
+            config=rev._config._hash
         )
         blob = dumps(data)
-        if self.compress:
+        if cls.compress:
             blob = compress(blob)
-
-        self._kv_store[self._hash] = blob
+        return blob
 
     @classmethod
-    def load(cls, branch, kv_store, msg_cls, hash):
-        blob = kv_store[hash]
+    def decode(cls, blob):
+        """Return config hash and dict of children hashes of a rev blob"""
         if cls.compress:
             blob = decompress(blob)
         data = loads(blob)
-
-        config_hash = data['config']
-        config_data = cls.load_config(kv_store, msg_cls, config_hash)
-
-        children_list = data['children']
-        assembled_children = {}
-        node = branch._node
-        for field_name, meta in children_fields(msg_cls).iteritems():
-            child_msg_cls = tmp_cls_loader(meta.module, meta.type)
-            children = []
-            for child_hash in children_list[field_name]:
-                child_node = node._mknode(child_msg_cls)
-                child_node.load_latest(child_hash)
-                child_rev = child_node.latest
-                children.append(child_rev)
-            assembled_children[field_name] = children
-        rev = cls(branch, config_data, assembled_children)
-        return rev
+        return data['config'], data['children']
 
     def store_config(self):
+        # reuse the serialized form made for hashing if we still have it
+        blob = None
+        if isinstance(self._config, PersistedConfigDataRevision):
+            blob = self._config.pop_serialized()
+
         if self._config._hash in self._kv_store:
             return
 
+        self._kv_store[self._config._hash] = self.encode_config(
+            self._config, blob)
+
+    @classmethod
+    def encode_config(cls, config, serialized=None):
+        """Return blob of a config data revision, see decode_config"""
         # crude serialization of config data
-        blob = self._config._data.SerializeToString()
-        if self.compress:
+        blob = serialized
+        if blob is None:
+            blob = config._data.SerializeToString()
+        if cls.compress:
             blob = compress(blob)
-        self._kv_store[self._config._hash] = blob
+        return blob
 
     @classmethod
-    def load_config(cls, kv_store, msg_cls, config_hash):
-        blob = kv_store[config_hash]
+    def decode_config(cls, msg_cls, blob):
         if cls.compress:
             blob = decompress(blob)
 
@@ -120,6 +164,134 @@ class PersistedConfigRevision(ConfigRevision):
         return data
 
 
+class PersistedTreeLoader(object):
+    """
+    Loads a persisted config (sub)tree breadth first, fetching all blobs of
+    a tree level at once, using the get_many(keys) method of the KV store if
+    it has one. With lazy=True, the children of a revision are only loaded
+    (again a level at a time) when they are first accessed.
+    Revisions are keyed by their content hash in the store, so loaded
+    revisions adopt the hash they are stored under instead of re-hashing
+    their content.
+    """
+
+    __slots__ = (
+        '_kv_store',
+        '_rev_cls',
+        '_lazy',
+        'fetched'  # number of blobs fetched so far
+    )
+
+    def __init__(self, kv_store, rev_cls=PersistedConfigRevision, lazy=False):
+        self._kv_store = kv_store
+        self._rev_cls = rev_cls
+        self._lazy = lazy
+        self.fetched = 0
+
+    def load(self, node, hash):
+        """Load the revision with given hash as latest revision of node"""
+        refs = self._fetch_refs([hash])
+        configs = self._fetch_configs({refs[hash][0]: node._type})
+        rev = self._mkrev(node, hash, refs[hash], configs)
+        if not self._lazy:
+            level = [rev]
+            while level:
+                level = self.load_children(level)
+        return rev
+
+    def load_children(self, revs):
+        """
+        Load the children of given revisions, returning the list of child
+        revisions (whose own children are not loaded yet)
+        """
+        child_classes = {}  # child hash -> msg class
+        for rev in revs:
+            children_refs = rev._children_refs[1]
+            for field_name, meta in children_fields(rev.type).iteritems():
+                child_msg_cls = tmp_cls_loader(meta.module, meta.type)
+                for child_hash in children_refs[field_name]:
+                    child_classes[child_hash] = child_msg_cls
+        refs = self._fetch_refs(child_classes.iterkeys())
+        configs = self._fetch_configs(dict(
+            (refs[h][0], msg_cls) for h, msg_cls in child_classes.iteritems()))
+
+        next_level = []
+        for rev in revs:
+            children_refs = rev._children_refs[1]
+            node = rev.node
+            assembled_children = {}
+            for field_name, meta in children_fields(rev.type).iteritems():
+                children = []
+                for child_hash in children_refs[field_name]:
+                    child_node = node._mknode(child_classes[child_hash])
+                    children.append(self._mkrev(
+                        child_node, child_hash, refs[child_hash], configs))
+                next_level.extend(children)
+                if meta.key:
+                    children = KeyedChildren.from_revs(meta.key, children)
+                assembled_children[field_name] = children
+            rev._children = assembled_children
+            rev._children_refs = None
+        return next_level
+
+    def _fetch(self, keys):
+        if not keys:
+            return []
+        get_many = getattr(self._kv_store, 'get_many', None)
+        if get_many is not None:
+            blobs = get_many(keys)
+        else:
+            blobs = [self._kv_store[key] for key in keys]
+        self.fetched += len(keys)
+        return blobs
+
+    def _fetch_refs(self, hashes):
+        hashes = list(hashes)
+        decode = self._rev_cls.decode
+        return dict((hash, decode(blob)) for hash, blob in
+                    zip(hashes, self._fetch(hashes)))
+
+    def _fetch_configs(self, msg_classes):
+        """Return dict of config data revisions for config hash -> class"""
+        configs = {}
+        missing = []
+        for config_hash in msg_classes:
+            # config data already in memory is shared, not loaded again
+            config = _rev_cache.get(config_hash)
+            if config is not None:
+                configs[config_hash] = config
+            else:
+                missing.append(config_hash)
+        decode = self._rev_cls.decode_config
+        data_cls = self._rev_cls.config_data_cls
+        for config_hash, blob in zip(missing, self._fetch(missing)):
+            config = data_cls.__new__(data_cls)
+            config._data = decode(msg_classes[config_hash], blob)
+            config._hash = config_hash
+            if isinstance(config, PersistedConfigDataRevision):
+                config._serialized = None
+            _rev_cache[config_hash] = configs[config_hash] = config
+        return configs
+
+    def _mkrev(self, node, hash, refs, configs):
+        config_hash, children_refs = refs
+        branch = ConfigBranch(node, auto_prune=node._auto_prune)
+        rev = self._rev_cls.__new__(self._rev_cls)
+        rev._branch = branch
+        # the revision (and those derived from it) store into the KV store
+        # of the tree, which need not be the one it is loaded from
+        rev._kv_store = node._root._kv_store
+        rev._config = configs[config_hash]
+        rev._hash = hash
+        rev._children_refs = (self, children_refs)
+        if hash not in _rev_cache:
+            _rev_cache[hash] = rev
+        branch._latest = rev
+        branch._revs[hash] = rev
+        node._branches[None] = branch
+        return rev
+
+
 def tmp_cls_loader(module_name, cls_name):
     # TODO this shall be generalized
     from voltha.protos import voltha_pb2, health_pb2, adapter_pb2, \
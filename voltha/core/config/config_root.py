@@ -13,14 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
 from uuid import uuid4
 
 import structlog
 from simplejson import dumps, loads
 
+from voltha.core.config.config_checkpoint import write_checkpoint, \
+    read_checkpoint, ConfigJournal
+from voltha.core.config.config_gc import PersistedRevisionCollector
 from voltha.core.config.config_node import ConfigNode
 from voltha.core.config.config_rev import ConfigRevision
-from voltha.core.config.config_rev_persisted import PersistedConfigRevision
+from voltha.core.config.config_rev_persisted import PersistedConfigRevision, \
+    PersistedTreeLoader
+from voltha.core.config.config_write_behind import WriteBehindKVStore
 from voltha.core.config.merge_3way import MergeConflictException
 
 log = structlog.get_logger()
@@ -33,10 +39,20 @@ class ConfigRoot(ConfigNode):
         '_kv_store',
         '_loading',
         '_rev_cls',
-        '_deferred_callback_queue'
+        '_deferred_callback_queue',
+        '_journal',  # ConfigJournal after a checkpoint was made, or None
+        '_collector',  # PersistedRevisionCollector of the kv_store, or None
+        '__weakref__'
     )
 
-    def __init__(self, initial_data, kv_store=None, rev_cls=ConfigRevision):
+    def __init__(self, initial_data, kv_store=None, rev_cls=ConfigRevision,
+                 persistence=None):
+        """
+        :param persistence: dict of persistence settings (see the core
+        section of voltha.yml), only used with a kv_store
+        """
+        if kv_store is not None:
+            kv_store = self._wrap_kv_store(kv_store, persistence)
         self._kv_store = kv_store
         self._dirty_nodes = {}
         self._loading = False
@@ -45,7 +61,11 @@ class ConfigRoot(ConfigNode):
             rev_cls = PersistedConfigRevision
         self._rev_cls = rev_cls
         self._deferred_callback_queue = []
+        self._journal = None
+        self._collector = None
         super(ConfigRoot, self).__init__(self, initial_data, False)
+        if kv_store is not None:
+            self._start_collector(persistence)
 
     @property
     def kv_store(self):
@@ -57,6 +77,28 @@ class ConfigRoot(ConfigNode):
         else:
             return self._kv_store
 
+    @staticmethod
+    def _wrap_kv_store(kv_store, persistence):
+        """
+        Buffer the writes to kv_store, unless disabled in the write_behind
+        settings, so that they are flushed in bulk
+        """
+        settings = dict((persistence or {}).get('write_behind') or {})
+        if isinstance(kv_store, WriteBehindKVStore) or \
+                not settings.pop('enabled', True):
+            return kv_store
+        return WriteBehindKVStore(kv_store, **settings)
+
+    def _start_collector(self, persistence):
+        """
+        Reclaim the blobs of the revisions no longer referred to in the
+        background, unless disabled in the gc settings
+        """
+        settings = dict((persistence or {}).get('gc') or {})
+        if settings.pop('enabled', True):
+            self._collector = PersistedRevisionCollector(
+                self, **settings).start()
+
     def mkrev(self, *args, **kw):
         return self._rev_cls(*args, **kw)
 
@@ -72,14 +114,20 @@ class ConfigRoot(ConfigNode):
         del self._dirty_nodes[txid]
 
     def fold_txbranch(self, txid):
+        # compute the merge once; nothing is committed if it fails
+        commits = []
         try:
-            self._merge_txbranch(txid, dry_run=1)
+            self._merge_txbranch(txid, commits)
         except MergeConflictException:
             self.del_txbranch(txid)
             raise
 
         try:
-            self._merge_txbranch(txid)
+            for node, branch, rev, changes in commits:
+                node._make_latest(branch, rev, change_announcements=changes)
+            # only the nodes modified in the transaction have a branch for
+            # it, so this is all the purging needed
+            self.del_txbranch(txid)
         finally:
             self.execute_deferred_callbacks()
 
@@ -154,15 +202,22 @@ class ConfigRoot(ConfigNode):
     # ~~~~~~~~~~~~~~~~ Persistence related ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     @classmethod
-    def load(cls, root_msg_cls, kv_store):
+    def load(cls, root_msg_cls, kv_store, lazy=False, persistence=None):
+        """
+        Recreate config tree from persistence. With lazy=True, subtrees are
+        only loaded from the store when first accessed.
+        """
         # need to use fake kv store during initial load for not to override
         # our real k vstore
         fake_kv_store = dict()  # shall use more efficient mock dict
         root = cls(root_msg_cls(), kv_store=fake_kv_store,
-                   rev_cls=PersistedConfigRevision)
+                   rev_cls=PersistedConfigRevision,
+                   persistence=dict(write_behind=dict(enabled=False),
+                                    gc=dict(enabled=False)))
         # we can install the real store now
-        root._kv_store = kv_store
-        root.load_from_persistence(root_msg_cls)
+        root._kv_store = cls._wrap_kv_store(kv_store, persistence)
+        root.load_from_persistence(root_msg_cls, lazy)
+        root._start_collector(persistence)
         return root
 
     def _make_latest(self, branch, *args, **kw):
@@ -175,8 +230,10 @@ class ConfigRoot(ConfigNode):
             )
             blob = dumps(root_data)
             self._kv_store['root'] = blob
+        if self._journal is not None and branch._txid is None:
+            self._journal.append(branch._latest)
 
-    def load_from_persistence(self, root_msg_cls):
+    def load_from_persistence(self, root_msg_cls, lazy=False):
         self._loading = True
         blob = self._kv_store['root']
         root_data = loads(blob)
@@ -184,7 +241,68 @@ class ConfigRoot(ConfigNode):
         for tag, hash in root_data['tags'].iteritems():
             raise NotImplementedError()
 
-        self.load_latest(root_data['latest'])
+        self.load_latest(root_data['latest'], lazy)
 
         self._loading = False
 
+    def flush(self):
+        """Write the changes buffered for the KV store through to it"""
+        flush = getattr(self._kv_store, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        """
+        Stop collecting garbage, flush buffered changes to the KV store (the
+        root pointer last) and close the journal, if any
+        """
+        if self._collector is not None:
+            self._collector.stop()
+        self.close_journal()
+        self.flush()
+
+    def persistence_stats(self):
+        """Return dict of the counters of the KV store garbage collector"""
+        if self._collector is None:
+            return {}
+        return dict(gc=self._collector.stats())
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Checkpoints ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def checkpoint(self, path, codec='none', journal=True, sync=False):
+        """
+        Write the latest config tree into a checkpoint file at path. Unless
+        journal is False, all revisions committed after the checkpoint are
+        journaled into path + '.journal' (fsync-ed after each commit if
+        sync is True). A new checkpoint replaces the previous checkpoint
+        and journal.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        latest = self.latest
+        write_checkpoint(latest, path, codec)
+        if journal:
+            self._journal = ConfigJournal(
+                path + '.journal', latest, codec, sync=sync)
+        elif os.path.exists(path + '.journal'):
+            os.remove(path + '.journal')
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    @classmethod
+    def restore(cls, root_msg_cls, path, lazy=False):
+        """
+        Recreate config tree from a checkpoint file and its journal. The
+        restored tree does not journal its changes until checkpoint() is
+        called on it. The blobs read are only held on to until the tree is
+        fully loaded (with lazy=True, until all subtrees were accessed).
+        """
+        latest, blobs = read_checkpoint(path, path + '.journal')
+        root = cls(root_msg_cls())
+        PersistedTreeLoader(blobs, PersistedConfigRevision, lazy).load(
+            root, latest)
+        return root
@@ -0,0 +1,240 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Write-behind KV store wrapper for the persisted config tree.
+
+Every committed config change stores a handful of new blobs and rewrites the
+'root' pointer. When the backing store is remote, each of those is a round
+trip. WriteBehindKVStore buffers the writes and flushes them in bulk, either
+after a time window or once enough data is pending, in an order that keeps
+the backing store consistent after a crash at any point of the flush:
+
+1. all new (content addressed) blobs are written,
+2. then the pointer keys (such as 'root') referring to them,
+3. and only then are blobs deleted that the new root no longer refers to.
+
+Backing stores may implement put_many(items) and delete_many(keys) (e.g.,
+on top of a transaction API) to make use of the batching, and get_many(keys)
+for bulk loads; otherwise the plain dict interface is used one key at a time.
+
+ConfigRoot wraps the KV store it is given in a WriteBehindKVStore, set up
+from the write_behind persistence settings.
+"""
+
+from collections import OrderedDict
+
+import structlog
+
+log = structlog.get_logger()
+
+
+class WriteBehindKVStore(object):
+
+    __slots__ = (
+        '_backend',
+        '_pointer_keys',  # keys flushed after all other writes
+        '_pending',  # key -> blob, not yet written
+        '_pending_pointers',  # key -> blob, not yet written
+        '_pending_deletes',  # keys to delete after the pointers are written
+        '_pending_size',
+        '_max_pending',  # max number of pending entries before a flush
+        '_max_pending_size',  # max number of pending bytes before a flush
+        '_flush_interval',
+        '_clock',
+        '_delayed_flush',
+        'flushes',
+        'written',
+        'deleted'
+    )
+
+    def __init__(self, backend, flush_interval=0.1, max_pending=1000,
+                 max_pending_size=4 * 1024 * 1024, pointer_keys=('root',),
+                 clock=None):
+        """
+        :param backend: dict-like store the data is eventually written to
+        :param flush_interval: max seconds to hold on to a buffered write;
+        None means flushing only on size limits or explicit flush() calls
+        :param max_pending: flush as soon as this many writes are pending
+        :param max_pending_size: flush as soon as this many bytes are pending
+        :param pointer_keys: keys that refer to other blobs, written last
+        :param clock: twisted clock used for scheduling (defaults to reactor)
+        """
+        if clock is None and flush_interval is not None:
+            from twisted.internet import reactor
+            clock = reactor
+        self._backend = backend
+        self._pointer_keys = frozenset(pointer_keys)
+        self._pending = OrderedDict()
+        self._pending_pointers = OrderedDict()
+        self._pending_deletes = OrderedDict()
+        self._pending_size = 0
+        self._max_pending = max_pending
+        self._max_pending_size = max_pending_size
+        self._flush_interval = flush_interval
+        self._clock = clock
+        self._delayed_flush = None
+        self.flushes = 0
+        self.written = 0
+        self.deleted = 0
+
+    @property
+    def backend(self):
+        return self._backend
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ dict interface ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def __getitem__(self, key):
+        if key in self._pending_deletes:
+            raise KeyError(key)
+        blob = self._pending.get(key)
+        if blob is None:
+            blob = self._pending_pointers.get(key)
+        if blob is None:
+            blob = self._backend[key]
+        return blob
+
+    def get_many(self, keys):
+        """
+        Return the list of blobs of keys, fetching those not buffered from
+        the backend in bulk (if it has get_many)
+        """
+        blobs = []
+        missing = []  # (index, key) of blobs to fetch
+        for key in keys:
+            if key in self._pending_deletes:
+                raise KeyError(key)
+            blob = self._pending.get(key)
+            if blob is None:
+                blob = self._pending_pointers.get(key)
+            if blob is None:
+                missing.append((len(blobs), key))
+            blobs.append(blob)
+        if missing:
+            get_many = getattr(self._backend, 'get_many', None)
+            if get_many is not None:
+                fetched = get_many([key for _, key in missing])
+            else:
+                fetched = [self._backend[key] for _, key in missing]
+            for (i, _), blob in zip(missing, fetched):
+                blobs[i] = blob
+        return blobs
+
+    def __contains__(self, key):
+        if key in self._pending_deletes:
+            return False
+        return key in self._pending or key in self._pending_pointers or \
+            key in self._backend
+
+    def keys(self):
+        keys = set(self._backend.keys())
+        keys.update(self._pending.iterkeys())
+        keys.update(self._pending_pointers.iterkeys())
+        keys.difference_update(self._pending_deletes.iterkeys())
+        return list(keys)
+
+    def __setitem__(self, key, blob):
+        self._pending_deletes.pop(key, None)
+        if key in self._pointer_keys:
+            self._pending_pointers[key] = blob
+        else:
+            old_blob = self._pending.pop(key, None)
+            if old_blob is not None:
+                self._pending_size -= len(old_blob)
+            self._pending[key] = blob
+            self._pending_size += len(blob)
+        self._schedule()
+
+    def __delitem__(self, key):
+        old_blob = self._pending.pop(key, None)
+        if old_blob is not None:
+            self._pending_size -= len(old_blob)
+        self._pending_pointers.pop(key, None)
+        self._pending_deletes[key] = None
+        self._schedule()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ flushing ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    @property
+    def pending(self):
+        return len(self._pending) + len(self._pending_pointers) + \
+            len(self._pending_deletes)
+
+    def _schedule(self):
+        if len(self._pending) >= self._max_pending or \
+                self._pending_size >= self._max_pending_size:
+            self.flush()
+        elif self._delayed_flush is None and \
+                self._flush_interval is not None:
+            self._delayed_flush = self._clock.callLater(
+                self._flush_interval, self._flush_delayed)
+
+    def _flush_delayed(self):
+        self._delayed_flush = None
+        try:
+            self.flush()
+        except Exception, e:
+            # keep the data buffered and try again on the next write
+            log.exception('write-behind-flush-failed', e=e)
+
+    def flush(self):
+        """Write all pending changes to the backend store"""
+        if self._delayed_flush is not None:
+            if self._delayed_flush.active():
+                self._delayed_flush.cancel()
+            self._delayed_flush = None
+
+        if not self.pending:
+            return
+
+        # entries are only dropped from the buffers once written, so that a
+        # failed flush can be retried
+        if self._pending:
+            self._put_many(self._pending.items())
+            self.written += len(self._pending)
+            self._pending.clear()
+            self._pending_size = 0
+
+        if self._pending_pointers:
+            self._put_many(self._pending_pointers.items())
+            self.written += len(self._pending_pointers)
+            self._pending_pointers.clear()
+
+        if self._pending_deletes:
+            self._delete_many(self._pending_deletes.keys())
+            self.deleted += len(self._pending_deletes)
+            self._pending_deletes.clear()
+
+        self.flushes += 1
+
+    def _put_many(self, items):
+        put_many = getattr(self._backend, 'put_many', None)
+        if put_many is not None:
+            put_many(items)
+        else:
+            for key, blob in items:
+                self._backend[key] = blob
+
+    def _delete_many(self, keys):
+        delete_many = getattr(self._backend, 'delete_many', None)
+        if delete_many is not None:
+            delete_many(keys)
+        else:
+            for key in keys:
+                try:
+                    del self._backend[key]
+                except KeyError:
+                    pass  # was never flushed
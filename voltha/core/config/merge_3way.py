@@ -17,9 +17,6 @@
 """
 3-way merge function for config rev objects.
 """
-from collections import OrderedDict
-from copy import copy
-
 from voltha.core.config.config_proxy import CallbackType, OperationContext
 from voltha.core.config.config_rev import children_fields
 
@@ -28,12 +25,11 @@ class MergeConflictException(Exception):
     pass
 
 
-def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
+def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func):
     """
     Attempt to merge src_rev into dst_rev but taking into account what have
     changed in both revs since the last known common point, the fork_rev.
-    In case of conflict, raise a MergeConflictException(). If dry run is True,
-    don't actually perform the merge, but detect potential conflicts.
+    In case of conflict, raise a MergeConflictException().
 
     This function recurses into all children nodes stored under the rev and
     performs the merge if the children is also part of a transaction branch.
@@ -43,8 +39,6 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
     :param dst_rev: Target (destination) rev
     :param merge_child_fun: To run a potential merge in all children that
     may need merge (determined from the local changes)
-    :param dry_run: If True, do not perform the merge, but detect merge
-    conflicts.
     :return: The new dst_rev (a new rev instance) the list of changes that
     occurred in this node or any of its children as part of this merge.
     """
@@ -53,20 +47,11 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
     changes = []
 
     class AnalyzeChanges(object):
-        def __init__(self, lst1, lst2, keyname):
-            self.keymap1 = OrderedDict((getattr(rev._config._data, keyname), i)
-                                       for i, rev in enumerate(lst1))
-            self.keymap2 = OrderedDict((getattr(rev._config._data, keyname), i)
-                                       for i, rev in enumerate(lst2))
-            self.added_keys = [
-                k for k in self.keymap2.iterkeys() if k not in self.keymap1]
-            self.removed_keys = [
-                k for k in self.keymap1.iterkeys() if k not in self.keymap2]
-            self.changed_keys = [
-                k for k in self.keymap1.iterkeys()
-                if k in self.keymap2 and
-                    lst1[self.keymap1[k]]._hash != lst2[self.keymap2[k]]._hash
-            ]
+        def __init__(self, lst1, lst2):
+            # lst2 is derived from lst1, so the diff only needs to look at
+            # the parts of the two containers that are not shared
+            self.added_keys, self.removed_keys, self.changed_keys = \
+                lst1.diff(lst2)
 
     # Note: there are a couple of special cases that can be optimized
     # for larer on. But since premature optimization is a bad idea, we
@@ -92,10 +77,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
         dst_list = dst_rev._children[field_name]
 
         if dst_list == src_list:
-            # we do not need to change the dst, however we still need
-            # to complete the branch purging in child nodes so not
-            # to leave dangling branches around
-            [merge_child_func(rev) for rev in src_list]
+            # we do not need to change the dst (the transaction branches
+            # of child nodes are purged by the root)
             continue
 
         if not field.key:
@@ -127,14 +110,13 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
 
                 # We need to analyze only the changes on the incoming rev
                 # since fork
-                src = AnalyzeChanges(fork_list, src_list, field.key)
+                src = AnalyzeChanges(fork_list, src_list)
 
-                new_list = copy(src_list)  # we start from the source list
+                new_list = src_list  # we start from the source list
 
                 for key in src.added_keys:
-                    idx = src.keymap2[key]
-                    new_rev = merge_child_func(new_list[idx])
-                    new_list[idx] = new_rev
+                    new_rev = merge_child_func(src_list.get(key))
+                    new_list = new_list.set(key, new_rev)
                     changes.append(
                         (CallbackType.POST_ADD,
                          new_rev.data))
@@ -144,7 +126,7 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                          #     data=new_rev.data)))
 
                 for key in src.removed_keys:
-                    old_rev = fork_list[src.keymap1[key]]
+                    old_rev = fork_list.get(key)
                     changes.append((
                         CallbackType.POST_REMOVE,
                         old_rev.data))
@@ -154,9 +136,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                         #     data=old_rev.data)))
 
                 for key in src.changed_keys:
-                    idx = src.keymap2[key]
-                    new_rev = merge_child_func(new_list[idx])
-                    new_list[idx] = new_rev
+                    new_rev = merge_child_func(src_list.get(key))
+                    new_list = new_list.set(key, new_rev)
                     # updated child gets its own change event
 
                 new_children[field_name] = new_list
@@ -167,23 +148,22 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                 # added, removed, or changed in both branches and do a
                 # fine-grained collision detection and merge
 
-                src = AnalyzeChanges(fork_list, src_list, field.key)
-                dst = AnalyzeChanges(fork_list, dst_list, field.key)
+                src = AnalyzeChanges(fork_list, src_list)
+                dst = AnalyzeChanges(fork_list, dst_list)
 
-                new_list = copy(dst_list)  # this time we start with the dst
+                new_list = dst_list  # this time we start with the dst
 
                 for key in src.added_keys:
                     # we cannot add if it has been added and is different
                     if key in dst.added_keys:
                         # it has been added to both, we need to check if
                         # they are the same
-                        child_dst_rev = dst_list[dst.keymap2[key]]
-                        child_src_rev = src_list[src.keymap2[key]]
+                        child_dst_rev = dst_list.get(key)
+                        child_src_rev = src_list.get(key)
                         if child_dst_rev.hash == child_src_rev.hash:
                             # they match, so we do not need to change the
-                            # dst list, but we still need to purge the src
-                            # branch
-                            merge_child_func(child_dst_rev)
+                            # dst list
+                            pass
                         else:
                             raise MergeConflictException(
                                 'Cannot add because it has been added and '
@@ -191,8 +171,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                             )
                     else:
                         # this is a brand new key, need to add it
-                        new_rev = merge_child_func(src_list[src.keymap2[key]])
-                        new_list.append(new_rev)
+                        new_rev = merge_child_func(src_list.get(key))
+                        new_list = new_list.set(key, new_rev)
                         changes.append((
                             CallbackType.POST_ADD,
                             new_rev.data))
@@ -210,32 +190,29 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                     # if it changed in dst as well, we need to check if they
                     # match (same change
                     elif key in dst.changed_keys:
-                        child_dst_rev = dst_list[dst.keymap2[key]]
-                        child_src_rev = src_list[src.keymap2[key]]
+                        child_dst_rev = dst_list.get(key)
+                        child_src_rev = src_list.get(key)
                         if child_dst_rev.hash == child_src_rev.hash:
                             # they match, so we do not need to change the
-                            # dst list, but we still need to purge the src
-                            # branch
-                            merge_child_func(child_src_rev)
+                            # dst list
+                            pass
                         elif child_dst_rev._config.hash != child_src_rev._config.hash:
                             raise MergeConflictException(
                                 'Cannot update because it has been changed and '
                                 'different'
                             )
                         else:
-                            new_rev = merge_child_func(
-                                src_list[src.keymap2[key]])
-                            new_list[dst.keymap2[key]] = new_rev
+                            new_rev = merge_child_func(child_src_rev)
+                            new_list = new_list.set(key, new_rev)
                             # no announcement for child update
 
                     else:
                         # it only changed in src branch
-                        new_rev = merge_child_func(src_list[src.keymap2[key]])
-                        new_list[dst.keymap2[key]] = new_rev
+                        new_rev = merge_child_func(src_list.get(key))
+                        new_list = new_list.set(key, new_rev)
                         # no announcement for child update
 
-                for key in reversed(src.removed_keys):  # we go from highest
-                                                        # index to lowest
+                for key in reversed(src.removed_keys):
 
                     # we cannot remove if it has changed in dst
                     if key in dst.changed_keys:
@@ -244,8 +221,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
 
                     # if it has not been removed yet from dst, then remove it
                     if key not in dst.removed_keys:
-                        dst_idx = dst.keymap2[key]
-                        old_rev = new_list.pop(dst_idx)
+                        old_rev = new_list.get(key)
+                        new_list = new_list.remove(key)
                         changes.append((
                             CallbackType.POST_REMOVE,
                             old_rev.data))
@@ -256,12 +233,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
 
                 new_children[field_name] = new_list
 
-    if not dry_run:
-        rev = src_rev if config_changed else dst_rev
-        rev = rev.update_all_children(new_children, dst_rev._branch)
-        if config_changed:
-            changes.append((CallbackType.POST_UPDATE, rev.data))
-        return rev, changes
-
-    else:
-        return None, None
+    rev = src_rev if config_changed else dst_rev
+    rev = rev.update_all_children(new_children, dst_rev._branch)
+    if config_changed:
+        changes.append((CallbackType.POST_UPDATE, rev.data))
+    return rev, changes
@@ -25,6 +25,7 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from zope.interface import implementer
 
 from voltha.core.config.config_proxy import CallbackType
+from voltha.core.config.config_rev import set_hash_backend
 from voltha.core.device_agent import DeviceAgent
 from voltha.core.dispatcher import Dispatcher
 from voltha.core.global_handler import GlobalHandler
@@ -41,7 +42,18 @@ log = structlog.get_logger()
 @implementer(IComponent)
 class VolthaCore(object):
 
-    def __init__(self, instance_id, version, log_level):
+    def __init__(self, instance_id, version, log_level, config=None,
+                 kv_store=None):
+        """
+        :param config: the core section of voltha.yml
+        :param kv_store: dict-like store to persist the local config tree
+        in, or None to keep it in memory only
+        """
+        config = config or {}
+        # config trees are only created once the handlers are started
+        hash_backend = config.get('hash_backend') or {}
+        set_hash_backend(hash_backend.get('name', 'md5'),
+                         hash_backend.get('digest_size', 6))
         self.instance_id = instance_id
         self.stopped = False
         self.dispatcher = Dispatcher(self, instance_id)
@@ -52,6 +64,8 @@ class VolthaCore(object):
             log_level=log_level)
         self.local_handler = LocalHandler(
             core=self,
+            kv_store=kv_store,
+            persistence=config.get('persistence'),
             instance_id=instance_id,
             version=version,
             log_level=log_level)
@@ -78,6 +92,7 @@ class VolthaCore(object):
     def stop(self):
         log.debug('stopping')
         self.stopped = True
+        self.local_handler.stop()
         log.info('stopped')
 
     def get_local_handler(self):
@@ -18,12 +18,17 @@
 A device agent is instantiated for each Device and plays an important role
 between the Device object and its adapter.
 """
+from collections import OrderedDict
+
 import structlog
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, \
+    maybeDeferred, DeferredLock
 
 from voltha.core.config.config_proxy import CallbackType
+from voltha.core.flow_stats import FlowStatsTable
 from voltha.protos.common_pb2 import AdminState, OperStatus
+from voltha.protos.openflow_13_pb2 import FlowChanges, FlowGroupChanges
 from voltha.registry import registry
 
 
@@ -61,6 +66,17 @@ class DeviceAgent(object):
         self.adapter_agent = None
         self.log = structlog.get_logger(device_id=initial_data.id)
 
+        # flows and groups last passed down to the adapter, to derive the
+        # changes for adapters accepting incremental flow updates
+        self._last_flows = OrderedDict()  # flow id -> flow
+        self._last_groups = OrderedDict()  # group id -> group
+        # incremental updates are passed down one at a time, so that each is
+        # diffed against the changes the device already has
+        self._flow_update_lock = DeferredLock()
+
+        # flow counters reported by the adapter, kept out of the flow table
+        self.flow_stats = FlowStatsTable()
+
     @inlineCallbacks
     def start(self):
         self.log.debug('starting')
@@ -194,8 +210,14 @@ class DeviceAgent(object):
         self.log.debug('flow-table-updated',
                   logical_device_id=self.last_data.id, flows=flows)
 
+        self.flow_stats.retain(f.id for f in flows.items)
+
+        # if device accepts add/remove flow updates, pass down the changes
+        if self.device_type.accepts_add_remove_flow_updates:
+            yield self._update_flows_incrementally(flows=flows)
+
         # if device accepts bulk flow update, lets just call that
-        if self.device_type.accepts_bulk_flow_update:
+        elif self.device_type.accepts_bulk_flow_update:
             groups = self.groups_proxy.get('/') # gather flow groups
             yield self.adapter_agent.update_flows_bulk(
                 device=self.last_data,
@@ -203,9 +225,6 @@ class DeviceAgent(object):
                 groups=groups)
             # TODO place to feed back completion
 
-        elif self.accepts_add_remove_flow_updates:
-            raise NotImplementedError()
-
         else:
             raise NotImplementedError()
 
@@ -217,8 +236,12 @@ class DeviceAgent(object):
                   logical_device_id=self.last_data.id,
                   flow_groups=groups)
 
+        # if device accepts add/remove flow updates, pass down the changes
+        if self.device_type.accepts_add_remove_flow_updates:
+            yield self._update_flows_incrementally(groups=groups)
+
         # if device accepts bulk flow update, lets just call that
-        if self.device_type.accepts_bulk_flow_update:
+        elif self.device_type.accepts_bulk_flow_update:
             flows = self.flows_proxy.get('/')  # gather flows
             yield self.adapter_agent.update_flows_bulk(
                 device=self.last_data,
@@ -226,9 +249,63 @@ class DeviceAgent(object):
                 groups=groups)
             # TODO place to feed back completion
 
-        elif self.accepts_add_remove_flow_updates:
-            raise NotImplementedError()
-
         else:
             raise NotImplementedError()
 
+    def _update_flows_incrementally(self, flows=None, groups=None):
+        return self._flow_update_lock.run(
+            self._do_update_flows_incrementally, flows, groups)
+
+    def _do_update_flows_incrementally(self, flows, groups):
+        flow_changes = FlowChanges()
+        group_changes = FlowGroupChanges()
+        new_flows, new_groups = self._last_flows, self._last_groups
+
+        if flows is not None:
+            new_flows, to_add, to_remove = self._diff(
+                self._last_flows, flows.items, lambda f: f.id)
+            flow_changes.to_add.items.extend(to_add)
+            flow_changes.to_remove.items.extend(to_remove)
+
+        if groups is not None:
+            new_groups, to_add, to_remove = self._diff(
+                self._last_groups, groups.items, lambda g: g.desc.group_id)
+            group_changes.to_add.items.extend(to_add)
+            group_changes.to_remove.items.extend(to_remove)
+
+        if not (flow_changes.to_add.items or flow_changes.to_remove.items or
+                group_changes.to_add.items or group_changes.to_remove.items):
+            self.log.debug('no-op')
+            return None
+
+        def commit(result):
+            # only once the device has the changes are they left out of the
+            # next diff
+            self._last_flows = new_flows
+            self._last_groups = new_groups
+            return result
+
+        def failed(failure):
+            self.log.error('incremental-flow-update-failed',
+                           device_id=self.last_data.id, failure=failure)
+            return failure
+
+        d = maybeDeferred(self.adapter_agent.update_flows_incrementally,
+                          device=self.last_data,
+                          flow_changes=flow_changes,
+                          group_changes=group_changes)
+        d.addCallbacks(commit, failed)
+        return d
+
+    @staticmethod
+    def _diff(last, items, key):
+        """
+        Compare the items last passed down with the new ones; return the new
+        items by key, the items to add and the items to remove (a modified
+        item is removed in its old, and added in its new form)
+        """
+        new = OrderedDict((key(item), item) for item in items)
+        to_add = [item for k, item in new.iteritems() if last.get(k) != item]
+        to_remove = [item for k, item in last.iteritems()
+                     if new.get(k) != item]
+        return new, to_add, to_remove
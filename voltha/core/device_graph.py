@@ -19,6 +19,66 @@ import networkx as nx
 from voltha.core.flow_decomposer import RouteHop
 
 
+class RouteTable(dict):
+    """
+    Routes between the boundary (logical) ports of a logical device, as
+    dict of (ingress port no, egress port no) -> [ingress hop, egress hop],
+    indexed for the lookup of half-routes by ingress or egress port only,
+    and for the removal of all routes from or to a port.
+    """
+
+    __slots__ = (
+        '_port_routes',  # port no -> set of keys of the routes from/to it
+        '_ingress_routes',  # ingress port no -> key of a route from it
+        '_egress_routes'  # egress port no -> key of a route to it
+    )
+
+    def __init__(self):
+        super(RouteTable, self).__init__()
+        self._port_routes = {}
+        self._ingress_routes = {}
+        self._egress_routes = {}
+
+    def add_route(self, ingress_port_no, egress_port_no, route):
+        key = (ingress_port_no, egress_port_no)
+        self[key] = route
+        self._port_routes.setdefault(ingress_port_no, set()).add(key)
+        self._port_routes.setdefault(egress_port_no, set()).add(key)
+        self._ingress_routes.setdefault(ingress_port_no, key)
+        self._egress_routes.setdefault(egress_port_no, key)
+
+    def remove_port_routes(self, port_no):
+        """Remove all routes from or to the given port"""
+        for key in self._port_routes.pop(port_no, ()):
+            del self[key]
+            ingress_port_no, egress_port_no = key
+            other_port_no = egress_port_no \
+                if ingress_port_no == port_no else ingress_port_no
+            other_keys = self._port_routes[other_port_no]
+            other_keys.discard(key)
+            if self._ingress_routes.get(ingress_port_no) == key:
+                self._reindex(self._ingress_routes, ingress_port_no, 0)
+            if self._egress_routes.get(egress_port_no) == key:
+                self._reindex(self._egress_routes, egress_port_no, 1)
+            if not other_keys:
+                del self._port_routes[other_port_no]
+
+    def _reindex(self, index, port_no, i):
+        for key in self._port_routes.get(port_no, ()):
+            if key[i] == port_no:
+                index[port_no] = key
+                return
+        del index[port_no]
+
+    def half_route_from(self, ingress_port_no):
+        """Return [ingress hop, None] of any route from the ingress port"""
+        return [self[self._ingress_routes[ingress_port_no]][0], None]
+
+    def half_route_to(self, egress_port_no):
+        """Return [None, egress hop] of any route to the egress port"""
+        return [None, self[self._egress_routes[egress_port_no]][1]]
+
+
 class DeviceGraph(object):
 
     """
@@ -26,98 +86,190 @@ class DeviceGraph(object):
     a logical device.
     """
 
+    # graph and routes of the last compute_routes call, kept up to date by
+    # add_logical_port and remove_logical_port
+    _graph = None
+    _boundary_ports = None  # (device id, port no) -> logical port no
+    _routes = None
+
     def compute_routes(self, root_proxy, logical_ports):
         boundary_ports, graph = self._build_graph(root_proxy, logical_ports)
         routes = self._build_routes(boundary_ports, graph)
+        self._graph = graph
+        self._boundary_ports = boundary_ports
+        self._routes = routes
         return graph, routes
 
+    def add_logical_port(self, root_proxy, logical_port):
+        """
+        Add a logical port to the graph of the last compute_routes call,
+        along with its device (and the devices linked to it) unless already
+        in the graph, and add the routes from and to the port. The routes
+        between other ports are not affected, as we deal with single fan-out
+        (tree) networks.
+        :return: list of ids of the devices added to the graph
+        """
+        graph = self._graph
+        boundary_ports = self._boundary_ports
+        port_id = (logical_port.device_id, logical_port.device_port_no)
+        if port_id in boundary_ports:
+            self.remove_logical_port(logical_port)
+        boundary_ports[port_id] = logical_port.ofp_port.port_no
+
+        device_id = logical_port.device_id
+        if device_id not in graph:
+            new_devices = [root_proxy.get('/devices/{}'.format(device_id))]
+        elif port_id not in graph:
+            # the port was added to a device already in the graph
+            ports = root_proxy.get('/devices/{}/ports'.format(device_id))
+            new_devices = self._add_ports(
+                root_proxy, graph, boundary_ports, device_id, ports)
+        else:
+            graph.node[port_id]['boundary'] = True
+            new_devices = []
+        device_ids = self._add_devices(
+            root_proxy, graph, boundary_ports, new_devices)
+
+        self._add_routes(graph, boundary_ports, self._routes, port_id,
+                         both_ways=True)
+        return device_ids
+
+    def remove_logical_port(self, logical_port):
+        """
+        Remove a logical port and the routes from and to it from the graph
+        of the last compute_routes call. A leaf device (linked to a single
+        peer) left without logical ports is removed from the graph as well.
+        :return: list of ids of the devices removed from the graph
+        """
+        graph = self._graph
+        port_id = (logical_port.device_id, logical_port.device_port_no)
+        port_no = self._boundary_ports.pop(port_id, None)
+        if port_no is None:
+            return []
+        self._routes.remove_port_routes(port_no)
+        if port_id not in graph:
+            return []
+        graph.node[port_id]['boundary'] = False
+
+        device_id = logical_port.device_id
+        port_ids = list(graph.neighbors(device_id))
+        peer_links = 0
+        for device_port_id in port_ids:
+            if graph.node[device_port_id]['boundary']:
+                return []
+            peer_links += graph.degree(device_port_id) - 1
+        if peer_links > 1:
+            return []
+        graph.remove_nodes_from(port_ids + [device_id])
+        return [device_id]
+
     def _build_graph(self, root_proxy, logical_ports):
 
         graph = nx.Graph()
 
-        # walk logical device's device and port links to discover full graph
-        devices_added = set()  # set of device.id's
-        ports_added = set()  # set of (device.id, port_no) tuples
-        peer_links = set()
-
         boundary_ports = dict(
             ((lp.device_id, lp.device_port_no), lp.ofp_port.port_no)
             for lp in logical_ports
         )
 
-        def add_device(device):
-            if device.id in devices_added:
-                return
-
-            graph.add_node(device.id, device=device)
-            devices_added.add(device.id)
-
-            ports = root_proxy.get('/devices/{}/ports'.format(device.id))
-            for port in ports:
-                port_id = (device.id, port.port_no)
-                if port_id not in ports_added:
-                    boundary = port_id in boundary_ports
-                    graph.add_node(port_id, port=port, boundary=boundary)
-                    graph.add_edge(device.id, port_id)
-                for peer in port.peers:
-                    if peer.device_id not in devices_added:
-                        peer_device = root_proxy.get(
-                            '/devices/{}'.format(peer.device_id))
-                        add_device(peer_device)
-                    else:
-                        peer_port_id = (peer.device_id, peer.port_no)
-                        if port_id < peer_port_id:
-                            peer_link = (port_id, peer_port_id)
-                        else:
-                            peer_link = (peer_port_id, port_id)
-                        if peer_link not in peer_links:
-                            graph.add_edge(*peer_link)
-                            peer_links.add(peer_link)
-
+        # walk logical device's device and port links to discover full graph
         for logical_port in logical_ports:
             device_id = logical_port.device_id
-            device = root_proxy.get('/devices/{}'.format(device_id))
-            add_device(device)
+            if device_id not in graph:
+                device = root_proxy.get('/devices/{}'.format(device_id))
+                self._add_devices(root_proxy, graph, boundary_ports, [device])
 
         return boundary_ports, graph
 
-    def _build_routes(self, boundary_ports, graph):
-
-        routes = {}
+    def _add_devices(self, root_proxy, graph, boundary_ports, devices):
+        """
+        Add devices with their ports to the graph, followed by the devices
+        they are linked to (and so on) not in the graph yet; return the ids
+        of the devices added
+        """
+        device_ids = []
+        devices = list(devices)
+        while devices:
+            device = devices.pop()
+            if device.id in graph:
+                continue
+            graph.add_node(device.id, device=device)
+            device_ids.append(device.id)
+            ports = root_proxy.get('/devices/{}/ports'.format(device.id))
+            devices.extend(self._add_ports(
+                root_proxy, graph, boundary_ports, device.id, ports))
+        return device_ids
 
-        for source, source_port_no in boundary_ports.iteritems():
-            for target, target_port_no in boundary_ports.iteritems():
+    def _add_ports(self, root_proxy, graph, boundary_ports, device_id, ports):
+        """
+        Add the ports of a device not in the graph yet, and their links to
+        peer ports in the graph; return the peer devices not in the graph
+        """
+        peer_devices = []
+        for port in ports:
+            port_id = (device_id, port.port_no)
+            if port_id in graph:
+                continue
+            boundary = port_id in boundary_ports
+            graph.add_node(port_id, port=port, boundary=boundary)
+            graph.add_edge(device_id, port_id)
+            for peer in port.peers:
+                peer_port_id = (peer.device_id, peer.port_no)
+                if peer_port_id in graph:
+                    graph.add_edge(port_id, peer_port_id)
+                elif peer.device_id not in graph:
+                    peer_devices.append(root_proxy.get(
+                        '/devices/{}'.format(peer.device_id)))
+        return peer_devices
 
-                if source is target:
-                    continue
+    def _build_routes(self, boundary_ports, graph):
+        routes = RouteTable()
+        for source in boundary_ports:
+            self._add_routes(graph, boundary_ports, routes, source)
+        return routes
 
-                path = nx.shortest_path(graph, source, target)
+    def _add_routes(self, graph, boundary_ports, routes, source,
+                    both_ways=False):
+        """
+        Add the routes from the given boundary port (and to it if both_ways
+        is set) to all other boundary ports
+        """
+        source_port_no = boundary_ports[source]
 
-                # number of nodes in valid paths is always multiple of 3
-                if len(path) % 3:
-                    continue
+        # in fact, we currently deal with single fan-out networks, so
+        # valid paths always span two devices (6 nodes), and a single
+        # breadth-first search limited to that depth finds them all
+        paths = nx.single_source_shortest_path(graph, source, cutoff=5)
 
-                # in fact, we currently deal with single fan-out networks,
-                # so the number of hops is always 6
-                assert len(path) == 6
+        for target, path in paths.iteritems():
 
-                ingress_input_port, ingress_device, ingress_output_port, \
-                egress_input_port, egress_device, egress_output_port = path
+            target_port_no = boundary_ports.get(target)
+            if target_port_no is None or target == source:
+                continue
 
-                ingress_hop = RouteHop(
-                    device=graph.node[ingress_device]['device'],
-                    ingress_port=graph.node[ingress_input_port]['port'],
-                    egress_port=graph.node[ingress_output_port]['port']
-                )
-                egress_hop = RouteHop(
-                    device=graph.node[egress_device]['device'],
-                    ingress_port=graph.node[egress_input_port]['port'],
-                    egress_port=graph.node[egress_output_port]['port']
-                )
+            # number of nodes in valid paths is always multiple of 3
+            if len(path) % 3:
+                continue
 
-                routes[(source_port_no, target_port_no)] = [
-                    ingress_hop, egress_hop
-                ]
+            routes.add_route(source_port_no, target_port_no,
+                             self._mk_route(graph, path))
+            if both_ways:
+                routes.add_route(target_port_no, source_port_no,
+                                 self._mk_route(graph, path[::-1]))
 
-        return routes
+    @staticmethod
+    def _mk_route(graph, path):
+        ingress_input_port, ingress_device, ingress_output_port, \
+        egress_input_port, egress_device, egress_output_port = path
 
+        ingress_hop = RouteHop(
+            device=graph.node[ingress_device]['device'],
+            ingress_port=graph.node[ingress_input_port]['port'],
+            egress_port=graph.node[ingress_output_port]['port']
+        )
+        egress_hop = RouteHop(
+            device=graph.node[egress_device]['device'],
+            ingress_port=graph.node[egress_input_port]['port'],
+            egress_port=graph.node[egress_output_port]['port']
+        )
+        return [ingress_hop, egress_hop]
@@ -0,0 +1,258 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Index of flows by their match, answering overlap and covered-by queries
+without comparing a match against every flow of a table.
+
+Flows of the same table and priority are grouped by the signature of their
+match (the types of its fields, with their masks), as in tuple space search.
+The flows of a group are kept in a trie keyed by their masked field values,
+one level per field of the signature, in field type order. A query descends
+into a single child at each level where it is at least as specific as the
+signature, and only scans the children of a level where it is not.
+"""
+
+from binascii import hexlify
+
+from voltha.protos import openflow_13_pb2 as ofp
+
+# all bits set, for fields which are not masked; wider than any field
+_EXACT = (1 << 128) - 1
+
+# bit width of maskable field values
+_mask_widths = {
+    'table_metadata': 64,
+    'eth_dst': 48,
+    'eth_src': 48,
+    'vlan_vid': 13,
+    'ipv4_src': 32,
+    'ipv4_dst': 32,
+    'arp_spa': 32,
+    'arp_tpa': 32,
+    'ipv6_src': 128,
+    'ipv6_dst': 128,
+    'ipv6_flabel': 20,
+    'pbb_isid': 24,
+    'tunnel_id': 64,
+    'ipv6_exthdr': 9
+}
+
+
+def _to_int(value):
+    if isinstance(value, bytes):
+        return int(hexlify(value), 16) if value else 0
+    return value
+
+
+def match_fields(match):
+    """
+    Return dict of field type -> (value, mask) of the OpenFlow basic fields
+    of a match (ofp_match), with values and masks as integers. The mask of
+    a field without mask has all bits set.
+    """
+    fields = {}
+    for oxm_field in match.oxm_fields:
+        assert oxm_field.oxm_class == ofp.OFPXMC_OPENFLOW_BASIC
+        field = oxm_field.ofb_field
+        value_name = field.WhichOneof('value')
+        value = _to_int(getattr(field, value_name)) if value_name else 0
+        mask = _EXACT
+        if field.has_mask:
+            mask_name = field.WhichOneof('mask')
+            if mask_name is not None:
+                # bits beyond the width of the field are always set, so
+                # that a mask with all bits of the field set is exact
+                width = _mask_widths[value_name]
+                mask = _to_int(getattr(field, mask_name)) | \
+                    (_EXACT ^ ((1 << width) - 1))
+        fields[field.type] = (value & mask, mask)
+    return fields
+
+
+def match_covers(match, covered_match):
+    """
+    Return True if every packet matching covered_match matches match, i.e.,
+    if match is the same or less specific, as for non-strict flow mods
+    """
+    covered_fields = match_fields(covered_match)
+    for field_type, (value, mask) in match_fields(match).iteritems():
+        covered = covered_fields.get(field_type)
+        if covered is None:
+            return False
+        covered_value, covered_mask = covered
+        if covered_mask & mask != mask or covered_value & mask != value:
+            return False
+    return True
+
+
+class FlowClassifier(object):
+    """
+    Index of flows (by any key, e.g. flow hash) by table, priority and match
+    """
+
+    __slots__ = (
+        '_tables',  # table id -> priority -> signature -> trie
+        '_entries'  # key -> (table id, priority, signature, values)
+    )
+
+    def __init__(self, flows=()):
+        """
+        :param flows: iterable of (key, flow) tuples to start with
+        """
+        self._tables = {}
+        self._entries = {}
+        for key, flow in flows:
+            self.add(key, flow)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, flow):
+        """Add a flow (ofp_flow_stats), replacing the one with the same key"""
+        if key in self._entries:
+            self.remove(key)
+        fields = sorted(match_fields(flow.match).iteritems())
+        signature = tuple((field_type, mask)
+                          for field_type, (_, mask) in fields)
+        values = tuple(value for _, (value, _) in fields)
+        self._entries[key] = (flow.table_id, flow.priority, signature, values)
+
+        tries = self._tables.setdefault(flow.table_id, {}).setdefault(
+            flow.priority, {})
+        if signature not in tries:
+            tries[signature] = set() if not values else {}
+        node = tries[signature]
+        for i, value in enumerate(values):
+            last = i == len(values) - 1
+            node = node.setdefault(value, set() if last else {})
+        node.add(key)
+
+    def remove(self, key):
+        """Remove the flow with given key"""
+        table_id, priority, signature, values = self._entries.pop(key)
+        priorities = self._tables[table_id]
+        tries = priorities[priority]
+        path = [tries[signature]]
+        for value in values:
+            path.append(path[-1][value])
+        path[-1].discard(key)
+
+        # prune the branches left empty
+        for i in xrange(len(values), 0, -1):
+            if path[i]:
+                return
+            del path[i - 1][values[i - 1]]
+        if not path[0]:
+            del tries[signature]
+            if not tries:
+                del priorities[priority]
+                if not priorities:
+                    del self._tables[table_id]
+
+    def find_overlapping(self, table_id, priority, match,
+                         return_on_first=False):
+        """
+        Return the keys of the flows of given table and priority which may
+        match the same packets as the given match (ofp_match)
+        """
+        fields = match_fields(match)
+        keys = []
+        tries = self._tables.get(table_id, {}).get(priority, {})
+        for signature, trie in tries.iteritems():
+            constraints = []
+            for field_type, mask in signature:
+                field = fields.get(field_type)
+                if field is None:
+                    constraints.append(None)
+                else:
+                    value, query_mask = field
+                    constraints.append((value, mask & query_mask, mask))
+            self._search(trie, constraints, keys, return_on_first)
+            if keys and return_on_first:
+                break
+        return keys
+
+    def find_covered(self, table_id, match):
+        """
+        Return the keys of the flows matching only packets which also match
+        the given match (ofp_match), see match_covers, in given table or in
+        all tables if table_id is OFPTT_ALL
+        """
+        fields = match_fields(match)
+        if table_id == ofp.OFPTT_ALL:
+            tables = self._tables.values()
+        else:
+            tables = [self._tables.get(table_id, {})]
+
+        keys = []
+        for priorities in tables:
+            for tries in priorities.itervalues():
+                for signature, trie in tries.iteritems():
+                    # flows have to be at least as specific as the query
+                    masks = dict(signature)
+                    if not all(field_type in masks and
+                               masks[field_type] & query_mask == query_mask
+                               for field_type, (_, query_mask)
+                               in fields.iteritems()):
+                        continue
+                    constraints = []
+                    for field_type, mask in signature:
+                        field = fields.get(field_type)
+                        if field is None:
+                            constraints.append(None)
+                        else:
+                            value, query_mask = field
+                            constraints.append((value, query_mask, mask))
+                    self._search(trie, constraints, keys)
+        return keys
+
+    @staticmethod
+    def _search(trie, constraints, keys, return_on_first=False):
+        """
+        Add keys of the flows in the trie whose value of each field (level)
+        equals the value of the constraint under the mask of the constraint
+        (value, mask, mask of the level), if any, to the list of keys
+        """
+        nodes = [trie]
+        for constraint in constraints:
+            next_nodes = []
+            if constraint is None:
+                for node in nodes:
+                    next_nodes.extend(node.itervalues())
+            else:
+                value, mask, level_mask = constraint
+                value &= mask
+                if mask == level_mask:
+                    for node in nodes:
+                        child = node.get(value)
+                        if child is not None:
+                            next_nodes.append(child)
+                else:
+                    for node in nodes:
+                        next_nodes.extend(
+                            child for child_value, child in node.iteritems()
+                            if child_value & mask == value)
+            nodes = next_nodes
+            if not nodes:
+                return
+        for node in nodes:
+            keys.extend(node)
+            if keys and return_on_first:
+                return
@@ -18,7 +18,7 @@
 A mix-in class implementing flow decomposition
 """
 from collections import OrderedDict
-from copy import copy, deepcopy
+from copy import copy
 from hashlib import md5
 
 from voltha.protos import openflow_13_pb2 as ofp
@@ -393,8 +393,161 @@ class RouteHop(object):
             self._egress_port == other._egress_port)
 
 
+class DecomposedFlowTable(object):
+    """
+    Per-device flows and flow groups decomposed from the flow table of a
+    logical device. For every logical flow, the ids of the device flows and
+    groups it was decomposed into are kept (device rules shared by several
+    logical flows are reference counted), so that the table can be updated
+    flow by flow as the logical flow table changes.
+
+    The default rules the table starts with are shared, not copied: the
+    rules of a device are only copied when a logical flow first adds to (or
+    removes from) them.
+    """
+
+    __slots__ = (
+        '_default_rules',  # device id -> rules as passed in, never modified
+        '_device_rules',  # device id -> (OrderedDict, OrderedDict)
+        '_copied',  # ids of devices whose rules are no longer shared
+        '_flow_refs',  # (device id, flow id) -> number of logical flows
+        '_group_refs',  # (device id, group id) -> number of logical flows
+        '_logical_flows'  # flow hash -> (flow, device id -> (ids, ids))
+    )
+
+    _no_rules = (OrderedDict(), OrderedDict())
+
+    def __init__(self, default_rules):
+        """
+        :param default_rules: dict(device_id ->
+            (OrderedDict-of-device-flows, OrderedDict-of-device-flow-groups))
+        which are never removed from the table
+        """
+        self._default_rules = dict(default_rules)
+        self._device_rules = dict(default_rules)
+        self._copied = set()
+        self._flow_refs = {}
+        self._group_refs = {}
+        self._logical_flows = OrderedDict()
+
+    @property
+    def device_rules(self):
+        """
+        dict(device_id ->
+            (OrderedDict-of-device-flows, OrderedDict-of-device-flow-groups)),
+        not to be modified
+        """
+        return self._device_rules
+
+    def add_default_rules(self, default_rules):
+        """
+        Add the default rules of devices new to the table (see __init__)
+        """
+        for device_id, rules in default_rules.iteritems():
+            assert device_id not in self._device_rules
+            self._default_rules[device_id] = rules
+            self._device_rules[device_id] = rules
+
+    def diff(self, flows):
+        """
+        Compare the decomposed logical flows with given logical flow table;
+        return list of (key, flow) tuples of new or modified flows and list
+        of keys of the flows no longer in the table
+        """
+        new_flows = OrderedDict((hash_flow_stats(f), f) for f in flows)
+        added = []
+        for key, flow in new_flows.iteritems():
+            entry = self._logical_flows.get(key)
+            # the decomposition only depends on the hashed attributes and
+            # the instructions of the flow (not on its counters, etc.)
+            if entry is None or entry[0].instructions != flow.instructions:
+                added.append((key, flow))
+        removed = [key for key in self._logical_flows if key not in new_flows]
+        return added, removed
+
+    def add_flow(self, key, flow, device_rules, changed_flows, changed_groups):
+        """
+        Add (or replace) the device rules a logical flow decomposes into.
+        The ids of the devices whose flows or groups changed are added to
+        changed_flows and changed_groups, respectively.
+        """
+        refs = {}
+        for device_id, (flows, groups) in device_rules.iteritems():
+            defaults = self._default_rules.get(device_id, self._no_rules)
+            for flow_ in flows:
+                if self._acquire(self._flow_refs, device_id, flow_.id,
+                                 defaults[0]):
+                    self._own_rules(device_id)[0][flow_.id] = flow_
+                    changed_flows.add(device_id)
+            for group in groups:
+                if self._acquire(self._group_refs, device_id, group.group_id,
+                                 defaults[1]):
+                    self._own_rules(device_id)[1][group.group_id] = group
+                    changed_groups.add(device_id)
+            refs[device_id] = (
+                tuple(flow_.id for flow_ in flows),
+                tuple(group.group_id for group in groups))
+
+        # release the rules of a replaced flow only now, so that rules in
+        # common with the new decomposition are not removed and re-added
+        old_entry = self._logical_flows.pop(key, None)
+        self._logical_flows[key] = (flow, refs)
+        if old_entry is not None:
+            self._release(old_entry[1], changed_flows, changed_groups)
+
+    def remove_flow(self, key, changed_flows, changed_groups):
+        """Remove the device rules of a logical flow, see add_flow"""
+        _, refs = self._logical_flows.pop(key)
+        self._release(refs, changed_flows, changed_groups)
+
+    def _own_rules(self, device_id):
+        """Return the rules of a device, copying them first if shared"""
+        if device_id not in self._copied:
+            flows, groups = self._device_rules.get(device_id, self._no_rules)
+            self._device_rules[device_id] = (
+                OrderedDict(flows), OrderedDict(groups))
+            self._copied.add(device_id)
+        return self._device_rules[device_id]
+
+    @staticmethod
+    def _acquire(refs, device_id, id, defaults):
+        """Count a new user of a device rule; return True if it is new"""
+        count = refs.get((device_id, id), 0)
+        refs[(device_id, id)] = count + 1
+        return count == 0 and id not in defaults
+
+    def _release(self, refs, changed_flows, changed_groups):
+        for device_id, (flow_ids, group_ids) in refs.iteritems():
+            defaults = self._default_rules.get(device_id, self._no_rules)
+            for flow_id in flow_ids:
+                if self._unref(self._flow_refs, device_id, flow_id,
+                               defaults[0]):
+                    del self._own_rules(device_id)[0][flow_id]
+                    changed_flows.add(device_id)
+            for group_id in group_ids:
+                if self._unref(self._group_refs, device_id, group_id,
+                               defaults[1]):
+                    del self._own_rules(device_id)[1][group_id]
+                    changed_groups.add(device_id)
+
+    @staticmethod
+    def _unref(refs, device_id, id, defaults):
+        """Drop a user of a device rule; return True if it was the last"""
+        count = refs[(device_id, id)] - 1
+        if count:
+            refs[(device_id, id)] = count
+            return False
+        del refs[(device_id, id)]
+        return id not in defaults
+
+
 class FlowDecomposer(object):
 
+    # max number of memoized flow decompositions, see decompose_flow
+    max_cached_decompositions = 16384
+
+    _decompositions = None  # decomposition key -> device rules
+
     def __init__(self, *args, **kw):
         self.logical_device_id = 'this shall be overwritten in derived class'
         super(FlowDecomposer, self).__init__(*args, **kw)
@@ -410,24 +563,77 @@ class FlowDecomposer(object):
         :return: dict(device_id ->
             (OrderedDict-of-device-flows, OrderedDict-of-device-flow-groups))
         """
+        table = DecomposedFlowTable(self.get_all_default_rules())
+        self.update_decomposed_rules(table, flows, groups)
+        return table.device_rules
 
-        device_rules = deepcopy(self.get_all_default_rules())
-        group_map = dict((g.desc.group_id, g) for g in groups)
-
-        for flow in flows:
-            for device_id, (_flows, _groups) \
-                    in self.decompose_flow(flow, group_map).iteritems():
-                fl_lst, gr_lst = device_rules.setdefault(
-                    device_id, (OrderedDict(), OrderedDict()))
-                for _flow in _flows:
-                    if _flow.id not in fl_lst:
-                        fl_lst[_flow.id] = _flow
-                for _group in _groups:
-                    if _group.group_id not in gr_lst:
-                        gr_lst[_group.group_id] = _group
-        return device_rules
+    def update_decomposed_rules(self, table, flows, groups):
+        """
+        Update a DecomposedFlowTable to the given logical flows, decomposing
+        only the flows that were added or modified since its last update
+        :param table: DecomposedFlowTable
+        :param flows: logical device flows
+        :param groups: logical device flow groups (the same as in the
+        previous updates of table)
+        :return: set of ids of devices whose flows changed and set of ids of
+        devices whose flow groups changed
+        """
+        changed_flows = set()
+        changed_groups = set()
+        added, removed = table.diff(flows)
+        if added:
+            group_map = dict((g.desc.group_id, g) for g in groups)
+            for key, flow in added:
+                table.add_flow(key, flow, self.decompose_flow(flow, group_map),
+                               changed_flows, changed_groups)
+        for key in removed:
+            table.remove_flow(key, changed_flows, changed_groups)
+        return changed_flows, changed_groups
+
+    def invalidate_decompositions(self):
+        """
+        Drop all memoized flow decompositions; to be called whenever the
+        routes or default rules change
+        """
+        self._decompositions = None
 
     def decompose_flow(self, flow, group_map):
+        """
+        Return the per-device rules the given logical flow decomposes into,
+        as dict(device_id -> (list-of-device-flows, list-of-device-groups)).
+        Results are memoized (and shared, so must not be modified) until
+        invalidate_decompositions is called.
+        """
+        key = self._decomposition_key(flow, group_map)
+        decompositions = self._decompositions
+        if decompositions is None:
+            decompositions = self._decompositions = OrderedDict()
+        else:
+            device_rules = decompositions.get(key)
+            if device_rules is not None:
+                return device_rules
+
+        device_rules = self._decompose_flow(flow, group_map)
+        decompositions[key] = device_rules
+        if len(decompositions) > self.max_cached_decompositions:
+            decompositions.popitem(last=False)
+        return device_rules
+
+    @staticmethod
+    def _decomposition_key(flow, group_map):
+        # everything the decomposition of a flow depends on (besides routes),
+        # including the group it refers to, if any
+        group_id = get_group(flow)
+        group = None if group_id is None else group_map.get(group_id)
+        return (
+            flow.priority,
+            flow.cookie,
+            flow.match.SerializeToString(),
+            ''.join(i.SerializeToString() for i in flow.instructions),
+            None if group is None else group.SerializeToString()
+        )
+
+    def _decompose_flow(self, flow, group_map):
         assert isinstance(flow, ofp.ofp_flow_stats)
 
         ####################################################################
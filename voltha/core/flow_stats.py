@@ -0,0 +1,113 @@
+#
+# Copyright 2016 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Flow statistics counters of a (logical or physical) device, kept outside of
+the config tree: refreshing them does not create new revisions of the flow
+table. They are merged into the flows when these are read.
+"""
+
+from array import array
+
+from voltha.protos.openflow_13_pb2 import Flows
+
+
+class FlowStatsTable(object):
+    """
+    Packet and byte counters by flow id, in two arrays of unsigned 64-bit
+    integers indexed by the slot of the flow; slots of removed flows are
+    reused
+    """
+
+    __slots__ = (
+        '_slots',  # flow id -> slot
+        '_free',  # slots not in use
+        '_packet_counts',
+        '_byte_counts'
+    )
+
+    def __init__(self):
+        self._slots = {}
+        self._free = []
+        self._packet_counts = array('L')
+        self._byte_counts = array('L')
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, flow_id):
+        return flow_id in self._slots
+
+    def get(self, flow_id):
+        """Return (packet_count, byte_count) of given flow"""
+        slot = self._slots.get(flow_id)
+        if slot is None:
+            return 0, 0
+        return self._packet_counts[slot], self._byte_counts[slot]
+
+    def update(self, flow_id, packet_count, byte_count):
+        """Set the counters of given flow"""
+        slot = self._slots.get(flow_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._packet_counts)
+                self._packet_counts.append(0)
+                self._byte_counts.append(0)
+            self._slots[flow_id] = slot
+        self._packet_counts[slot] = packet_count
+        self._byte_counts[slot] = byte_count
+
+    def update_all(self, stats):
+        """
+        Set the counters of many flows
+        :param stats: iterable of (flow id, packet_count, byte_count) tuples
+        """
+        for flow_id, packet_count, byte_count in stats:
+            self.update(flow_id, packet_count, byte_count)
+
+    def remove(self, flow_id):
+        """Drop the counters of given flow (if any), e.g., to reset them"""
+        slot = self._slots.pop(flow_id, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def retain(self, flow_ids):
+        """Drop the counters of all flows but the given ones"""
+        flow_ids = set(flow_ids)
+        for flow_id in [f for f in self._slots if f not in flow_ids]:
+            self.remove(flow_id)
+
+    def merge(self, flows):
+        """
+        Return the flows (Flows) with their counters set from this table;
+        flows are copied only if there are counters to set, as they are
+        likely shared with the config tree
+        """
+        if not self._slots:
+            return flows
+        merged = Flows()
+        merged.CopyFrom(flows)
+        slots = self._slots
+        packet_counts = self._packet_counts
+        byte_counts = self._byte_counts
+        for flow in merged.items:
+            slot = slots.get(flow.id)
+            if slot is not None:
+                flow.packet_count = packet_counts[slot]
+                flow.byte_count = byte_counts[slot]
+        return merged
@@ -22,7 +22,7 @@ from voltha.core.config.config_root import ConfigRoot
 from voltha.protos.voltha_pb2 import \
     add_VolthaGlobalServiceServicer_to_server, VolthaLocalServiceStub, \
     VolthaGlobalServiceServicer, Voltha, VolthaInstances, VolthaInstance, \
-    LogicalDevice, Ports, Flows, FlowGroups, Device
+    LogicalDevice, Ports, Flows, FlowGroups, Device, FlowModErrors
 from voltha.registry import registry
 from google.protobuf.empty_pb2 import Empty
 
@@ -178,6 +178,27 @@ class GlobalHandler(VolthaGlobalServiceServicer):
             request,
             context)
 
+    @twisted_async
+    def UpdateLogicalDeviceFlowTableBatch(self, request, context):
+        log.info('grpc-request', request=request)
+
+        try:
+            instance_id = self.dispatcher.instance_id_by_logical_device_id(
+                request.id
+            )
+        except KeyError:
+            context.set_details(
+                'Logical device \'{}\' not found'.format(request.id))
+            context.set_code(StatusCode.NOT_FOUND)
+            return FlowModErrors()
+
+        return self.dispatcher.dispatch(
+            instance_id,
+            VolthaLocalServiceStub,
+            'UpdateLogicalDeviceFlowTableBatch',
+            request,
+            context)
+
     @twisted_async
     def ListLogicalDeviceFlowGroups(self, request, context):
         log.info('grpc-request', request=request)
@@ -20,7 +20,7 @@ from grpc import StatusCode
 from common.utils.grpc_utils import twisted_async
 from voltha.core.config.config_root import ConfigRoot
 from voltha.protos.openflow_13_pb2 import PacketIn, Flows, FlowGroups, \
-    ofp_port_status
+    ofp_port_status, ofp_flow_mod_failed_code, FlowModError, FlowModErrors
 
 from google.protobuf.empty_pb2 import Empty
 
@@ -36,15 +36,19 @@ log = structlog.get_logger()
 
 class LocalHandler(VolthaLocalServiceServicer):
 
-    def __init__(self, core, **init_kw):
+    def __init__(self, core, kv_store=None, persistence=None, **init_kw):
         self.core = core
+        self.kv_store = kv_store
+        self.persistence = persistence
         self.init_kw = init_kw
         self.root = None
         self.stopped = False
 
     def start(self):
         log.debug('starting')
-        self.root = ConfigRoot(VolthaInstance(**self.init_kw))
+        self.root = ConfigRoot(VolthaInstance(**self.init_kw),
+                               kv_store=self.kv_store,
+                               persistence=self.persistence)
         registry('grpc_server').register(
             add_VolthaLocalServiceServicer_to_server, self)
         log.info('started')
@@ -53,6 +57,8 @@ class LocalHandler(VolthaLocalServiceServicer):
     def stop(self):
         log.debug('stopping')
         self.stopped = True
+        if self.root is not None:
+            self.root.close()
         log.info('stopped')
 
     def get_proxy(self, path, exclusive=False):
@@ -65,25 +71,24 @@ class LocalHandler(VolthaLocalServiceServicer):
     def GetVolthaInstance(self, request, context):
         log.info('grpc-request', request=request)
         depth = int(dict(context.invocation_metadata()).get('get-depth', 0))
-        res = self.root.get('/', depth=depth)
+        res = self.root.get('/', depth=depth, read_only=True)
         return res
 
     @twisted_async
     def GetHealth(self, request, context):
         log.info('grpc-request', request=request)
-        return self.root.get('/health')
+        return self.root.get('/health', read_only=True)
 
     @twisted_async
     def ListAdapters(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/adapters')
+        items = self.root.get('/adapters', read_only=True)
         return Adapters(items=items)
 
     @twisted_async
     def ListLogicalDevices(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/logical_devices')
-        return LogicalDevices(items=items)
+        return self.root.get('/logical_devices', packed=LogicalDevices)
 
     @twisted_async
     def GetLogicalDevice(self, request, context):
@@ -98,7 +103,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return LogicalDevice()
 
         try:
-            return self.root.get('/logical_devices/' + request.id, depth=depth)
+            return self.root.get('/logical_devices/' + request.id,
+                                 depth=depth, read_only=True)
         except KeyError:
             context.set_details(
                 'Logical device \'{}\' not found'.format(request.id))
@@ -116,7 +122,9 @@ class LocalHandler(VolthaLocalServiceServicer):
             return LogicalPorts()
 
         try:
-            items = self.root.get('/logical_devices/{}/ports'.format(request.id))
+            items = self.root.get(
+                '/logical_devices/{}/ports'.format(request.id),
+                read_only=True)
             return LogicalPorts(items=items)
         except KeyError:
             context.set_details(
@@ -135,14 +143,19 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Flows()
 
         try:
-            flows = self.root.get('/logical_devices/{}/flows'.format(request.id))
-            return flows
+            flows = self.root.get(
+                '/logical_devices/{}/flows'.format(request.id),
+                read_only=True)
         except KeyError:
             context.set_details(
                 'Logical device \'{}\' not found'.format(request.id))
             context.set_code(StatusCode.NOT_FOUND)
             return Flows()
 
+        # counters are kept by the agent, out of the config tree
+        agent = self.core.logical_device_agents.get(request.id)
+        return flows if agent is None else agent.flow_stats.merge(flows)
+
 
     @twisted_async
     def UpdateLogicalDeviceFlowTable(self, request, context):
@@ -156,14 +169,41 @@ class LocalHandler(VolthaLocalServiceServicer):
 
         try:
             agent = self.core.get_logical_device_agent(request.id)
-            agent.update_flow_table(request.flow_mod)
-            return Empty()
         except KeyError:
             context.set_details(
                 'Logical device \'{}\' not found'.format(request.id))
             context.set_code(StatusCode.NOT_FOUND)
             return Empty()
 
+        error = agent.update_flow_table(request.flow_mod)
+        if error is not None:
+            context.set_details('Flow mod failed with {}'.format(
+                ofp_flow_mod_failed_code.Name(error)))
+            context.set_code(StatusCode.FAILED_PRECONDITION)
+        return Empty()
+
+    @twisted_async
+    def UpdateLogicalDeviceFlowTableBatch(self, request, context):
+        log.info('grpc-request', request=request)
+
+        if '/' in request.id:
+            context.set_details(
+                'Malformed logical device id \'{}\''.format(request.id))
+            context.set_code(StatusCode.INVALID_ARGUMENT)
+            return FlowModErrors()
+
+        try:
+            agent = self.core.get_logical_device_agent(request.id)
+        except KeyError:
+            context.set_details(
+                'Logical device \'{}\' not found'.format(request.id))
+            context.set_code(StatusCode.NOT_FOUND)
+            return FlowModErrors()
+
+        errors = agent.update_flow_table_batch(request.flow_mods)
+        return FlowModErrors(items=[
+            FlowModError(index=index, code=code) for index, code in errors])
+
     @twisted_async
     def ListLogicalDeviceFlowGroups(self, request, context):
         log.info('grpc-request', request=request)
@@ -176,7 +216,8 @@ class LocalHandler(VolthaLocalServiceServicer):
 
         try:
             groups = self.root.get(
-                '/logical_devices/{}/flow_groups'.format(request.id))
+                '/logical_devices/{}/flow_groups'.format(request.id),
+                read_only=True)
             return groups
         except KeyError:
             context.set_details(
@@ -207,8 +248,7 @@ class LocalHandler(VolthaLocalServiceServicer):
     @twisted_async
     def ListDevices(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/devices')
-        return Devices(items=items)
+        return self.root.get('/devices', packed=Devices)
 
     @twisted_async
     def GetDevice(self, request, context):
@@ -223,7 +263,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Device()
 
         try:
-            return self.root.get('/devices/' + request.id, depth=depth)
+            return Device.FromString(self.root.get(
+                '/devices/' + request.id, depth=depth, serialized=True))
         except KeyError:
             context.set_details(
                 'Device \'{}\' not found'.format(request.id))
@@ -235,7 +276,8 @@ class LocalHandler(VolthaLocalServiceServicer):
         log.info('grpc-request', request=request)
 
         known_device_types = dict(
-            (dt.id, dt) for dt in self.root.get('/device_types'))
+            (dt.id, dt) for dt in self.root.get('/device_types',
+                                                read_only=True))
 
         try:
             assert isinstance(request, Device)
@@ -300,7 +342,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Ports()
 
         try:
-            items = self.root.get('/devices/{}/ports'.format(request.id))
+            items = self.root.get('/devices/{}/ports'.format(request.id),
+                                  read_only=True)
             return Ports(items=items)
         except KeyError:
             context.set_details(
@@ -320,14 +363,18 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Flows()
 
         try:
-            flows = self.root.get('/devices/{}/flows'.format(request.id))
-            return flows
+            flows = self.root.get('/devices/{}/flows'.format(request.id),
+                                  read_only=True)
         except KeyError:
             context.set_details(
                 'Device \'{}\' not found'.format(request.id))
             context.set_code(StatusCode.NOT_FOUND)
             return Flows()
 
+        # counters are kept by the agent, out of the config tree
+        agent = self.core.device_agents.get(request.id)
+        return flows if agent is None else agent.flow_stats.merge(flows)
+
 
     @twisted_async
     def ListDeviceFlowGroups(self, request, context):
@@ -340,7 +387,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return FlowGroups()
 
         try:
-            groups = self.root.get('/devices/{}/flow_groups'.format(request.id))
+            groups = self.root.get(
+                '/devices/{}/flow_groups'.format(request.id), read_only=True)
             return groups
         except KeyError:
             context.set_details(
@@ -351,7 +399,7 @@ class LocalHandler(VolthaLocalServiceServicer):
     @twisted_async
     def ListDeviceTypes(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/device_types')
+        items = self.root.get('/device_types', read_only=True)
         return DeviceTypes(items=items)
 
     @twisted_async
@@ -367,7 +415,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return DeviceType()
 
         try:
-            return self.root.get('/device_types/' + request.id, depth=depth)
+            return self.root.get('/device_types/' + request.id,
+                                 depth=depth, read_only=True)
         except KeyError:
             context.set_details(
                 'Device type \'{}\' not found'.format(request.id))
@@ -378,7 +427,7 @@ class LocalHandler(VolthaLocalServiceServicer):
     def ListDeviceGroups(self, request, context):
         log.info('grpc-request', request=request)
         # TODO is this mapped to tree or taken from coordinator?
-        items = self.root.get('/device_groups')
+        items = self.root.get('/device_groups', read_only=True)
         return DeviceGroups(items=items)
 
     @twisted_async
@@ -395,7 +444,8 @@ class LocalHandler(VolthaLocalServiceServicer):
 
         # TODO is this mapped to tree or taken from coordinator?
         try:
-            return self.root.get('/device_groups/' + request.id, depth=depth)
+            return self.root.get('/device_groups/' + request.id,
+                                 depth=depth, read_only=True)
         except KeyError:
             context.set_details(
                 'Device group \'{}\' not found'.format(request.id))
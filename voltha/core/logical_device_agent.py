@@ -25,10 +25,12 @@ from common.event_bus import EventBusClient
 from common.frameio.frameio import hexify
 from voltha.core.config.config_proxy import CallbackType
 from voltha.core.device_graph import DeviceGraph
+from voltha.core.flow_classifier import FlowClassifier, match_covers
 from voltha.core.flow_decomposer import FlowDecomposer, \
-    flow_stats_entry_from_flow_mod_message, group_entry_from_group_mod, \
-    mk_flow_stat, in_port, vlan_vid, vlan_pcp, pop_vlan, output, set_field, \
+    DecomposedFlowTable, flow_stats_entry_from_flow_mod_message, group_entry_from_group_mod, \
+    hash_flow_stats, mk_flow_stat, in_port, vlan_vid, vlan_pcp, pop_vlan, output, set_field, \
     push_vlan
+from voltha.core.flow_stats import FlowStatsTable
 from voltha.protos import third_party
 from voltha.protos import openflow_13_pb2 as ofp
 from voltha.protos.device_pb2 import Port
@@ -74,6 +76,28 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
         self._routes = None
 
+        # in-memory index of the logical flow table, keyed by flow hash (see
+        # hash_flow_stats), and the last Flows message we wrote to the model;
+        # the index is rebuilt whenever the table is changed by anyone else;
+        # the classifier indexes the same flows by table, priority and match
+        self._flow_index = None
+        self._flow_classifier = None
+        self._flows_written = None
+
+        # per-device rules decomposed from the logical flow table, updated
+        # incrementally as the flow table changes
+        self._decomposed_rules = None
+
+        # OFPFMFC_* code of the flow mod being applied, if it failed
+        self._flow_mod_error = None
+        # while a batch of flow mods is applied (see update_flow_table_batch)
+        # the errors of its flow mods, as (index, OFPFMFC_* code) tuples
+        self._flow_mod_errors = None
+        self._flows_changed = False
+
+        # flow counters, kept out of the flow table (see flow_stats)
+        self.flow_stats = FlowStatsTable()
+
     def start(self):
         self.log.debug('starting')
         self.log.info('started')
@@ -86,9 +110,9 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         self.groups_proxy.unregister_callback(
             CallbackType.POST_UPDATE, self._group_table_updated)
         self.self_proxy.unregister_callback(
-            CallbackType.POST_ADD, self._port_list_updated)
+            CallbackType.POST_ADD, self._port_added)
         self.self_proxy.unregister_callback(
-            CallbackType.POST_REMOVE, self._port_list_updated)
+            CallbackType.POST_REMOVE, self._port_removed)
         self.log.info('stopped')
 
     def announce_flows_deleted(self, flows):
@@ -100,7 +124,8 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             raise NotImplementedError("announce_flow_deleted")
 
     def signal_flow_mod_error(self, code, flow_mod):
-        pass  # TODO
+        self.log.warn('flow-mod-error', code=code, flow_mod=flow_mod)
+        self._flow_mod_error = code
 
     def signal_flow_removal(self, code, flow):
         pass  # TODO
@@ -109,6 +134,19 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         pass  # TODO
 
     def update_flow_table(self, flow_mod):
+        """
+        Apply a flow mod
+        :param flow_mod: ofp_flow_mod
+        :return: OFPFMFC_* code if the flow mod failed, None otherwise
+        """
+        self._flow_mod_error = None
+        try:
+            self._apply_flow_mod(flow_mod)
+        finally:
+            error, self._flow_mod_error = self._flow_mod_error, None
+        return error
+
+    def _apply_flow_mod(self, flow_mod):
 
         command = flow_mod.command
 
@@ -131,6 +169,34 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             self.log.warn('unhandled-flow-mod',
                           command=command, flow_mod=flow_mod)
 
+    def update_flow_table_batch(self, flow_mods):
+        """
+        Apply flow mods in order, as a single change of the flow table: the
+        table is written back (and so decomposed and pushed to the devices)
+        once, after the last flow mod.
+        :param flow_mods: iterable of ofp_flow_mod
+        :return: list of (index, OFPFMFC_* code) tuples of failed flow mods
+        """
+        errors = self._flow_mod_errors = []
+        self._flows_changed = False
+        try:
+            for i, flow_mod in enumerate(flow_mods):
+                try:
+                    error = self.update_flow_table(flow_mod)
+                except Exception, e:
+                    self.log.exception('flow-mod-failed', e=e,
+                                       flow_mod=flow_mod)
+                    error = ofp.OFPFMFC_UNKNOWN
+                if error is not None:
+                    errors.append((i, error))
+        finally:
+            self._flow_mod_errors = None
+
+        if self._flows_changed:
+            self._flows_changed = False
+            self._write_flows()
+        return errors
+
     def update_group_table(self, group_mod):
 
         command = group_mod.command
@@ -154,103 +220,94 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         assert isinstance(mod, ofp.ofp_flow_mod)
         assert mod.cookie_mask == 0
 
-        # read from model
-        flows = list(self.flows_proxy.get('/').items)
+        flows = self._get_flow_index()
 
         changed = False
         check_overlap = mod.flags & ofp.OFPFF_CHECK_OVERLAP
         if check_overlap:
-            if self.find_overlapping_flows(flows, mod, True):
+            if self.find_overlapping_flows(mod, True):
                 self.signal_flow_mod_error(
                     ofp.OFPFMFC_OVERLAP, mod)
             else:
                 # free to add as new flow
                 flow = flow_stats_entry_from_flow_mod_message(mod)
-                flows.append(flow)
+                self._index_flow(flow)
                 changed = True
                 self.log.debug('flow-added', flow=mod)
 
         else:
             flow = flow_stats_entry_from_flow_mod_message(mod)
-            idx = self.find_flow(flows, flow)
-            if idx >= 0:
-                old_flow = flows[idx]
+            old_flow = flows.get(flow.id)
+            if old_flow is not None:
                 if not (mod.flags & ofp.OFPFF_RESET_COUNTS):
                     flow.byte_count = old_flow.byte_count
                     flow.packet_count = old_flow.packet_count
-                flows[idx] = flow
+                else:
+                    self.flow_stats.remove(flow.id)
+                self._index_flow(flow)
                 changed = True
                 self.log.debug('flow-updated', flow=flow)
 
             else:
-                flows.append(flow)
+                self._index_flow(flow)
                 changed = True
                 self.log.debug('flow-added', flow=mod)
 
         # write back to model
         if changed:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flows()
 
     def flow_delete(self, mod):
         assert isinstance(mod, ofp.ofp_flow_mod)
 
-        # read from model
-        flows = list(self.flows_proxy.get('/').items)
-
-        # build a list of what to keep vs what to delete
-        to_keep = []
-        to_delete = []
-        for f in flows:
-            if self.flow_matches_spec(f, mod):
-                to_delete.append(f)
-            else:
-                to_keep.append(f)
+        flows = self._get_flow_index()
 
-        # replace flow table with keepers
-        flows = to_keep
+        # find what to delete
+        keys = self._flow_classifier.find_covered(mod.table_id, mod.match)
+        to_delete = [(key, flows[key]) for key in keys
+                     if self.flow_matches_spec(flows[key], mod)]
+        for key, _ in to_delete:
+            self._unindex_flow(key)
 
         # write back
         if to_delete:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flows()
 
         # send notifications for discarded flow as required by OpenFlow
-        self.announce_flows_deleted(to_delete)
+        self.announce_flows_deleted(f for _, f in to_delete)
 
     def flow_delete_strict(self, mod):
         assert isinstance(mod, ofp.ofp_flow_mod)
 
-        # read from model
-        flows = list(self.flows_proxy.get('/').items)
-        changed = False
+        flows = self._get_flow_index()
 
         flow = flow_stats_entry_from_flow_mod_message(mod)
-        idx = self.find_flow(flows, flow)
-        if (idx >= 0):
-            del flows[idx]
-            changed = True
+        if flow.id in flows:
+            self._unindex_flow(flow.id)
+            self._write_flows()
         else:
             # TODO need to check what to do with this case
             self.log.warn('flow-cannot-delete', flow=flow)
 
-        if changed:
-            self.flows_proxy.update('/', Flows(items=flows))
-
     def flow_modify(self, mod):
         raise NotImplementedError()
 
     def flow_modify_strict(self, mod):
         raise NotImplementedError()
 
-    def find_overlapping_flows(self, flows, mod, return_on_first=False):
+    def find_overlapping_flows(self, mod, return_on_first=False):
         """
         Return list of overlapping flow(s)
         Two flows overlap if a packet may match both and if they have the
-        same priority.
+        same priority (and table).
         :param mod: Flow request
         :param return_on_first: if True, return with the first entry
         :return:
         """
-        return []  # TODO finish implementation
+        flows = self._get_flow_index()
+        keys = self._flow_classifier.find_overlapping(
+            mod.table_id, mod.priority, mod.match, return_on_first)
+        return [flows[key] for key in keys]
 
     @classmethod
     def find_flow(cls, flows, flow):
@@ -305,17 +362,11 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         # Priority is ignored
 
         # Check match condition
-        # If the flow_mod match field is empty, that is a special case and
-        # indicates the flow entry matches
+        # The flow matches if it is the same or more specific than the match
+        # of the flow_mod (an empty match is a special case of this)
         match = flow_mod.match
         assert isinstance(match, ofp.ofp_match)
-        if not match.oxm_fields:
-            # If we got this far and the match is empty in the flow spec,
-            # than the flow matches
-            return True
-        else:
-            raise NotImplementedError(
-                "flow_matches_spec(): No flow match analysis yet")
+        return match_covers(match, flow.match)
 
     @staticmethod
     def flow_has_out_port(flow, out_port):
@@ -353,27 +404,65 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         # otherwise...
         return False
 
-    def flows_delete_by_group_id(self, flows, group_id):
+    def flows_delete_by_group_id(self, group_id):
         """
-        Delete any flow(s) referring to given group_id
+        Delete any flow(s) referring to given group_id from the flow index
         :param group_id:
-        :return: None
+        :return: True if any flow was deleted
         """
-        to_keep = []
-        to_delete = []
-        for f in flows:
-            if self.flow_has_out_group(f, group_id):
-                to_delete.append(f)
-            else:
-                to_keep.append(f)
-
-        # replace flow table with keepers
-        flows = to_keep
+        flows = self._get_flow_index()
+        to_delete = [(key, f) for key, f in flows.iteritems()
+                     if self.flow_has_out_group(f, group_id)]
+        for key, _ in to_delete:
+            self._unindex_flow(key)
 
         # send notification to deleted ones
-        self.announce_flows_deleted(to_delete)
+        self.announce_flows_deleted(f for _, f in to_delete)
+
+        return bool(to_delete)
 
-        return bool(to_delete), flows
+    def _get_flow_index(self):
+        """
+        Return the flow index (OrderedDict of flow hash -> flow, in flow
+        table order), building it from the model if needed
+        """
+        if self._flow_index is None:
+            self._flow_index = OrderedDict(
+                (hash_flow_stats(f), f)
+                for f in self.flows_proxy.get('/').items)
+            self._flow_classifier = FlowClassifier(
+                self._flow_index.iteritems())
+        return self._flow_index
+
+    def _index_flow(self, flow):
+        """Add (or replace) a flow in the flow index"""
+        self._flow_index[flow.id] = flow
+        self._flow_classifier.add(flow.id, flow)
+
+    def _unindex_flow(self, key):
+        """Remove a flow from the flow index, and its counters"""
+        del self._flow_index[key]
+        self._flow_classifier.remove(key)
+        self.flow_stats.remove(key)
+
+    def _write_flows(self):
+        """
+        Write the flow index back to the model, or at the end of the batch
+        of flow mods being applied, if any
+        """
+        if self._flow_mod_errors is not None:
+            self._flows_changed = True
+            return
+
+        flows = Flows(items=self._flow_index.itervalues())
+        self._flows_written = flows
+        try:
+            self.flows_proxy.update('/', flows)
+        except Exception:
+            # e.g., rejected by a callback; the model is left as it was
+            self._flow_index = None
+            self._flows_written = None
+            raise
 
     # ~~~~~~~~~~~~~~~~~~~~~ LOW LEVEL GROUP HANDLERS ~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -416,9 +505,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
                 pass
 
             else:
-                flows = list(self.flows_proxy.get('/').items)
-                flows_changed, flows = self.flows_delete_by_group_id(
-                    flows, group_id)
+                flows_changed = self.flows_delete_by_group_id(group_id)
                 del groups[group_id]
                 groups_changed = True
                 self.log.debug('group-deleted', group_id=group_id)
@@ -426,7 +513,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         if groups_changed:
             self.groups_proxy.update('/', FlowGroups(items=groups.values()))
         if flows_changed:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flows()
 
     def group_modify(self, group_mod):
         assert isinstance(group_mod, ofp.ofp_group_mod)
@@ -489,18 +576,18 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         self.log.debug('flow-table-updated',
                   logical_device_id=self.logical_device_id, flows=flows)
 
+        if flows is not self._flows_written:
+            # changed by someone else (e.g., the NBI), index is out of date
+            self._flow_index = None
+            self.flow_stats.retain(f.id for f in flows.items)
+
         # TODO we have to evolve this into a policy-based, event based pattern
         # This is a raw implementation of the specific use-case with certain
         # built-in assumptions, and not yet device vendor specific. The policy-
         # based refinement will be introduced that later.
 
         groups = self.groups_proxy.get('/').items
-        device_rules_map = self.decompose_rules(flows.items, groups)
-        for device_id, (flows, groups) in device_rules_map.iteritems():
-            self.root_proxy.update('/devices/{}/flows'.format(device_id),
-                                   Flows(items=flows.values()))
-            self.root_proxy.update('/devices/{}/flow_groups'.format(device_id),
-                                   FlowGroups(items=groups.values()))
+        self._update_device_rules(flows.items, groups)
 
     # ~~~~~~~~~~~~~~~~~~~~ GROUP TABLE UPDATE HANDLING ~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -509,19 +596,52 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
                   logical_device_id=self.logical_device_id,
                   flow_groups=flow_groups)
 
+        # flows may decompose differently with the new groups (only those
+        # referring to a changed group are actually decomposed again)
+        self._decomposed_rules = None
         flows = self.flows_proxy.get('/').items
-        device_flows_map = self.decompose_rules(flows, flow_groups.items)
-        for device_id, (flows, groups) in device_flows_map.iteritems():
-            self.root_proxy.update('/devices/{}/flows'.format(device_id),
-                                   Flows(items=flows.values()))
-            self.root_proxy.update('/devices/{}/flow_groups'.format(device_id),
-                                   FlowGroups(items=groups.values()))
+        self._update_device_rules(flows, flow_groups.items)
+
+    def _update_device_rules(self, flows, groups):
+        """
+        Decompose the flows added to (or modified in) the logical flow table
+        since the last update, and write the flows and groups of the devices
+        affected by the change
+        """
+        table = self._decomposed_rules
+        if table is None:
+            table = DecomposedFlowTable(self.get_all_default_rules())
+            rebuilt_devices = set(table.device_rules)  # all to be written
+        else:
+            rebuilt_devices = set()
+
+        try:
+            flow_devices, group_devices = self.update_decomposed_rules(
+                table, flows, groups)
+        except Exception:
+            # partially updated; start over with the next update
+            self._decomposed_rules = None
+            raise
+        self._decomposed_rules = table
+        self._write_device_rules(table, flow_devices | rebuilt_devices,
+                                 group_devices | rebuilt_devices)
+
+    def _write_device_rules(self, table, flow_devices, group_devices):
+        device_rules = table.device_rules
+        for device_id in flow_devices:
+            self.root_proxy.update(
+                '/devices/{}/flows'.format(device_id),
+                Flows(items=device_rules[device_id][0].values()))
+        for device_id in group_devices:
+            self.root_proxy.update(
+                '/devices/{}/flow_groups'.format(device_id),
+                FlowGroups(items=device_rules[device_id][1].values()))
 
     # ~~~~~~~~~~~~~~~~~~~ APIs NEEDED BY FLOW DECOMPOSER ~~~~~~~~~~~~~~~~~~~~~~
 
     def _port_added(self, port):
         assert isinstance(port, LogicalPort)
-        self._port_list_updated(port)
+        self._logical_port_added(port)
         self.local_handler.send_port_change_event(
             device_id=self.logical_device_id,
             port_status=ofp.ofp_port_status(
@@ -532,7 +652,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
     def _port_removed(self, port):
         assert isinstance(port, LogicalPort)
-        self._port_list_updated(port)
+        self._logical_port_removed(port)
         self.local_handler.send_port_change_event(
             device_id=self.logical_device_id,
             port_status=ofp.ofp_port_status(
@@ -552,14 +672,49 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             )
         )
 
-    def _port_list_updated(self, _):
-        # invalidate the graph and the route table
-        self._invalidate_cached_tables()
+    def _logical_port_added(self, port):
+        if self._routes is None:
+            return  # the port is picked up when the tables are built
+        if port.root_port:
+            self._invalidate_cached_tables()
+            return
+
+        # only the routes from and to the new port are added to the route
+        # table, so the flows decomposed so far remain valid
+        try:
+            device_ids = self.add_logical_port(self.root_proxy, port)
+            default_rules = self._generate_default_rules(
+                self._graph, device_ids)
+        except Exception:
+            self._invalidate_cached_tables()
+            raise
+        self._default_rules.update(default_rules)
+
+        table = self._decomposed_rules
+        if table is not None and default_rules:
+            table.add_default_rules(default_rules)
+            self._write_device_rules(table, default_rules, default_rules)
+
+    def _logical_port_removed(self, port):
+        if self._routes is None:
+            return
+        if port.root_port:
+            self._invalidate_cached_tables()
+            return
+
+        for device_id in self.remove_logical_port(port):
+            del self._default_rules[device_id]
+
+        # flows decomposed along the routes of the port are stale
+        self._decomposed_rules = None
+        self.invalidate_decompositions()
 
     def _invalidate_cached_tables(self):
         self._routes = None
         self._default_rules = None
         self._nni_logical_port_no = None
+        self._decomposed_rules = None
+        self.invalidate_decompositions()
 
     def _assure_cached_tables_up_to_date(self):
         if self._routes is None:
@@ -572,7 +727,11 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             self._nni_logical_port_no = root_ports[0].ofp_port.port_no
 
 
-    def _generate_default_rules(self, graph):
+    def _generate_default_rules(self, graph, device_ids=None):
+        """
+        Return the default rules of the given devices in the graph (of all
+        devices by default)
+        """
 
         def root_device_default_rules(device):
             ports = self.root_proxy.get('/devices/{}/ports'.format(device.id))
@@ -651,9 +810,11 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             groups = OrderedDict()
             return flows, groups
 
+        if device_ids is None:
+            device_ids = graph.nodes()
         root_device_id = self.self_proxy.get('/').root_device_id
         rules = {}
-        for node_key in graph.nodes():
+        for node_key in device_ids:
             node = graph.node[node_key]
             device = node.get('device', None)
             if device is None:
@@ -677,20 +838,19 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         # hop is filled, the first hope is None
         if ingress_port_no is None and \
                         egress_port_no == self._nni_logical_port_no:
-            # We can use the 2nd hop of any upstream route, so just find the
-            # first upstream:
-            for (ingress, egress), route in self._routes.iteritems():
-                if egress == self._nni_logical_port_no:
-                    return [None, route[1]]
-            raise Exception('not a single upstream route')
+            # We can use the 2nd hop of any upstream route
+            try:
+                return self._routes.half_route_to(egress_port_no)
+            except KeyError:
+                raise Exception('not a single upstream route')
 
         # If egress_port is not specified (None), we can also can return a
         # "half" route
         if egress_port_no is None:
-            for (ingress, egress), route in self._routes.iteritems():
-                if ingress == ingress_port_no:
-                    return [route[0], None]
-            raise Exception('not a single downstream route')
+            try:
+                return self._routes.half_route_from(ingress_port_no)
+            except KeyError:
+                raise Exception('not a single downstream route')
 
         return self._routes[(ingress_port_no, egress_port_no)]
 
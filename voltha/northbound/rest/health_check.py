@@ -18,11 +18,16 @@
 """ Rest API to check health of Voltha instance """
 
 from klein import Klein
+from simplejson import dumps
 from structlog import get_logger
 from twisted.internet import endpoints
 from twisted.internet import reactor
 from twisted.web.server import Site
 
+from common.event_bus import EventBusClient
+from voltha.core.config.config_get_cache import get_cache
+from voltha.registry import registry
+
 
 class HealthCheck(object):
 
@@ -33,7 +38,20 @@ class HealthCheck(object):
     def health_check(self, request):
         # TODO this is just a placeholder, very crude health check
         self.log.debug("health-check-received")
-        return '{"status": "ok"}'
+        request.setHeader('Content-Type', 'application/json')
+        return dumps(dict(
+            status='ok',
+            config_get_cache=get_cache.stats(),
+            config_persistence=self.config_persistence_stats(),
+            event_bus_queues=EventBusClient().queue_metrics()
+        ))
+
+    @staticmethod
+    def config_persistence_stats():
+        core = registry.components.get('core')
+        if core is None or core.get_local_handler().root is None:
+            return {}
+        return core.get_local_handler().root.persistence_stats()
 
     def get_site(self):
         return Site(self.app.resource())